@@ -3,6 +3,12 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn backend.asgi:application``) to
+enable the server-sent event streams in items.realtime; under WSGI those
+endpoints answer 501 and clients fall back to polling. Under ASGI the login
+and register views also await password hashing off the event loop (see
+signup/hashing.py) instead of blocking a worker thread.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -14,3 +20,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# Resume background jobs left queued or abandoned by a previous process.
+from items.tasks import start_recovery  # noqa: E402
+
+start_recovery()
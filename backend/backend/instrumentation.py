@@ -0,0 +1,239 @@
+"""Opt-in per-request instrumentation.
+
+InstrumentationMiddleware is listed in settings.MIDDLEWARE but removes itself
+(MiddlewareNotUsed) unless INSTRUMENTATION_ENABLED is set. When enabled, each
+request records:
+
+* Wall time, database query count and time, and serializer time.
+* Repeated queries: the same SQL shape run INSTRUMENTATION_DUPLICATE_THRESHOLD
+  or more times in one request, the usual sign of an N+1. Each one is logged
+  with its fingerprint.
+* Response size.
+
+The numbers go out as a ``Server-Timing`` header (shown by browser devtools)
+and are aggregated per view for ``GET /metrics``, in the Prometheus text
+format. Metrics are kept per process.
+
+With INSTRUMENTATION_PROFILE_DIR set, a sample of requests
+(INSTRUMENTATION_PROFILE_SAMPLE_RATE, default 0.01) runs under cProfile. A
+sampled request's stats are written to ``<view>-<timestamp>.prof`` only if it
+took longer than INSTRUMENTATION_SLOW_MS (default 500).
+"""
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http import Http404, HttpResponse
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = ContextVar('instrumentation_record', default=None)
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def fingerprint(sql):
+    """SQL with IN lists collapsed, so per-row lookups share one fingerprint."""
+    return re.sub(r'\((?:%s, )+%s\)', '(...)', sql)
+
+
+class RequestRecord:
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.fingerprints = Counter()
+
+    def execute(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook; counts every statement on this connection.
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_seconds += time.perf_counter() - started
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self, threshold):
+        return {sql: count for sql, count in self.fingerprints.items() if count >= threshold}
+
+
+class Metrics:
+    """Per-view counters and a request duration histogram, in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()  # (view, method, status)
+            self.counters = defaultdict(Counter)  # name -> {view: value}
+            self.buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+            self.duration_sum = Counter()
+            self.duration_count = Counter()
+
+    def observe(self, view, method, status, seconds, record, response_bytes, duplicates):
+        with self._lock:
+            self.requests[view, method, status] += 1
+            self.counters['db_queries_total'][view] += record.queries
+            self.counters['db_query_seconds_total'][view] += record.query_seconds
+            self.counters['serializer_seconds_total'][view] += record.serializer_seconds
+            self.counters['duplicate_queries_total'][view] += duplicates
+            self.counters['response_bytes_total'][view] += response_bytes
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    self.buckets[view][index] += 1
+            self.duration_sum[view] += seconds
+            self.duration_count[view] += 1
+
+    def render(self):
+        lines = ['# TYPE http_requests_total counter']
+        with self._lock:
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            lines.append('# TYPE http_request_duration_seconds histogram')
+            for view in sorted(self.duration_count):
+                for bound, count in zip(DURATION_BUCKETS, self.buckets[view]):
+                    lines.append(f'http_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {count}')
+                lines.append(f'http_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {self.duration_count[view]}')
+                lines.append(f'http_request_duration_seconds_sum{{view="{view}"}} {self.duration_sum[view]:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{view="{view}"}} {self.duration_count[view]}')
+            for name in sorted(self.counters):
+                lines.append(f'# TYPE {name} counter')
+                for view, value in sorted(self.counters[name].items()):
+                    lines.append(f'{name}{{view="{view}"}} {value:g}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+_serializing = threading.local()
+
+
+@contextmanager
+def timed_serialization():
+    record = _current.get()
+    if record is None or getattr(_serializing, 'active', False):
+        yield
+        return
+    _serializing.active = True
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record.serializer_seconds += time.perf_counter() - started
+        _serializing.active = False
+
+
+_serializer_data = serializers.BaseSerializer.data
+
+
+def _instrumented_data(self):
+    # Only the outermost .data is timed; nested serializers run inside it.
+    with timed_serialization():
+        return _serializer_data.fget(self)
+
+
+class InstrumentationMiddleware:
+    _profile_lock = threading.Lock()  # cProfile cannot profile two threads at once
+
+    def __init__(self, get_response):
+        if not setting('INSTRUMENTATION_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # BaseSerializer.data is wrapped once, here, so nothing changes unless enabled.
+        if serializers.BaseSerializer.data is _serializer_data:
+            serializers.BaseSerializer.data = property(_instrumented_data)
+
+    def __call__(self, request):
+        record = RequestRecord()
+        token = _current.set(record)
+        profiler = self.start_profiler()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(record.execute):
+                response = self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+            if profiler is not None:
+                profiler.disable()
+                self._profile_lock.release()
+            _current.reset(token)
+
+        view = view_label(request)
+        duplicates = record.duplicates(setting('INSTRUMENTATION_DUPLICATE_THRESHOLD', 3))
+        for sql, count in duplicates.items():
+            logger.warning('%s ran the same query %s times: %s', view, count, sql)
+        size = 0 if response.streaming else len(response.content)
+        metrics.observe(view, request.method, response.status_code, elapsed, record, size, len(duplicates))
+        response['Server-Timing'] = server_timing(elapsed, record)
+        if profiler is not None and elapsed * 1000 >= setting('INSTRUMENTATION_SLOW_MS', 500):
+            self.dump_profile(profiler, view)
+        return response
+
+    def start_profiler(self):
+        if not setting('INSTRUMENTATION_PROFILE_DIR', None):
+            return None
+        if random.random() >= setting('INSTRUMENTATION_PROFILE_SAMPLE_RATE', 0.01):
+            return None
+        if not self._profile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler (e.g. a debugger) is active
+            self._profile_lock.release()
+            return None
+        return profiler
+
+    def dump_profile(self, profiler, view):
+        directory = setting('INSTRUMENTATION_PROFILE_DIR', None)
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r'[^\w.-]+', '_', view).strip('_') or 'request'
+        path = os.path.join(directory, f'{name}-{time.time():.3f}.prof')
+        profiler.dump_stats(path)
+        logger.info('Wrote profile of slow request to %s', path)
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unmatched'
+
+
+def server_timing(elapsed, record):
+    return ', '.join([
+        f'db;dur={record.query_seconds * 1000:.1f};desc="{record.queries} queries"',
+        f'serialize;dur={record.serializer_seconds * 1000:.1f}',
+        f'total;dur={elapsed * 1000:.1f}',
+    ])
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; 404 unless instrumentation is enabled.
+
+    With INSTRUMENTATION_METRICS_TOKEN set, scrapers must send it as a bearer token.
+    """
+    if not setting('INSTRUMENTATION_ENABLED', False):
+        raise Http404
+    token = setting('INSTRUMENTATION_METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4')
@@ -0,0 +1,52 @@
+"""Optional read replica for catalog listings.
+
+When settings.DATABASES has a ``replica`` alias (see DB_REPLICA_PATH in
+settings), reads made inside ``replica_reads()`` go to it. Everything else
+reads from and writes to ``default``. Only the public catalog views opt in.
+Per-user lists stay on the primary, so a user sees their own writes
+immediately.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Undo an enclosing replica_reads() for reads that must see the latest writes."""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and REPLICA_ALIAS in settings.DATABASES:
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of default (e.g. shipped by Litestream), never migrated directly.
+        return db != REPLICA_ALIAS
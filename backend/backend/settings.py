@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Inactive unless INSTRUMENTATION_ENABLED; see backend/instrumentation.py.
+    'backend.instrumentation.InstrumentationMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -86,6 +89,73 @@ DATABASES = {
     }
 }
 
+# DB_PROFILE=production tunes SQLite for concurrent workers through the
+# backend.sqlite engine (see backend/sqlite/base.py):
+# - WAL, so readers don't block the writer.
+# - synchronous=NORMAL, which fsyncs at checkpoints rather than every commit
+#   and is still durable against application crashes.
+# - Memory-mapped reads.
+# - IMMEDIATE write transactions with a busy timeout, so writers queue for the
+#   lock instead of failing with "database is locked".
+# - Connections kept open for DB_CONN_MAX_AGE seconds.
+DB_PROFILE = os.environ.get('DB_PROFILE', 'development')
+
+SQLITE_PRODUCTION_OPTIONS = {
+    'timeout': 20,  # busy timeout, seconds
+    'transaction_mode': 'IMMEDIATE',
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA mmap_size=268435456;'
+        'PRAGMA temp_store=MEMORY;'
+    ),
+}
+
+if DB_PROFILE == 'production':
+    DATABASES['default'].update({
+        'ENGINE': 'backend.sqlite',
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': SQLITE_PRODUCTION_OPTIONS,
+    })
+    # A read-only copy of the database (e.g. restored by Litestream) that
+    # serves the public catalog listings; see backend/routers.py.
+    if os.environ.get('DB_REPLICA_PATH'):
+        DATABASES['replica'] = {
+            **DATABASES['default'],
+            'NAME': f"file:{os.environ['DB_REPLICA_PATH']}?mode=ro",
+            'OPTIONS': {
+                'timeout': 20,
+                'init_command': 'PRAGMA query_only=1; PRAGMA mmap_size=268435456;',
+            },
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_ROUTERS = ['backend.routers.ReadReplicaRouter']
+
+# For this many seconds after a catalog write, cache misses are filled from
+# the primary: a lagging replica would otherwise be cached under the new
+# version (see items/caching.py).
+DB_REPLICA_MAX_LAG = int(os.environ.get('DB_REPLICA_MAX_LAG', 10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# Versioned catalog response caches are only coherent across worker processes
+# with a shared backend; set REDIS_URL (or switch to FileBasedCache) when
+# running more than one worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -107,6 +177,22 @@ AUTH_PASSWORD_VALIDATORS = [
 
 AUTH_USER_MODEL = 'signup.User'
 
+# New passwords use the first hasher; all listed ones still verify, and a
+# login upgrades an old hash. PASSWORD_HASHER=argon2 (needs argon2-cffi)
+# switches new hashes to Argon2.
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+if os.environ.get('PASSWORD_HASHER') == 'argon2':
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(2))
+
+# Threads for off-loop password hashing; see signup/hashing.py.
+PASSWORD_HASHING_WORKERS = int(os.environ.get('PASSWORD_HASHING_WORKERS', 0)) or None
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -139,3 +225,19 @@ REST_FRAMEWORK = {
 CORS_ALLOW_ALL_ORIGINS = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+# Uploads are stored once per distinct content; see items/storage.py.
+STORAGES = {
+    'default': {'BACKEND': 'items.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Hand media bodies to the front server: 'x-accel-redirect' (nginx, with an
+# internal location at MEDIA_ACCEL_REDIRECT_PREFIX aliased to MEDIA_ROOT) or
+# 'x-sendfile' (Apache mod_xsendfile, lighttpd). See items/media.py.
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get('MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+
+# Per-request timing, query counts and /metrics; see backend/instrumentation.py.
+INSTRUMENTATION_ENABLED = bool(os.environ.get('INSTRUMENTATION'))
+INSTRUMENTATION_PROFILE_DIR = os.environ.get('INSTRUMENTATION_PROFILE_DIR')
+INSTRUMENTATION_METRICS_TOKEN = os.environ.get('INSTRUMENTATION_METRICS_TOKEN')
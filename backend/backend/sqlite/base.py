@@ -0,0 +1,43 @@
+"""SQLite backend with per-connection PRAGMAs and IMMEDIATE transactions.
+
+Backports two OPTIONS from Django 5.1's sqlite3 backend, with the same names,
+so this engine can be swapped for the stock one after an upgrade:
+
+* ``init_command``: SQL run on every new connection, e.g.
+  ``"PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL"``.
+* ``transaction_mode``: ``"IMMEDIATE"`` makes ``atomic()`` take the write lock
+  at BEGIN. With the default deferred BEGIN, a transaction that reads and then
+  writes tries to upgrade its lock mid-way. If another writer holds the lock,
+  SQLite fails that upgrade at once with "database is locked" instead of
+  waiting out the busy timeout.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = {'DEFERRED', 'IMMEDIATE', 'EXCLUSIVE'}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        self.init_command = params.pop('init_command', None)
+        transaction_mode = params.pop('transaction_mode', None)
+        if transaction_mode is not None and transaction_mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"settings.DATABASES[{self.alias!r}]['OPTIONS']['transaction_mode'] "
+                f"must be one of {', '.join(sorted(TRANSACTION_MODES))}."
+            )
+        self.transaction_mode = transaction_mode.upper() if transaction_mode else None
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        if self.init_command:
+            conn.executescript(self.init_command)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f'BEGIN {self.transaction_mode}')
@@ -16,29 +16,49 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from signup.views import RegisterView, CustomTokenObtainPairView, user_detail
+from signup.views import login, register, user_detail
 from rest_framework_simplejwt.views import TokenRefreshView
 from django.conf import settings
-from django.conf.urls.static import static
-from items.views import ItemListCreateView, my_items, MyItemDetailView, PublicItemDetailView, SwapListCreateView, SwapUpdateView, AvailableItemsView, SwapMessageListCreateView, SwapDeleteView, ItemDeleteView
+from backend.instrumentation import metrics_view
+from items.media import serve_media
+from items.realtime import swap_events
+from items.views import ItemListCreateView, my_items, MyItemDetailView, PublicItemDetailView, SwapListCreateView, SwapUpdateView, AvailableItemsView, SwapMessageListCreateView, SwapDeleteView, ItemDeleteView, item_facets, BulkItemImportView, export_items, export_my_items, export_swaps, item_matches, recommended_items, trade_cycles, accept_trade_cycle, decline_trade_cycle, complete_trade_cycle, PointsView, my_stats, SavedSearchListCreateView, SavedSearchDetailView, SearchNotificationListView, read_search_notifications
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/register/', RegisterView.as_view(), name='register'),
-    path('api/login/', CustomTokenObtainPairView.as_view(), name='login'),
+    path('api/register/', register, name='register'),
+    path('api/login/', login, name='login'),
     path('api/user/', user_detail, name='user-detail'),
+    path('api/me/stats/', my_stats, name='my-stats'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/items/', ItemListCreateView.as_view(), name='item-list-create'),
+    path('api/items/facets/', item_facets, name='item-facets'),
+    path('api/items/bulk/', BulkItemImportView.as_view(), name='item-bulk-import'),
+    path('api/items/export/', export_items, name='item-export'),
     path('api/my-items/', my_items, name='my-items'),
+    path('api/my-items/export/', export_my_items, name='my-item-export'),
     path('api/my-items/<int:pk>/', MyItemDetailView.as_view(), name='my-item-detail'),
+    path('api/items/<int:pk>/matches/', item_matches, name='item-matches'),
     path('api/items/<int:pk>/', PublicItemDetailView.as_view(), name='public-item-detail'),
     path('api/items/<int:pk>/', ItemDeleteView.as_view(), name='item-delete'),
     path('api/swaps/', SwapListCreateView.as_view(), name='swap-list-create'),
+    path('api/swaps/export/', export_swaps, name='swap-export'),
     path('api/swaps/<int:pk>/', SwapUpdateView.as_view(), name='swap-update'),
     path('api/swaps/<int:pk>/delete/', SwapDeleteView.as_view(), name='swap-delete'),
+    path('api/recommendations/', recommended_items, name='recommendations'),
+    path('api/points/', PointsView.as_view(), name='points'),
+    path('api/saved-searches/', SavedSearchListCreateView.as_view(), name='saved-searches'),
+    path('api/saved-searches/<int:pk>/', SavedSearchDetailView.as_view(), name='saved-search-detail'),
+    path('api/saved-searches/notifications/', SearchNotificationListView.as_view(), name='search-notifications'),
+    path('api/saved-searches/notifications/read/', read_search_notifications, name='search-notifications-read'),
+    path('api/trade-cycles/', trade_cycles, name='trade-cycles'),
+    path('api/trade-cycles/<int:pk>/accept/', accept_trade_cycle, name='trade-cycle-accept'),
+    path('api/trade-cycles/<int:pk>/decline/', decline_trade_cycle, name='trade-cycle-decline'),
+    path('api/trade-cycles/<int:pk>/complete/', complete_trade_cycle, name='trade-cycle-complete'),
     path('api/available-items/', AvailableItemsView.as_view(), name='available-items'),
     path('api/swaps/<int:swap_id>/messages/', SwapMessageListCreateView.as_view(), name='swap-messages'),
+    path('api/swaps/<int:swap_id>/events/', swap_events, name='swap-events'),
+    path('metrics', metrics_view, name='metrics'),
+    # Served in every environment; see items/media.py for caching, ranges and sendfile.
+    path(settings.MEDIA_URL.lstrip('/') + '<path:path>', serve_media, name='media'),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
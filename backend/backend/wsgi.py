@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Resume background jobs left queued or abandoned by a previous process.
+from items.tasks import start_recovery  # noqa: E402
+
+start_recovery()
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Item, ItemImage
+from .models import Item, ItemImage, Job, SavedSearch, TradeCycle
 
 admin.site.register(Item)
 admin.site.register(ItemImage)
+admin.site.register(Job)
+admin.site.register(SavedSearch)
+admin.site.register(TradeCycle)
@@ -1,6 +1,57 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_init, post_migrate, post_save, pre_delete
 
 
 class ItemsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'items'
+
+    def ready(self):
+        from .search import ensure_search_index
+        post_migrate.connect(ensure_search_index, sender=self)
+
+        from .caching import invalidate_item
+        for model in (self.get_model('Item'), self.get_model('ItemImage')):
+            post_save.connect(invalidate_item, sender=model, dispatch_uid=f'cache-{model.__name__}-save')
+            post_delete.connect(invalidate_item, sender=model, dispatch_uid=f'cache-{model.__name__}-delete')
+
+        from . import realtime
+        Swap = self.get_model('Swap')
+        post_init.connect(realtime.remember_status, sender=Swap, dispatch_uid='realtime-swap-init')
+        post_save.connect(realtime.swap_saved, sender=Swap, dispatch_uid='realtime-swap-save')
+        post_delete.connect(realtime.swap_deleted, sender=Swap, dispatch_uid='realtime-swap-delete')
+        post_save.connect(realtime.message_saved, sender=self.get_model('SwapMessage'),
+                          dispatch_uid='realtime-message-save')
+
+        from . import availability
+        post_init.connect(availability.remember_items, sender=Swap, dispatch_uid='availability-swap-init')
+        post_save.connect(availability.swap_saved, sender=Swap, dispatch_uid='availability-swap-save')
+        post_delete.connect(availability.swap_deleted, sender=Swap, dispatch_uid='availability-swap-delete')
+
+        from . import recommendations
+        Item = self.get_model('Item')
+        post_save.connect(recommendations.item_saved, sender=Item, dispatch_uid='recommendations-item-save')
+        post_delete.connect(recommendations.item_deleted, sender=Item, dispatch_uid='recommendations-item-delete')
+
+        from . import trades
+        post_save.connect(trades.swap_saved, sender=Swap, dispatch_uid='trades-swap-save')
+        pre_delete.connect(trades.swap_deleting, sender=Swap, dispatch_uid='trades-swap-delete')
+
+        from . import ledger
+        post_save.connect(ledger.swap_saved, sender=Swap, dispatch_uid='ledger-swap-save')
+
+        from django.contrib.auth import get_user_model
+        from . import stats
+        post_init.connect(stats.remember_swap, sender=Swap, dispatch_uid='stats-swap-init')
+        post_save.connect(stats.swap_saved, sender=Swap, dispatch_uid='stats-swap-save')
+        post_delete.connect(stats.swap_deleted, sender=Swap, dispatch_uid='stats-swap-delete')
+        post_save.connect(stats.item_saved, sender=Item, dispatch_uid='stats-item-save')
+        post_delete.connect(stats.item_deleted, sender=Item, dispatch_uid='stats-item-delete')
+        post_save.connect(stats.user_saved, sender=get_user_model(), dispatch_uid='stats-user-save')
+
+        from . import saved_searches
+        SavedSearch = self.get_model('SavedSearch')
+        post_save.connect(saved_searches.item_saved, sender=Item, dispatch_uid='saved-searches-item-save')
+        post_save.connect(saved_searches.search_saved, sender=SavedSearch, dispatch_uid='saved-searches-search-save')
+        post_delete.connect(saved_searches.search_deleted, sender=SavedSearch,
+                            dispatch_uid='saved-searches-search-delete')
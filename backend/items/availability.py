@@ -0,0 +1,61 @@
+"""Keeps Item.active_swap_count in step with Swap rows.
+
+Whenever a swap is created or deleted, or saved with a change to its items
+or to whether its status is active, the count is recomputed for every item
+the swap touches, including items it referenced before the save. Other saves
+(``is_read`` toggles, moves between active statuses) change no count, so
+they neither query nor invalidate the cached catalog. Each count
+comes from two index lookups, on (proposer_item, status) and
+(receiver_item, status). Recomputing rather than incrementing means a missed
+or repeated signal cannot leave a count drifting.
+"""
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+
+from .caching import CATALOG_SCOPE, invalidate, item_scope
+from . import recommendations
+from .models import Item, Swap
+
+
+def active_swaps_using(field):
+    swaps = Swap.objects.filter(**{field: models.OuterRef('pk')}, status__in=Swap.ACTIVE_STATUSES)
+    count = swaps.order_by().values(field).annotate(count=models.Count('pk')).values('count')
+    return Coalesce(models.Subquery(count), 0)
+
+
+def refresh_active_swap_counts(item_ids):
+    item_ids = {pk for pk in item_ids if pk is not None}
+    if not item_ids:
+        return
+    with transaction.atomic():
+        Item.objects.filter(pk__in=item_ids).update(
+            active_swap_count=active_swaps_using('proposer_item') + active_swaps_using('receiver_item')
+        )
+    # update() sends no post_save, so cached item JSON is invalidated here,
+    # and the match index re-reads the counts once they are committed.
+    invalidate(CATALOG_SCOPE, *(item_scope(pk) for pk in item_ids))
+    transaction.on_commit(lambda: recommendations.index.refresh(item_ids))
+
+
+def availability_state(swap):
+    # Read __dict__ so instances loaded with fields deferred don't query.
+    values = swap.__dict__
+    return values.get('proposer_item_id'), values.get('receiver_item_id'), values.get('status') in Swap.ACTIVE_STATUSES
+
+
+def remember_items(sender, instance, **kwargs):
+    """post_init receiver: keep the loaded items and activity so saves that change neither are skipped."""
+    instance._availability_state = availability_state(instance)
+
+
+def swap_saved(sender, instance, created=False, **kwargs):
+    loaded = getattr(instance, '_availability_state', None)
+    state = availability_state(instance)
+    instance._availability_state = state
+    if not created and loaded == state:
+        return
+    refresh_active_swap_counts({*state[:2], *(loaded[:2] if loaded else ())})
+
+
+def swap_deleted(sender, instance, **kwargs):
+    refresh_active_swap_counts({instance.proposer_item_id, instance.receiver_item_id})
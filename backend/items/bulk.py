@@ -0,0 +1,107 @@
+"""Manifest and archive handling for bulk item import (POST /api/items/bulk/).
+
+A manifest is either CSV with a header row or JSON lines, one item per row,
+using the same fields as POST /api/items/. Images are named per row: a JSON
+list in JSON lines, or a ``;``-separated string in the CSV ``images`` column.
+The names refer to members of the optional zip ``archive``.
+
+Each member is copied out in chunks to a spooled temporary file, which moves
+to disk past SPOOL_MAX_BYTES, and checked with Pillow there. Only one image
+is held at a time, however many rows the manifest has.
+"""
+import csv
+import io
+import json
+import posixpath
+import shutil
+import tempfile
+import zipfile
+import zlib
+
+from django.core.files import File
+
+from .images import verify_image
+
+MAX_ROWS = 1000
+MAX_IMAGE_BYTES = 20 * 1024 * 1024
+SPOOL_MAX_BYTES = 1024 * 1024
+CSV_IMAGE_SEPARATOR = ';'
+
+
+class ManifestError(ValueError):
+    pass
+
+
+def parse_manifest(upload):
+    try:
+        text = upload.read().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise ManifestError('Manifest must be UTF-8 encoded.')
+
+    if upload.name.lower().endswith('.csv'):
+        rows = []
+        for row in csv.DictReader(io.StringIO(text)):
+            images = row.pop('images', '') or ''
+            row['images'] = [name.strip() for name in images.split(CSV_IMAGE_SEPARATOR) if name.strip()]
+            rows.append(row)
+    else:
+        rows = []
+        for number, line in enumerate(text.splitlines(), 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                raise ManifestError(f'Line {number} is not valid JSON.')
+            if not isinstance(row, dict):
+                raise ManifestError(f'Line {number} must be a JSON object.')
+            rows.append(row)
+
+    if not rows:
+        raise ManifestError('Manifest has no rows.')
+    if len(rows) > MAX_ROWS:
+        raise ManifestError(f'Manifest has more than {MAX_ROWS} rows.')
+    return rows
+
+
+def open_archive(upload):
+    if upload is None:
+        return None
+    try:
+        return zipfile.ZipFile(upload)
+    except zipfile.BadZipFile:
+        raise ManifestError('Archive must be a zip file.')
+
+
+def read_image(archive, name):
+    """Return (filename, file) for an archive member that is a valid image, or raise ValueError.
+
+    The caller closes the file.
+    """
+    if archive is None:
+        raise ValueError(f'{name}: no archive was uploaded.')
+    try:
+        info = archive.getinfo(name)
+    except KeyError:
+        raise ValueError(f'{name}: not found in archive.')
+    if info.file_size > MAX_IMAGE_BYTES:
+        raise ValueError(f'{name}: larger than {MAX_IMAGE_BYTES // (1024 * 1024)} MB.')
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        try:
+            with archive.open(info) as member:
+                shutil.copyfileobj(member, spool)
+        except (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError, RuntimeError, OSError):
+            # Corrupt or CRC-mismatched data, unsupported compression, encryption.
+            raise ValueError(f'{name}: cannot be read from the archive.')
+        spool.seek(0)
+        try:
+            verify_image(spool)
+        except ValueError:
+            raise ValueError(f'{name}: not a valid image.')
+    except ValueError:
+        spool.close()
+        raise
+    # Only the base name is kept, so member paths cannot escape MEDIA_ROOT.
+    filename = posixpath.basename(name)
+    return filename, File(spool, name=filename)
@@ -0,0 +1,110 @@
+"""Response cache for the public catalog endpoints.
+
+Cached entries are keyed on a version token as well as on the request, and
+writes bump the version instead of hunting down keys:
+
+* ``catalog`` covers every listing and is bumped by any Item/ItemImage write.
+* ``item:<pk>`` covers one item's detail page and is bumped only by writes to
+  that item or its images.
+
+The ETag is derived from the same version token and the request key, so a
+client revalidating with If-None-Match gets a 304 after one cache read,
+without touching the database or the serializers.
+
+Catalog reads may go to a read replica (see backend.routers). For
+DB_REPLICA_MAX_LAG seconds after a bump, entries are filled from the primary
+instead, so a replica that has not caught up with the write cannot be cached
+under the new version.
+"""
+import hashlib
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from backend.routers import primary_reads
+
+RESPONSE_CACHE_TTL = 60  # seconds
+CATALOG_SCOPE = 'catalog'
+
+
+def item_scope(pk):
+    return f'item:{pk}'
+
+
+def get_version(scope):
+    version = cache.get(f'version:{scope}')
+    if version is None:
+        version = uuid.uuid4().hex
+        # add() so two concurrent misses agree on the same token.
+        if not cache.add(f'version:{scope}', version, None):
+            version = cache.get(f'version:{scope}', version)
+    return version
+
+
+def bump_version(scope):
+    # A fresh token rather than incr(): an evicted counter could otherwise
+    # restart at a value whose ETags clients still hold.
+    cache.set(f'version:{scope}', uuid.uuid4().hex, None)
+    cache.set(f'written:{scope}', True, settings.DB_REPLICA_MAX_LAG)
+
+
+@contextmanager
+def fill_reads(scope):
+    """Send reads that fill a ``scope`` entry to the primary just after a bump."""
+    if cache.get(f'written:{scope}'):
+        with primary_reads():
+            yield
+    else:
+        yield
+
+
+def invalidate(*scopes):
+    for scope in scopes:
+        bump_version(scope)
+    # Bump again once the write is visible, so a reader that rebuilt an entry
+    # from pre-commit data in between cannot keep it.
+    transaction.on_commit(lambda: [bump_version(scope) for scope in scopes])
+
+
+def invalidate_item(sender, instance, **kwargs):
+    """post_save/post_delete receiver for Item and ItemImage."""
+    pk = instance.item_id if hasattr(instance, 'item_id') else instance.pk
+    invalidate(CATALOG_SCOPE, item_scope(pk))
+
+
+def cached_response(request, scope, params, render):
+    """Serve ``render()`` through the response cache.
+
+    ``params`` is the normalized, hashable form of everything besides the
+    scope's version that the response depends on. Only 200 responses are
+    stored.
+    """
+    version = get_version(scope)
+    digest = hashlib.sha1(
+        repr((scope, version, request.build_absolute_uri('/'), params)).encode()
+    ).hexdigest()
+    etag = quote_etag(digest)
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+    client_etags = {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))}
+    if etag in client_etags or '*' in client_etags:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    key = f'response:{digest}'
+    data = cache.get(key)
+    if data is not None:
+        return Response(data, headers=headers)
+
+    with fill_reads(scope):
+        response = render()
+    if response.status_code == status.HTTP_200_OK:
+        cache.set(key, response.data, RESPONSE_CACHE_TTL)
+        for name, value in headers.items():
+            response[name] = value
+    return response
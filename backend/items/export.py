@@ -0,0 +1,89 @@
+"""Streaming NDJSON exports of item and swap lists.
+
+GET /api/items/export/, /api/my-items/export/ and /api/swaps/export/ answer
+with one JSON object per line (application/x-ndjson) instead of a list. The
+queryset is read with .iterator(chunk_size=...), so only one chunk of rows,
+with its prefetched images, is held at a time: each chunk is serialized and
+sent before the next is fetched, and peak memory does not grow with the
+size of the export.
+
+Under ASGI the chunks are fetched through sync_to_async, one call per chunk.
+Django would otherwise read a synchronous iterator to the end before sending
+anything.
+"""
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models.fields.files import FieldFile
+from django.http import StreamingHttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+
+EXPORT_CHUNK_SIZE = 500
+MAX_CHUNK_SIZE = 2000
+
+
+def chunk_size(request):
+    try:
+        size = int(request.GET.get('chunk_size', EXPORT_CHUNK_SIZE))
+    except (TypeError, ValueError):
+        size = EXPORT_CHUNK_SIZE
+    return max(1, min(size, MAX_CHUNK_SIZE))
+
+
+def release(obj, seen=None):
+    """Break the reference cycles of a serialized row so refcounting frees it.
+
+    Prefetched rows point back at their parent, and FieldFile values at their
+    instance. Left alone, every row waits for a full garbage collection, which
+    after a large request may not come for a long time, and memory grows with
+    the export after all.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return
+    seen.add(id(obj))
+    for name, value in list(obj.__dict__.items()):
+        if isinstance(value, FieldFile):
+            del obj.__dict__[name]
+    for queryset in obj.__dict__.pop('_prefetched_objects_cache', {}).values():
+        for related in queryset._result_cache or ():
+            release(related, seen)
+    for related in obj._state.fields_cache.values():
+        if related is not None:
+            release(related, seen)
+    obj._state.fields_cache.clear()
+
+
+def ndjson_chunks(queryset, serializer, size):
+    """Yield the queryset as NDJSON, one bytes block per chunk of rows."""
+    # The child serializer of a many=True list: one instance shares its context
+    # (and the resolved media base URL) across every row.
+    encode = JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    lines = []
+    for obj in queryset.iterator(chunk_size=size):
+        lines.append(encode(serializer.to_representation(obj)))
+        release(obj)
+        if len(lines) == size:
+            yield ('\n'.join(lines) + '\n').encode()
+            lines = []
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
+
+
+async def aiter_chunks(chunks):
+    # thread_sensitive keeps every fetch on the thread, and so the database
+    # connection, that ran the view.
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
+
+
+def export_response(request, queryset, serializer_class, filename):
+    """StreamingHttpResponse with ``queryset`` serialized row by row."""
+    django_request = getattr(request, '_request', request)
+    serializer = serializer_class(context={'request': request})
+    chunks = ndjson_chunks(queryset, serializer, chunk_size(django_request))
+    if isinstance(django_request, ASGIRequest):
+        chunks = aiter_chunks(chunks)
+    response = StreamingHttpResponse(chunks, content_type='application/x-ndjson')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
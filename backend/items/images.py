@@ -0,0 +1,106 @@
+"""Resized JPEG and WebP variants of uploaded item photos.
+
+Variants are stored next to the original under ``item_photos/variants/`` and
+recorded on the row (``Item.photo_variants``, ``ItemImage.variants``) as
+``{size: {format: storage name}}``. Until a row has been processed, the
+serializer simply exposes no variants and clients use the original.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .media import unreferenced, variant_names
+
+# Longest edge in pixels for each named size.
+VARIANT_SIZES = {
+    'thumb': 320,
+    'medium': 800,
+}
+VARIANT_FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+VARIANT_DIR = 'variants'
+# What uploads may be; items.media serves only image types inline.
+UPLOAD_FORMATS = {'JPEG', 'MPO', 'PNG', 'GIF', 'WEBP'}
+
+
+def variant_name(original_name, size, extension):
+    directory, filename = os.path.split(original_name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, VARIANT_DIR, f'{stem}_{size}.{extension}')
+
+
+def verify_image(fh):
+    """Raise ValueError unless ``fh`` holds an image in one of UPLOAD_FORMATS."""
+    try:
+        with Image.open(fh) as image:
+            image_format = image.format
+            image.verify()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError):
+        raise ValueError('not a valid image')
+    finally:
+        fh.seek(0)
+    if image_format not in UPLOAD_FORMATS:
+        raise ValueError(f'{image_format} images are not accepted')
+
+
+def generate_variants(field_file):
+    """Write every size/format variant of ``field_file``; return their storage names.
+
+    Returns an empty dict if the file is missing or is not a readable image.
+    """
+    storage = field_file.storage
+    try:
+        with storage.open(field_file.name, 'rb') as fh:
+            source = Image.open(fh)
+            source.load()
+    except (FileNotFoundError, UnidentifiedImageError, OSError):
+        return {}
+
+    # Apply the EXIF rotation before resizing; the variants carry no EXIF.
+    source = ImageOps.exif_transpose(source)
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert('RGBA' if 'transparency' in source.info else 'RGB')
+
+    variants = {}
+    for size, edge in VARIANT_SIZES.items():
+        resized = source.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        variants[size] = {}
+        for key, (pil_format, extension, options) in VARIANT_FORMATS.items():
+            image = resized.convert('RGB') if pil_format == 'JPEG' else resized
+            buffer = BytesIO()
+            image.save(buffer, pil_format, **options)
+            name = variant_name(field_file.name, size, extension)
+            variants[size][key] = storage.save(name, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def refresh_variants(row, file_field, variants_field):
+    """Regenerate and save ``row``'s variants; return whether any were written.
+
+    Storage is content-addressed, so new variants get new names rather than
+    overwriting the old ones. Old names no row uses any more are deleted.
+    """
+    field_file = getattr(row, file_field)
+    previous = variant_names(getattr(row, variants_field))
+    variants = generate_variants(field_file)
+    if not variants:
+        return False
+    setattr(row, variants_field, variants)
+    row.save(update_fields=[variants_field])
+    stale = set(previous) - set(variant_names(variants))
+    for name in unreferenced(stale):
+        field_file.storage.delete(name)
+    return True
+
+
+def process_item_images(item):
+    """Generate variants for an item's photo and all of its images."""
+    if item.photo:
+        refresh_variants(item, 'photo', 'photo_variants')
+    for image in item.images.all():
+        refresh_variants(image, 'image', 'variants')
@@ -0,0 +1,139 @@
+"""Points ledger: append-only PointsTransaction rows and a materialized balance per user.
+
+Every change to a balance is a PointsTransaction row plus, in the same
+transaction, one conditional UPDATE of the user's PointsAccount::
+
+    UPDATE ... SET balance = balance + <amount> WHERE user_id = <id> [AND balance >= -<amount>]
+
+The sum is computed by the database (an F() expression), so concurrent
+postings cannot lose each other's updates. A debit that would overdraw matches
+no row and raises InsufficientPoints, with no window between reading the
+balance and writing it. Accounts are updated in user id order, so postings
+that touch several users take their row locks in one order and cannot
+deadlock. A balance is therefore always the sum of its user's transactions,
+and reading it is a primary-key lookup.
+
+Settlement: when a swap reaches ``completed``, each party is credited the
+points of the item they gave away. A ring trade (see items.trades) is settled
+when the ring is completed: each leg credits only its proposer, because the
+receiver's item changes hands in their own leg. Settlement entries carry
+their swap, and a unique
+(swap, user) constraint makes settlement idempotent. A swap completed twice,
+by concurrent requests or by ``manage.py settle_points`` catching up, is
+credited once.
+
+Spending: transfer() moves points between users as a debit and a credit
+posted together, and fails with InsufficientPoints if the sender cannot cover
+it. It is how points are redeemed for an item (credited to its owner).
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+
+from .models import Item, PointsAccount, PointsTransaction, Swap
+
+
+class InsufficientPoints(Exception):
+    """A debit would take a balance below zero; nothing was written."""
+
+
+def balance(user):
+    return PointsAccount.objects.filter(pk=user.pk).values_list('balance', flat=True).first() or 0
+
+
+def apply(user_id, amount):
+    accounts = PointsAccount.objects.filter(pk=user_id)
+    if amount < 0:
+        accounts = accounts.filter(balance__gte=-amount)
+    change = {'balance': models.F('balance') + amount, 'updated_at': timezone.now()}
+    if accounts.update(**change):
+        return
+    if amount < 0:
+        raise InsufficientPoints(user_id)
+    # First posting for this user.
+    PointsAccount.objects.bulk_create([PointsAccount(user_id=user_id)], ignore_conflicts=True)
+    PointsAccount.objects.filter(pk=user_id).update(**change)
+
+
+def post(entries):
+    """Append unsaved PointsTransaction ``entries`` and apply them to balances, atomically.
+
+    Raises InsufficientPoints, and writes nothing, if a debit would overdraw.
+    """
+    totals = defaultdict(int)
+    for entry in entries:
+        totals[entry.user_id] += entry.amount
+    with transaction.atomic():
+        PointsTransaction.objects.bulk_create(entries)
+        for user_id in sorted(totals):
+            if totals[user_id]:
+                apply(user_id, totals[user_id])
+
+
+def transfer(sender, recipient, amount, item=None):
+    """Move ``amount`` points from ``sender`` to ``recipient``; raises InsufficientPoints if it would overdraw."""
+    if amount <= 0:
+        raise ValueError('Transfers move a positive number of points.')
+    if sender.pk == recipient.pk:
+        raise ValueError('Cannot transfer points to the same user.')
+    post([
+        PointsTransaction(user=sender, amount=-amount, kind='transfer', item=item),
+        PointsTransaction(user=recipient, amount=amount, kind='transfer', item=item),
+    ])
+
+
+def settlement_entries(swaps):
+    points = dict(Item.objects.filter(
+        pk__in={pk for swap in swaps for pk in (swap.proposer_item_id, swap.receiver_item_id)}
+    ).values_list('pk', 'points'))
+    entries = []
+    for swap in swaps:
+        parties = [(swap.proposer_id, swap.proposer_item_id)]
+        if swap.trade_cycle_id is None:
+            parties.append((swap.receiver_id, swap.receiver_item_id))
+        entries += [
+            PointsTransaction(user_id=user_id, amount=points.get(item_id, 0), kind='swap', swap=swap, item_id=item_id)
+            for user_id, item_id in parties
+        ]
+    return entries
+
+
+def settle(swaps):
+    """Credit the completed ``swaps`` that are not settled yet, in one transaction; returns how many were."""
+    swaps = [swap for swap in swaps if swap.status == 'completed']
+    settled = set(PointsTransaction.objects.filter(kind='swap', swap__in=swaps).values_list('swap_id', flat=True))
+    swaps = [swap for swap in swaps if swap.pk not in settled]
+    if not swaps:
+        return 0
+    try:
+        post(settlement_entries(swaps))
+    except IntegrityError:
+        # Some swap was settled concurrently since the check above.
+        if len(swaps) == 1:
+            return 0
+        return sum(settle([swap]) for swap in swaps)
+    return len(swaps)
+
+
+def settle_cycle(cycle):
+    """Credit every giver in a completed ring, in one transaction; False if it was already settled."""
+    swaps = list(Swap.objects.filter(trade_cycle=cycle))
+    if PointsTransaction.objects.filter(kind='swap', swap__in=swaps).exists():
+        return False
+    try:
+        post(settlement_entries(swaps))
+    except IntegrityError:
+        return False  # settled concurrently since the check above
+    return True
+
+
+def unsettled_swaps():
+    settled = PointsTransaction.objects.filter(kind='swap', swap=models.OuterRef('pk'))
+    return Swap.objects.filter(status='completed').exclude(models.Exists(settled))
+
+
+def swap_saved(sender, instance, **kwargs):
+    """Swap post_save receiver: settle on completion. ``manage.py settle_points`` catches up on any missed."""
+    if instance.status == 'completed':
+        settle([instance])
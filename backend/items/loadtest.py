@@ -0,0 +1,289 @@
+"""Synthetic dataset and in-process load generator for ``manage.py bench_api``.
+
+Each scenario sends one request through django.test.Client, so the full
+middleware, view and serializer stack runs against a real database without
+an HTTP server in between. Worker threads hold their own database
+connection, as in a threaded WSGI server. Queries per request are counted on
+that connection.
+"""
+import json
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment,
+)
+from PIL import Image
+from rest_framework_simplejwt.tokens import AccessToken
+
+from signup.models import User
+from .availability import refresh_active_swap_counts
+from .models import Item, ItemImage, Swap, SwapMessage
+from .stats import recount
+
+PASSWORD = 'bench-password'
+WORDS = ['denim', 'jacket', 'linen', 'vintage', 'wool', 'leather', 'summer', 'dress', 'sneakers', 'scarf']
+BRANDS = ['Zara', 'Uniqlo', "Levi's", 'Nike', 'COS']
+SIZES = ['XS', 'S', 'M', 'L', 'XL']
+BATCH_SIZE = 2000
+
+
+@contextmanager
+def scratch_environment(**overrides):
+    """A migrated throwaway database and MEDIA_ROOT, removed on exit.
+
+    ``overrides`` are applied with override_settings for the duration.
+    """
+    scratch = tempfile.mkdtemp(prefix='bench-')
+    if connection.vendor == 'sqlite':
+        # A file, not the default in-memory test database, so worker threads
+        # get real concurrent connections.
+        connection.settings_dict['TEST']['NAME'] = os.path.join(scratch, 'bench.sqlite3')
+    setup_test_environment(debug=False)
+    runner = DiscoverRunner(interactive=False, verbosity=0)
+    databases = runner.setup_databases()
+    try:
+        with override_settings(MEDIA_ROOT=os.path.join(scratch, 'media'), **overrides):
+            yield scratch
+    finally:
+        runner.teardown_databases(databases)
+        teardown_test_environment()
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+@dataclass
+class Scale:
+    users: int = 200
+    items: int = 5000
+    images_per_item: int = 2
+    swaps: int = 2000
+    messages: int = 20000
+
+
+@dataclass
+class Dataset:
+    users: list  # (id, email)
+    item_ids: list
+    swaps: list  # (id, proposer_id, receiver_id)
+    tokens: dict = field(default_factory=dict)
+
+    def token(self, user_id):
+        # Minted on first use; AccessToken.for_user only needs the id.
+        if user_id not in self.tokens:
+            self.tokens[user_id] = str(AccessToken.for_user(User(pk=user_id)))
+        return self.tokens[user_id]
+
+
+def jpeg_bytes(size=(640, 480)):
+    buffer = BytesIO()
+    Image.new('RGB', size, (180, 90, 60)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def bulk_create(model, objects):
+    created = []
+    for start in range(0, len(objects), BATCH_SIZE):
+        created += model.objects.bulk_create(objects[start:start + BATCH_SIZE])
+    return created
+
+
+def seed(scale, rng):
+    """Create the synthetic dataset with bulk inserts; returns a Dataset."""
+    password = make_password(PASSWORD)  # hashed once, shared by every user
+    users = bulk_create(User, [
+        User(email=f'bench{n}@example.com', username=f'bench{n}@example.com', full_name=f'Bench User {n}', password=password)
+        for n in range(scale.users)
+    ])
+    categories = [c for c, _ in Item.CATEGORY_CHOICES]
+    conditions = [c for c, _ in Item.CONDITION_CHOICES]
+    items = bulk_create(Item, [
+        Item(
+            title=f'{rng.choice(WORDS)} {rng.choice(WORDS)}',
+            description=' '.join(rng.choices(WORDS, k=10)),
+            category=rng.choice(categories),
+            brand=rng.choice(BRANDS),
+            size=rng.choice(SIZES),
+            condition=rng.choice(conditions),
+            owner=rng.choice(users),
+        )
+        for _ in range(scale.items)
+    ])
+    # Every image row points at the same stored file; only row counts matter here.
+    image_name = default_storage.save('item_photos/bench.jpg', ContentFile(jpeg_bytes()))
+    bulk_create(ItemImage, [ItemImage(item=item, image=image_name) for item in items for _ in range(scale.images_per_item)])
+
+    statuses = [s for s, _ in Swap.STATUS_CHOICES]
+    swaps = []
+    for _ in range(scale.swaps):
+        proposer_item, receiver_item = rng.sample(items, 2)
+        if proposer_item.owner_id == receiver_item.owner_id:
+            continue
+        swaps.append(Swap(
+            proposer_id=proposer_item.owner_id, receiver_id=receiver_item.owner_id,
+            proposer_item=proposer_item, receiver_item=receiver_item,
+            status=rng.choice(statuses), is_read=rng.random() < 0.5,
+        ))
+    swaps = bulk_create(Swap, swaps)
+    bulk_create(SwapMessage, [
+        SwapMessage(swap=swap, sender_id=rng.choice([swap.proposer_id, swap.receiver_id]), content=' '.join(rng.choices(WORDS, k=8)))
+        for swap in rng.choices(swaps, k=scale.messages)
+    ] if swaps else [])
+    item_ids = [item.pk for item in items]
+    for start in range(0, len(item_ids), BATCH_SIZE):
+        refresh_active_swap_counts(item_ids[start:start + BATCH_SIZE])
+    # bulk_create sends no signals; count the users as migration 0016 does.
+    user_ids = [user.pk for user in users]
+    for start in range(0, len(user_ids), BATCH_SIZE):
+        recount(user_ids[start:start + BATCH_SIZE])
+    return Dataset(
+        users=[(user.pk, user.email) for user in users],
+        item_ids=item_ids,
+        swaps=[(swap.pk, swap.proposer_id, swap.receiver_id) for swap in swaps],
+    )
+
+
+# Scenarios: (client, dataset, rng) -> response. Each sends exactly one request.
+
+def items_list(client, dataset, rng):
+    params = rng.choice([{}, {'category': rng.choice(Item.CATEGORY_CHOICES)[0]}, {'search': rng.choice(WORDS)}])
+    return client.get('/api/items/', {'page_size': 24, **params})
+
+
+def swaps_list(client, dataset, rng):
+    _, proposer_id, _ = rng.choice(dataset.swaps)
+    return client.get('/api/swaps/', {'page_size': 20}, HTTP_AUTHORIZATION=f'Bearer {dataset.token(proposer_id)}')
+
+
+def messages_list(client, dataset, rng):
+    swap_id, proposer_id, receiver_id = rng.choice(dataset.swaps)
+    user_id = rng.choice([proposer_id, receiver_id])
+    return client.get(f'/api/swaps/{swap_id}/messages/', HTTP_AUTHORIZATION=f'Bearer {dataset.token(user_id)}')
+
+
+def message_post(client, dataset, rng):
+    swap_id, proposer_id, _ = rng.choice(dataset.swaps)
+    return client.post(
+        f'/api/swaps/{swap_id}/messages/', {'content': 'Is this still available?'},
+        HTTP_AUTHORIZATION=f'Bearer {dataset.token(proposer_id)}',
+    )
+
+
+def login(client, dataset, rng):
+    _, email = rng.choice(dataset.users)
+    return client.post('/api/login/', json.dumps({'email': email, 'password': PASSWORD}), content_type='application/json')
+
+
+UPLOAD_IMAGE = jpeg_bytes()
+
+
+def item_upload(client, dataset, rng):
+    return client.post('/api/items/', {
+        'title': 'Bench upload', 'description': 'Load test', 'category': 'tops', 'condition': 'good',
+        'images': SimpleUploadedFile('upload.jpg', UPLOAD_IMAGE, content_type='image/jpeg'),
+    }, HTTP_AUTHORIZATION=f'Bearer {dataset.token(rng.choice(dataset.users)[0])}')
+
+
+SCENARIOS = {
+    'items': items_list,
+    'swaps': swaps_list,
+    'messages': messages_list,
+    'post_message': message_post,
+    'login': login,
+    'upload': item_upload,
+}
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run_scenario(scenario, dataset, requests, concurrency, seed=0):
+    """Send ``requests`` requests from ``concurrency`` threads; return the summary dict."""
+    lock = threading.Lock()
+    remaining = [requests]
+    latencies, queries, errors = [], [], [0]
+
+    def worker(number):
+        rng = random.Random(seed * 1000 + number)
+        client = Client()
+        try:
+            while True:
+                with lock:
+                    if remaining[0] == 0:
+                        return
+                    remaining[0] -= 1
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    try:
+                        failed = scenario(client, dataset, rng).status_code >= 400
+                    except Exception:
+                        # The test client re-raises view exceptions; count them
+                        # rather than losing the worker and its share of requests.
+                        failed = True
+                    elapsed = (time.perf_counter() - started) * 1000
+                with lock:
+                    latencies.append(elapsed)
+                    queries.append(len(ctx.captured_queries))
+                    if failed:
+                        errors[0] += 1
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    ordered = sorted(latencies)
+    return {
+        'requests': len(ordered),
+        'errors': errors[0],
+        'rps': round(len(ordered) / wall if wall else 0.0, 2),
+        'p50_ms': round(percentile(ordered, 0.50), 2),
+        'p95_ms': round(percentile(ordered, 0.95), 2),
+        'p99_ms': round(percentile(ordered, 0.99), 2),
+        'queries': round(statistics.mean(queries) if queries else 0.0, 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a saved baseline, as human-readable strings.
+
+    p95 latency may grow by ``tolerance`` (a fraction) before it counts;
+    any increase in queries per request or in errors counts, and so does
+    completing fewer requests than the baseline did.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['requests'] < before['requests']:
+            regressions.append(f"{name}: requests {before['requests']} -> {result['requests']}")
+        if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        if result['queries'] > before['queries'] + 0.5:
+            regressions.append(f"{name}: queries/request {before['queries']:.1f} -> {result['queries']:.1f}")
+        if result['errors'] > before['errors']:
+            regressions.append(f"{name}: errors {before['errors']} -> {result['errors']}")
+    return regressions
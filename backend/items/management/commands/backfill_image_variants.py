@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from items.images import refresh_variants
+from items.models import Item, ItemImage
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail and WebP variants for item photos that do not have them yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate variants that already exist.')
+
+    def handle(self, *args, **options):
+        photos = Item.objects.exclude(photo='').exclude(photo__isnull=True)
+        images = ItemImage.objects.all()
+        if not options['force']:
+            photos = photos.filter(photo_variants={})
+            images = images.filter(variants={})
+
+        done = failed = 0
+        for item in photos.only('pk', 'photo', 'photo_variants').iterator(chunk_size=200):
+            if refresh_variants(item, 'photo', 'photo_variants'):
+                done += 1
+            else:
+                failed += 1
+                self.stderr.write(f'Item {item.pk}: could not read {item.photo.name}')
+        for image in images.only('pk', 'image', 'variants').iterator(chunk_size=200):
+            if refresh_variants(image, 'image', 'variants'):
+                done += 1
+            else:
+                failed += 1
+                self.stderr.write(f'ItemImage {image.pk}: could not read {image.image.name}')
+        self.stdout.write(self.style.SUCCESS(f'Generated variants for {done} files ({failed} skipped).'))
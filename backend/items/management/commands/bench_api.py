@@ -0,0 +1,92 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from items import loadtest
+from items.tasks import worker
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the REST API in process against a freshly migrated scratch database: '
+        'seed a synthetic dataset, drive each scenario from concurrent threads and report '
+        'latency percentiles, throughput and queries per request.'
+    )
+
+    def add_arguments(self, parser):
+        scale = loadtest.Scale()
+        parser.add_argument('--users', type=int, default=scale.users)
+        parser.add_argument('--items', type=int, default=scale.items)
+        parser.add_argument('--images-per-item', type=int, default=scale.images_per_item)
+        parser.add_argument('--swaps', type=int, default=scale.swaps)
+        parser.add_argument('--messages', type=int, default=scale.messages)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario.')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--scenarios', default=','.join(loadtest.SCENARIOS),
+                            help=f"Comma-separated subset of: {', '.join(loadtest.SCENARIOS)}.")
+        parser.add_argument('--no-cache', action='store_true', help='Disable the response cache.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--save-baseline', metavar='PATH', help='Write the results as JSON.')
+        parser.add_argument('--compare', metavar='PATH', help='Fail on regressions against a saved baseline.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p95 growth over the baseline, as a fraction (default 0.25).')
+
+    def handle(self, *args, **options):
+        names = [name.strip() for name in options['scenarios'].split(',') if name.strip()]
+        unknown = set(names) - set(loadtest.SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as fh:
+                baseline = json.load(fh)['results']
+
+        overrides = {}
+        if options['no_cache']:
+            overrides['CACHES'] = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with loadtest.scratch_environment(**overrides):
+            results = self.run(names, options)
+            worker.shutdown()  # let queued upload jobs finish before teardown
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as fh:
+                json.dump({'options': self.recorded_options(options), 'results': results}, fh, indent=2, sort_keys=True)
+                fh.write('\n')
+            self.stdout.write(f"Saved baseline to {options['save_baseline']}")
+        if baseline is not None:
+            regressions = loadtest.compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions against baseline:\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against baseline.'))
+
+    def run(self, names, options):
+        scale = loadtest.Scale(
+            users=options['users'], items=options['items'], images_per_item=options['images_per_item'],
+            swaps=options['swaps'], messages=options['messages'],
+        )
+        started = time.perf_counter()
+        dataset = loadtest.seed(scale, random.Random(options['seed']))
+        self.stdout.write(
+            f'Seeded {scale.users} users, {scale.items} items, {len(dataset.swaps)} swaps and '
+            f'{scale.messages} messages in {time.perf_counter() - started:.1f}s'
+        )
+        self.stdout.write(
+            f"{'scenario':<14}{'reqs':>6}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}"
+        )
+        results = {}
+        for name in names:
+            result = loadtest.run_scenario(
+                loadtest.SCENARIOS[name], dataset, options['requests'], options['concurrency'], options['seed']
+            )
+            results[name] = result
+            self.stdout.write(
+                f"{name:<14}{result['requests']:>6}{result['errors']:>8}{result['rps']:>9.1f}"
+                f"{result['p50_ms']:>9.1f}{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}{result['queries']:>9.1f}"
+            )
+        return results
+
+    def recorded_options(self, options):
+        keys = ['users', 'items', 'images_per_item', 'swaps', 'messages', 'requests', 'concurrency', 'no_cache', 'seed']
+        return {key: options[key] for key in keys}
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.test import AsyncRequestFactory, RequestFactory
+from rest_framework_simplejwt.views import TokenObtainPairView
+
+from items import loadtest
+from signup.models import User
+from signup.views import CustomTokenObtainPairSerializer, login, user_detail
+
+PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare login throughput, and the latency of requests queued alongside the logins, '
+        'between the synchronous login view on a fixed worker pool (WSGI) and the async view '
+        'with hashing on the bounded pool (ASGI).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=64)
+        parser.add_argument('--probes', type=int, default=64,
+                            help='Cheap authenticated GETs sent alongside the logins.')
+        parser.add_argument('--workers', type=int, default=4, help='WSGI worker threads for the sync run.')
+        parser.add_argument('--users', type=int, default=50)
+
+    def handle(self, *args, **options):
+        with loadtest.scratch_environment():
+            encoded = make_password(PASSWORD)
+            users = User.objects.bulk_create([
+                User(email=f'login{n}@example.com', username=f'login{n}@example.com', full_name=f'User {n}', password=encoded)
+                for n in range(options['users'])
+            ])
+            probe_token = str(CustomTokenObtainPairSerializer.get_token(users[0]).access_token)
+            self.stdout.write(f"Hasher: {encoded.split('$', 1)[0]}")
+            self.stdout.write(
+                f"{'mode':<8}{'logins/s':>10}{'login p50':>11}{'login p95':>11}{'probe p50':>11}{'probe p95':>11}"
+            )
+            for mode, run in [('sync', self.run_sync), ('async', self.run_async)]:
+                logins, probes, wall = run(users, probe_token, options)
+                self.report(mode, logins, probes, wall, options['logins'])
+
+    def requests(self, users, options):
+        # Logins and probes interleaved, as they would arrive.
+        order = []
+        for n in range(max(options['logins'], options['probes'])):
+            if n < options['logins']:
+                order.append(('login', users[n % len(users)].email))
+            if n < options['probes']:
+                order.append(('probe', None))
+        return order
+
+    def run_sync(self, users, probe_token, options):
+        factory = RequestFactory()
+        # The synchronous simplejwt login view the async one replaced.
+        view = TokenObtainPairView.as_view(serializer_class=CustomTokenObtainPairSerializer)
+        timings = {'login': [], 'probe': []}
+
+        def handle(kind, email, queued):
+            if kind == 'login':
+                body = json.dumps({'email': email, 'password': PASSWORD})
+                response = view(factory.post('/api/login/', body, content_type='application/json'))
+            else:
+                response = user_detail(factory.get('/api/user/', headers={'Authorization': f'Bearer {probe_token}'}))
+            assert response.status_code == 200, (kind, response.status_code)
+            timings[kind].append((time.perf_counter() - queued) * 1000)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for kind, email in self.requests(users, options):
+                pool.submit(handle, kind, email, time.perf_counter())
+        return timings['login'], timings['probe'], time.perf_counter() - started
+
+    def run_async(self, users, probe_token, options):
+        factory = AsyncRequestFactory()
+        # Sync views under ASGI run in a thread per request.
+        probe_view = sync_to_async(user_detail, thread_sensitive=False)
+        timings = {'login': [], 'probe': []}
+
+        async def handle(kind, email):
+            queued = time.perf_counter()
+            if kind == 'login':
+                body = json.dumps({'email': email, 'password': PASSWORD})
+                response = await login(factory.post('/api/login/', body, content_type='application/json'))
+            else:
+                response = await probe_view(factory.get('/api/user/', headers={'Authorization': f'Bearer {probe_token}'}))
+            assert response.status_code == 200, (kind, response.status_code)
+            timings[kind].append((time.perf_counter() - queued) * 1000)
+
+        async def main():
+            await asyncio.gather(*(handle(kind, email) for kind, email in self.requests(users, options)))
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        return timings['login'], timings['probe'], time.perf_counter() - started
+
+    def report(self, mode, logins, probes, wall, count):
+        def p(values, fraction):
+            ordered = sorted(values)
+            return loadtest.percentile(ordered, fraction) if ordered else 0.0
+        self.stdout.write(
+            f'{mode:<8}{count / wall:>10.1f}{statistics.median(logins):>11.1f}{p(logins, 0.95):>11.1f}'
+            f'{p(probes, 0.5):>11.1f}{p(probes, 0.95):>11.1f}'
+        )
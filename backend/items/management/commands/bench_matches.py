@@ -0,0 +1,93 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from items import loadtest
+from items.models import Item
+from items.recommendations import MatchIndex
+from signup.models import User
+
+BRANDS = ['Zara', 'H&M', 'Uniqlo', "Levi's", 'Nike', 'Adidas', 'Mango', 'COS', '']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', '38', '40', '42', '']
+TAGS = ['red', 'blue', 'black', 'vintage', 'oversized', 'slim', 'cropped', 'linen', 'wool', 'leather', 'denim']
+POINTS = {'excellent': 50, 'good': 30, 'fair': 10, 'new': 60, 'like_new': 45, 'used': 5, 'vintage': 40}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark building the swap-match index and its top-k queries on a synthetic catalog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100000)
+        parser.add_argument('--owners', type=int, default=2000)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with loadtest.scratch_environment():
+            owners = self.seed(rng, options['items'], options['owners'])
+            index = MatchIndex()
+            started = time.perf_counter()
+            index.ensure_built()
+            self.stdout.write(f'Built index over {len(index.rows)} items in {time.perf_counter() - started:.2f}s')
+
+            wardrobes = {}
+            for pk, owner_id in Item.objects.values_list('pk', 'owner_id'):
+                wardrobes.setdefault(owner_id, []).append(pk)
+            item_ids = list(index.rows)
+            k = options['k']
+
+            def item_query():
+                owner = rng.choice(owners)
+                index.matches_for_item(rng.choice(item_ids), wardrobes.get(owner, []), k)
+
+            def catalog_query():
+                owner = rng.choice(owners)
+                index.matches_for_wardrobe(owner, wardrobes.get(owner, []), k)
+
+            def incremental_update():
+                pk = rng.choice(item_ids)
+                index.update(pk, {
+                    'category': 'tops', 'size': 'M', 'brand': 'COS', 'condition': 'good', 'points': 30,
+                    'tags': 'linen', 'owner_id': rng.choice(owners), 'active_swap_count': 0,
+                })
+
+            self.stdout.write(f"{'operation':<28}{'p50 ms':>9}{'p95 ms':>9}")
+            for name, operation in [
+                ('item vs own wardrobe', item_query),
+                ('wardrobe vs catalog', catalog_query),
+                ('incremental update', incremental_update),
+            ]:
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    operation()
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                self.stdout.write(f'{name:<28}{statistics.median(timings):>9.2f}{p95:>9.2f}')
+
+    def seed(self, rng, count, owner_count):
+        owners = User.objects.bulk_create([
+            User(email=f'match{n}@example.com', username=f'match{n}@example.com', full_name=f'Owner {n}')
+            for n in range(owner_count)
+        ])
+        categories = [c for c, _ in Item.CATEGORY_CHOICES]
+        started = time.perf_counter()
+        batch = []
+        for n in range(count):
+            condition = rng.choice(list(POINTS))
+            batch.append(Item(
+                title='Item', description='', category=rng.choice(categories), brand=rng.choice(BRANDS),
+                size=rng.choice(SIZES), condition=condition, points=POINTS[condition],
+                tags=','.join(rng.sample(TAGS, rng.randint(0, 3))), owner=rng.choice(owners),
+                active_swap_count=int(rng.random() < 0.1),
+            ))
+            if len(batch) == 5000 or n == count - 1:
+                Item.objects.bulk_create(batch)
+                batch = []
+        self.stdout.write(f'Seeded {count} items in {time.perf_counter() - started:.1f}s')
+        return [owner.pk for owner in owners]
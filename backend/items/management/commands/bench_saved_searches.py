@@ -0,0 +1,103 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from items import loadtest
+from items.models import Item, SavedSearch
+from items.saved_searches import ITEM_FIELDS, SavedSearchIndex, item_features, matches, notify
+from signup.models import User
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'pa', 'do', 'fi', 'gu', 'ha', 'je', 'ly']
+BRANDS = ['Zara', 'H&M', 'Uniqlo', "Levi's", 'Nike', 'Adidas', 'Mango', 'Gap']
+SIZES = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+CONDITIONS = ['excellent', 'good', 'fair']
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark matching new items against saved searches, indexed and by scanning every search.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--searches', type=int, default=100000)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--items', type=int, default=200)
+        parser.add_argument('--vocabulary', type=int, default=2000, help='Distinct words in titles and descriptions.')
+        parser.add_argument('--scan-sample', type=int, default=50, help='Items timed with the full scan.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with loadtest.scratch_environment():
+            self.seed(rng, options)
+            index = SavedSearchIndex()
+            started = time.perf_counter()
+            index.build()
+            self.stdout.write(f'Built index of {len(index.searches)} searches in {time.perf_counter() - started:.2f}s')
+
+            items = list(Item.objects.values('id', *ITEM_FIELDS))
+            features = [(values['owner_id'], item_features(values)) for values in items]
+            searches = list(index.searches.items())
+            self.stdout.write(f"{'operation':<24}{'p50 ms':>9}{'p95 ms':>9}{'matches':>9}")
+
+            def timed(name, operation, sample):
+                timings, found = [], 0
+                for owner_id, item in sample:
+                    started = time.perf_counter()
+                    found += len(operation(owner_id, item))
+                    timings.append((time.perf_counter() - started) * 1000)
+                p50, p95 = percentiles(timings)
+                self.stdout.write(f'{name:<24}{p50:>9.3f}{p95:>9.3f}{found:>9}')
+
+            sample = features[:options['scan_sample']]
+            timed('inverted index', index.match, features)
+            timed('scan, sample', lambda owner_id, item: [
+                pk for pk, (user_id, filters, _) in searches if user_id != owner_id and matches(filters, item)
+            ], sample)
+
+            started = time.perf_counter()
+            created = notify([values['id'] for values in items])
+            self.stdout.write(
+                f'notify: {created} notifications for {len(items)} items in {time.perf_counter() - started:.2f}s'
+            )
+
+    def keyword(self, rng, word):
+        # Mostly whole words, sometimes a prefix of one.
+        return word if rng.random() < 0.8 else word[:rng.randint(3, len(word))]
+
+    def seed(self, rng, options):
+        users = User.objects.bulk_create([
+            User(email=f'saver{n}@example.com', username=f'saver{n}@example.com', full_name=f'Saver {n}')
+            for n in range(options['users'])
+        ])
+        categories = [value for value, _ in Item.CATEGORY_CHOICES]
+        words = list({''.join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(options['vocabulary'])})
+        started = time.perf_counter()
+        searches = []
+        for _ in range(options['searches']):
+            # Keywords plus one or two other filters, as people save them from Browse.
+            filters = rng.sample(['category', 'size', 'condition', 'brand'], rng.randint(1, 2))
+            searches.append(SavedSearch(
+                user=rng.choice(users),
+                search=' '.join(self.keyword(rng, word) for word in rng.sample(words, rng.randint(1, 2))),
+                category=rng.choice(categories) if 'category' in filters else '',
+                size=','.join(rng.sample(SIZES, rng.randint(1, 2))) if 'size' in filters else '',
+                condition=rng.choice(CONDITIONS) if 'condition' in filters else '',
+                brand=rng.choice(BRANDS) if 'brand' in filters else '',
+            ))
+        SavedSearch.objects.bulk_create(searches, batch_size=5000)
+        Item.objects.bulk_create([
+            Item(title=' '.join(rng.sample(words, 3)), description=' '.join(rng.sample(words, 8)),
+                 category=rng.choice(categories), brand=rng.choice(BRANDS), size=rng.choice(SIZES),
+                 condition=rng.choice(CONDITIONS), owner=rng.choice(users))
+            for _ in range(options['items'])
+        ])
+        self.stdout.write(
+            f"Seeded {options['searches']} saved searches and {options['items']} items "
+            f'in {time.perf_counter() - started:.1f}s'
+        )
@@ -0,0 +1,73 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from items.models import Item
+from items.search import LikeSearchBackend, get_search_backend
+from signup.models import User
+
+ADJECTIVES = ['red', 'blue', 'black', 'vintage', 'oversized', 'slim', 'cropped', 'linen', 'wool', 'leather']
+NOUNS = ['jacket', 'dress', 'sweater', 'shirt', 'jeans', 'skirt', 'blazer', 'hoodie', 'sneakers', 'scarf']
+BRANDS = ['Zara', 'H&M', 'Uniqlo', "Levi's", 'Nike', 'Adidas', 'Mango', 'COS']
+FILLER = ['barely', 'worn', 'great', 'fit', 'soft', 'warm', 'summer', 'winter', 'classic', 'cotton', 'stitched']
+QUERIES = ['denim', 'jack', 'vintage leather', 'sw', 'red dress', 'levi', 'nonexistent']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the item search backend against the icontains scan on a synthetic catalog.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=200000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        # Everything runs in one transaction that is rolled back at the end.
+        with transaction.atomic():
+            self.seed(rng, options['items'])
+            backends = [('icontains', LikeSearchBackend()), ('indexed', get_search_backend())]
+            self.stdout.write(f"{'query':<18}{'backend':<12}{'matches':>9}{'count ms':>11}{'page ms':>10}")
+            for query in QUERIES:
+                for name, backend in backends:
+                    matches, count_ms, page_ms = self.measure(backend, query, options['repeat'])
+                    self.stdout.write(f'{query:<18}{name:<12}{matches:>9}{count_ms:>11.2f}{page_ms:>10.2f}')
+            transaction.set_rollback(True)
+
+    def seed(self, rng, count):
+        owner = User.objects.create(email='bench@example.com', username='bench@example.com', full_name='Bench')
+        categories = [c for c, _ in Item.CATEGORY_CHOICES]
+        conditions = [c for c, _ in Item.CONDITION_CHOICES]
+        started = time.perf_counter()
+        batch = []
+        for n in range(count):
+            batch.append(Item(
+                title=f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)}',
+                description=' '.join(rng.choices(FILLER + ADJECTIVES, k=12)),
+                category=rng.choice(categories),
+                brand=rng.choice(BRANDS),
+                size=rng.choice(['XS', 'S', 'M', 'L', 'XL']),
+                condition=rng.choice(conditions),
+                tags=','.join(rng.sample(ADJECTIVES, 2)),
+                owner=owner,
+            ))
+            if len(batch) == 5000 or n == count - 1:
+                Item.objects.bulk_create(batch)
+                batch = []
+        self.stdout.write(f'Seeded {count} items in {time.perf_counter() - started:.1f}s')
+
+    def measure(self, backend, query, repeat):
+        count_times, page_times = [], []
+        matches = 0
+        for _ in range(repeat):
+            queryset = backend.search(Item.objects.all(), query)
+            started = time.perf_counter()
+            matches = queryset.count()
+            count_times.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            list(queryset[:24])
+            page_times.append((time.perf_counter() - started) * 1000)
+        return matches, statistics.median(count_times), statistics.median(page_times)
@@ -0,0 +1,141 @@
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+from django.db.utils import ConnectionHandler
+
+# Shaped like a chat message post: check the swap, insert the message, mark
+# the swap unread, all in one transaction (see SwapMessageListCreateView).
+SCHEMA = [
+    'CREATE TABLE swap (id INTEGER PRIMARY KEY, is_read INTEGER NOT NULL DEFAULT 0)',
+    'CREATE TABLE message (id INTEGER PRIMARY KEY, swap_id INTEGER NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL)',
+    'CREATE INDEX message_swap_created ON message (swap_id, created_at)',
+]
+SWAPS = 100
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark concurrent SQLite writes under the default settings and the '
+        'production profile (DB_PROFILE=production), on a scratch database file.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5.0)
+
+    def handle(self, *args, **options):
+        profiles = [
+            ('default', {'ENGINE': 'django.db.backends.sqlite3'}),
+            ('production', {'ENGINE': 'backend.sqlite', 'OPTIONS': settings.SQLITE_PRODUCTION_OPTIONS}),
+        ]
+        self.stdout.write(
+            f"{'profile':<12}{'writes/s':>10}{'reads/s':>10}{'locked':>8}{'p50 ms':>9}{'p95 ms':>9}"
+        )
+        for name, database in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                database = {**database, 'NAME': os.path.join(directory, 'bench.sqlite3')}
+                result = self.run_profile(database, options)
+            self.stdout.write(
+                f"{name:<12}{result['writes']:>10.0f}{result['reads']:>10.0f}{result['locked']:>8}"
+                f"{result['p50']:>9.1f}{result['p95']:>9.1f}"
+            )
+
+    def run_profile(self, database, options):
+        # A private handler gives each thread its own connection to the scratch file.
+        handler = ConnectionHandler({'default': database})
+        setup = handler['default']
+        with setup.cursor() as cursor:
+            for statement in SCHEMA:
+                cursor.execute(statement)
+            cursor.executemany('INSERT INTO swap (id) VALUES (%s)', [(n,) for n in range(1, SWAPS + 1)])
+        setup.close()
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        totals = {'writes': 0, 'reads': 0, 'locked': 0, 'latencies': []}
+
+        def writer(seed):
+            connection = handler['default']
+            writes, locked, latencies = 0, 0, []
+            n = seed
+            while not stop.is_set():
+                n += 1
+                started = time.perf_counter()
+                try:
+                    self.post_message(connection, n % SWAPS + 1)
+                except OperationalError:
+                    locked += 1
+                    continue
+                writes += 1
+                latencies.append((time.perf_counter() - started) * 1000)
+            connection.close()
+            with lock:
+                totals['writes'] += writes
+                totals['locked'] += locked
+                totals['latencies'] += latencies
+
+        def reader(seed):
+            connection = handler['default']
+            reads = 0
+            n = seed
+            while not stop.is_set():
+                n += 1
+                try:
+                    with connection.cursor() as cursor:
+                        cursor.execute(
+                            'SELECT id, content FROM message WHERE swap_id = %s ORDER BY created_at DESC LIMIT 50',
+                            [n % SWAPS + 1],
+                        )
+                        cursor.fetchall()
+                except OperationalError:
+                    with lock:
+                        totals['locked'] += 1
+                    continue
+                reads += 1
+            connection.close()
+            with lock:
+                totals['reads'] += reads
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(options['writers'])]
+        threads += [threading.Thread(target=reader, args=(n,)) for n in range(options['readers'])]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        latencies = sorted(totals['latencies']) or [0.0]
+        return {
+            'writes': totals['writes'] / options['seconds'],
+            'reads': totals['reads'] / options['seconds'],
+            'locked': totals['locked'],
+            'p50': statistics.median(latencies),
+            'p95': latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0],
+        }
+
+    def post_message(self, connection, swap_id):
+        # The same calls transaction.atomic() makes on an outermost block.
+        connection.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT id FROM swap WHERE id = %s', [swap_id])
+                cursor.fetchone()
+                cursor.execute(
+                    'INSERT INTO message (swap_id, content, created_at) VALUES (%s, %s, %s)',
+                    [swap_id, 'Is this still available?', time.time()],
+                )
+                cursor.execute('UPDATE swap SET is_read = 0 WHERE id = %s', [swap_id])
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.set_autocommit(True)
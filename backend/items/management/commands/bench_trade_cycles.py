@@ -0,0 +1,107 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from items import loadtest
+from items.models import Item, Swap, TradeCycle
+from items.trades import TradeGraph, propose_all
+from signup.models import User
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark trade-cycle search over a synthetic graph of pending swaps.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nodes', type=int, default=50000, help='Items, i.e. graph nodes.')
+        parser.add_argument('--owners', type=int, default=10000)
+        parser.add_argument('--degree', type=float, default=2.0, help='Mean pending swaps proposed per item.')
+        parser.add_argument('--community', type=int, default=500,
+                            help='Items per interest cluster; most swaps stay inside one.')
+        parser.add_argument('--locality', type=float, default=0.9,
+                            help='Share of swaps that target an item in the same cluster.')
+        parser.add_argument('--max-length', type=int, default=4)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with loadtest.scratch_environment():
+            swap_ids = self.seed(rng, options)
+            max_length = options['max_length']
+
+            graph = TradeGraph()
+            started = time.perf_counter()
+            graph.build()
+            self.stdout.write(f'Built graph of {len(graph.edges)} edges in {time.perf_counter() - started:.2f}s')
+
+            started = time.perf_counter()
+            cycles = graph.cycles(max_length, limit=10 ** 7)
+            elapsed = time.perf_counter() - started
+            lengths = {}
+            for cycle in cycles:
+                lengths[len(cycle)] = lengths.get(len(cycle), 0) + 1
+            self.stdout.write(
+                f'Full scan: {len(cycles)} cycles of at most {max_length} in {elapsed:.2f}s '
+                f'(by length: {dict(sorted(lengths.items()))})'
+            )
+            started = time.perf_counter()
+            chosen = graph.choose(cycles)
+            self.stdout.write(f'Chose {len(chosen)} disjoint cycles in {(time.perf_counter() - started) * 1000:.0f}ms')
+
+            self.stdout.write(f"{'operation':<28}{'p50 ms':>9}{'p95 ms':>9}")
+            sample = rng.sample(swap_ids, min(options['repeat'], len(swap_ids)))
+
+            def timed(name, operation):
+                timings = []
+                for swap_id in sample:
+                    started = time.perf_counter()
+                    operation(swap_id)
+                    timings.append((time.perf_counter() - started) * 1000)
+                p50, p95 = percentiles(timings)
+                self.stdout.write(f'{name:<28}{p50:>9.3f}{p95:>9.3f}')
+
+            timed('cycles through a new swap', lambda swap_id: graph.cycles_through(swap_id, max_length))
+            timed('refresh one swap', lambda swap_id: graph.refresh([swap_id]))
+
+            started = time.perf_counter()
+            proposed = propose_all(max_length, limit=10 ** 7)
+            self.stdout.write(
+                f'propose_all: {len(proposed)} cycles proposed in {time.perf_counter() - started:.2f}s '
+                f'({TradeCycle.objects.count()} rows)'
+            )
+
+    def seed(self, rng, options):
+        nodes, community, locality = options['nodes'], options['community'], options['locality']
+        owners = User.objects.bulk_create([
+            User(email=f'trade{n}@example.com', username=f'trade{n}@example.com', full_name=f'Trader {n}')
+            for n in range(options['owners'])
+        ])
+        started = time.perf_counter()
+        items = []
+        for n in range(0, nodes, 5000):
+            items += Item.objects.bulk_create([
+                Item(title='Item', description='', category='tops', condition='good', points=30,
+                     owner=rng.choice(owners), active_swap_count=1)
+                for _ in range(n, min(n + 5000, nodes))
+            ])
+        swaps = []
+        for n, item in enumerate(items):
+            cluster = n // community * community
+            for _ in range(rng.randint(0, round(options['degree'] * 2))):
+                if rng.random() < locality:
+                    target = items[rng.randrange(cluster, min(cluster + community, nodes))]
+                else:
+                    target = rng.choice(items)
+                if target.owner_id != item.owner_id:
+                    swaps.append(Swap(proposer_id=item.owner_id, receiver_id=target.owner_id,
+                                      proposer_item=item, receiver_item=target))
+        Swap.objects.bulk_create(swaps, batch_size=5000)
+        self.stdout.write(f'Seeded {nodes} items and {len(swaps)} pending swaps in {time.perf_counter() - started:.1f}s')
+        return list(Swap.objects.values_list('pk', flat=True))
@@ -0,0 +1,97 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from items.caching import CATALOG_SCOPE, invalidate, item_scope
+from items.media import referenced_names
+from items.models import Item, ItemImage
+from items.storage import ContentAddressedStorage, content_digest, name_digest
+
+
+class Command(BaseCommand):
+    help = (
+        'Move media files to content-addressed names (see items/storage.py), so identical '
+        'uploads are stored once, and point the rows at the new names.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report what would change without changing it.')
+        parser.add_argument('--delete-orphans', action='store_true',
+                            help='Also delete files under MEDIA_ROOT that no row references.')
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        if not isinstance(storage, ContentAddressedStorage):
+            raise CommandError('The default storage is not items.storage.ContentAddressedStorage; see STORAGES.')
+        dry_run = options['dry_run']
+
+        renames, sizes, missing = {}, {}, []
+        for name in sorted(referenced_names()):
+            if name_digest(name):
+                continue
+            if not storage.exists(name):
+                missing.append(name)
+                continue
+            with storage.open(name, 'rb') as fh:
+                renames[name] = storage.hashed_name(name, content_digest(fh)) if dry_run else storage.save(name, fh)
+            sizes[renames[name]] = storage.size(name)
+        for name in missing:
+            self.stderr.write(f'Missing: {name}')
+        self.stdout.write(
+            f'{len(renames)} files hold {len(sizes)} distinct contents '
+            f'({sum(storage.size(name) for name in renames)} -> {sum(sizes.values())} bytes).'
+        )
+        if not dry_run and renames:
+            self.update_rows(renames)
+            for name in renames:
+                if name not in renames.values():
+                    storage.delete(name)
+
+        if options['delete_orphans']:
+            self.delete_orphans(storage, dry_run)
+        if dry_run:
+            self.stdout.write('Dry run: nothing was changed.')
+
+    def update_rows(self, renames):
+        def rename_variants(variants):
+            return {
+                size: {fmt: renames.get(name, name) for fmt, name in formats.items()}
+                for size, formats in (variants or {}).items()
+            }
+
+        items, images = [], []
+        for item in Item.objects.only('pk', 'photo', 'photo_variants').iterator(chunk_size=500):
+            photo, variants = renames.get(item.photo.name, item.photo.name), rename_variants(item.photo_variants)
+            if (photo, variants) != (item.photo.name, item.photo_variants):
+                item.photo, item.photo_variants = photo, variants
+                items.append(item)
+        for image in ItemImage.objects.only('pk', 'item', 'image', 'variants').iterator(chunk_size=500):
+            name, variants = renames.get(image.image.name, image.image.name), rename_variants(image.variants)
+            if (name, variants) != (image.image.name, image.variants):
+                image.image, image.variants = name, variants
+                images.append(image)
+        with transaction.atomic():
+            Item.objects.bulk_update(items, ['photo', 'photo_variants'], batch_size=500)
+            ItemImage.objects.bulk_update(images, ['image', 'variants'], batch_size=500)
+            # bulk_update sends no post_save, so invalidate cached responses here.
+            item_ids = {item.pk for item in items} | {image.item_id for image in images}
+            invalidate(CATALOG_SCOPE, *(item_scope(pk) for pk in item_ids))
+        self.stdout.write(self.style.SUCCESS(f'Updated {len(items)} items and {len(images)} images.'))
+
+    def delete_orphans(self, storage, dry_run):
+        used = referenced_names()
+        orphans, size = [], 0
+        for directory, _, files in os.walk(settings.MEDIA_ROOT):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, '/')
+                if name not in used:
+                    orphans.append(name)
+                    size += os.path.getsize(path)
+        if not dry_run:
+            for name in orphans:
+                storage.delete(name)
+        self.stdout.write(f'{len(orphans)} unreferenced files ({size} bytes){"" if dry_run else " deleted"}.')
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from items.trades import propose_all
+
+
+class Command(BaseCommand):
+    help = 'Scan every pending swap for ring trades and propose them (for cron; see items/trades.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-length', type=int, help='Most participants in a ring (TRADE_CYCLE_MAX_LENGTH).')
+        parser.add_argument('--limit', type=int, help='Most cycles to enumerate (TRADE_CYCLE_SEARCH_LIMIT).')
+
+    def handle(self, *args, **options):
+        cycles = propose_all(options['max_length'], options['limit'])
+        self.stdout.write(f'Proposed {len(cycles)} trade cycles.')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from items.stats import recount
+from signup.models import User
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-user dashboard counters from swaps and items (see items/stats.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Users recounted per transaction.')
+
+    def handle(self, *args, **options):
+        user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+        size = options['batch_size']
+        for start in range(0, len(user_ids), size):
+            recount(user_ids[start:start + size])
+        self.stdout.write(f'Recounted stats for {len(user_ids)} users.')
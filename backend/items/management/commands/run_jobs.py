@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from items.tasks import recover_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs in this process (for cron or a dedicated worker).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new jobs.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds between polls with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            count = recover_jobs(inline=True)
+            if count:
+                self.stdout.write(f'Ran {count} jobs.')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
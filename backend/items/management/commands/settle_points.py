@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from items.ledger import settle, unsettled_swaps
+
+
+class Command(BaseCommand):
+    help = 'Credit points for completed swaps that have not been settled yet (see items/ledger.py).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Swaps settled per transaction.')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            # Settled swaps drop out of the query, so each pass takes the next batch.
+            batch = list(unsettled_swaps().order_by('pk')[:options['batch_size']])
+            if not batch:
+                break
+            settled = settle(batch)
+            if not settled:
+                break
+            total += settled
+        self.stdout.write(f'Settled {total} swaps.')
@@ -0,0 +1,203 @@
+"""Serving uploaded media, and finding which stored files rows still use.
+
+``serve_media`` answers GET /media/<path> in every environment, not only with
+DEBUG:
+
+* Content-addressed names (see items.storage) never change, so they get
+  ``Cache-Control: public, max-age=31536000, immutable`` and their digest as
+  the ETag. Older names are revalidated on every use (``no-cache``) against an
+  mtime/size ETag.
+* ``If-None-Match`` and ``If-Modified-Since`` are answered with 304.
+* A single ``Range: bytes=...`` is answered with 206, honouring ``If-Range``;
+  multiple ranges get the whole file.
+* Only image types are served inline, with the Content-Type their extension
+  implies. Anything else is sent as an ``application/octet-stream``
+  attachment, and every response carries ``X-Content-Type-Options: nosniff``,
+  so an uploaded HTML or SVG file can never render same-origin. Hidden files,
+  including the storage's in-progress ``.upload-*`` temp files, are 404.
+* With MEDIA_SENDFILE set to ``x-accel-redirect`` (nginx, under
+  MEDIA_ACCEL_REDIRECT_PREFIX) or ``x-sendfile`` (Apache, lighttpd), the body
+  is left to the front server, which also handles ranges. Otherwise the file
+  is sent with FileResponse, which uses the WSGI server's sendfile support.
+"""
+import os
+import re
+from functools import reduce
+from operator import or_
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Q, TextField
+from django.db.models.functions import Cast
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .models import Item, ItemImage
+from .storage import name_digest
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, no-cache'
+RANGE_BLOCK_SIZE = 64 * 1024
+SINGLE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Served inline; every other extension is downloaded. No SVG: it can run script.
+IMAGE_CONTENT_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+}
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single byte range, or None to send the whole file."""
+    match = SINGLE_RANGE.match(header.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes.
+        if int(last) == 0:
+            raise RangeNotSatisfiable
+        return max(0, size - int(last)), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if last and int(last) < start:
+        return None  # syntactically invalid, so ignored
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        while length > 0:
+            block = fh.read(min(RANGE_BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def media_headers(path, stat):
+    digest = name_digest(path)
+    if digest:
+        etag, cache_control = f'"{digest}"', IMMUTABLE_CACHE_CONTROL
+    else:
+        etag, cache_control = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', REVALIDATE_CACHE_CONTROL
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': cache_control,
+        'Accept-Ranges': 'bytes',
+        'X-Content-Type-Options': 'nosniff',
+    }
+    content_type = IMAGE_CONTENT_TYPES.get(os.path.splitext(path)[1].lower())
+    if content_type:
+        headers['Content-Type'] = content_type
+    else:
+        headers['Content-Type'] = 'application/octet-stream'
+        headers['Content-Disposition'] = 'attachment'
+    return headers
+
+
+def range_applies(request, headers):
+    # If-Range: serve the range only if the representation is still the one
+    # the client has part of; otherwise send all of it.
+    condition = request.headers.get('If-Range')
+    if condition is None:
+        return True
+    if condition.startswith('"') or condition.startswith('W/'):
+        return condition == headers['ETag']
+    return parse_http_date_safe(condition) == parse_http_date_safe(headers['Last-Modified'])
+
+
+def serve_media(request, path):
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    if any(part.startswith('.') for part in path.split('/')):
+        raise Http404('File not found.')
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('File not found.')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found.')
+
+    headers = media_headers(path, stat)
+    response = get_conditional_response(
+        request, etag=headers['ETag'], last_modified=int(stat.st_mtime), response=HttpResponse(headers=headers),
+    )
+    if response.status_code != 200:
+        return response  # 304 or 412
+
+    sendfile = getattr(settings, 'MEDIA_SENDFILE', '')
+    if sendfile == 'x-accel-redirect':
+        response = HttpResponse(headers=headers)
+        prefix = getattr(settings, 'MEDIA_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix + quote(path)
+        return response
+    if sendfile == 'x-sendfile':
+        response = HttpResponse(headers=headers)
+        response['X-Sendfile'] = full_path
+        return response
+
+    size = stat.st_size
+    byte_range = None
+    if 'Range' in request.headers and range_applies(request, headers):
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except RangeNotSatisfiable:
+            return HttpResponse(status=416, headers={'Content-Range': f'bytes */{size}', 'Accept-Ranges': 'bytes'})
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), headers=headers)
+        # FileResponse sets Content-Type and Content-Disposition from the file name; keep ours.
+        for header, value in headers.items():
+            response[header] = value
+        return response
+    start, end = byte_range
+    response = StreamingHttpResponse(read_range(full_path, start, end - start + 1), status=206, headers=headers)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Content-Length'] = str(end - start + 1)
+    return response
+
+
+def referenced_names():
+    """Every storage name a row points at: photos, images and their variants."""
+    names = set()
+    for photo, variants in Item.objects.exclude(photo='').exclude(photo=None).values_list('photo', 'photo_variants'):
+        names.add(photo)
+        names.update(variant_names(variants))
+    for image, variants in ItemImage.objects.values_list('image', 'variants'):
+        names.add(image)
+        names.update(variant_names(variants))
+    return names
+
+
+def variant_names(variants):
+    return [name for formats in (variants or {}).values() for name in formats.values()]
+
+
+def unreferenced(names):
+    """The subset of ``names`` that no row uses, as an original or a variant, so safe to delete."""
+    used = set(Item.objects.filter(photo__in=names).values_list('photo', flat=True))
+    used.update(ItemImage.objects.filter(image__in=names).values_list('image', flat=True))
+    candidates = [name for name in names if name not in used]
+    if candidates:
+        # Variants live in JSON; match the stored text, then read the names back.
+        for model, field in ((Item, 'photo_variants'), (ItemImage, 'variants')):
+            rows = model.objects.annotate(variant_text=Cast(field, TextField())).filter(
+                reduce(or_, (Q(variant_text__contains=name) for name in candidates))
+            )
+            for variants in rows.values_list(field, flat=True):
+                used.update(variant_names(variants))
+    return [name for name in names if name not in used]
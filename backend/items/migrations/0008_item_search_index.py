@@ -0,0 +1,36 @@
+from django.db import migrations, models
+import django.db.models.deletion
+import items.models
+
+
+def install(apps, schema_editor):
+    from items.search import install_search_index
+    install_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from items.search import uninstall_search_index
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0007_item_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemSearchEntry',
+            fields=[
+                ('item', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='items.item')),
+                ('document', items.models.SearchDocumentField(db_column='items_item_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'items_item_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(install, uninstall),
+    ]
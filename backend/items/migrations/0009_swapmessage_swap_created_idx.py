@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0008_item_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='swapmessage',
+            index=models.Index(fields=['swap', 'created_at'], name='swapmessage_swap_created_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0009_swapmessage_swap_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='photo_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='itemimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
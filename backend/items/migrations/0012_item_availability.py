@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:24
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+ACTIVE_STATUSES = ['pending', 'accepted', 'meetup_pending', 'awaiting_response']
+
+
+def count_active_swaps(apps, schema_editor):
+    Item = apps.get_model('items', 'Item')
+    Swap = apps.get_model('items', 'Swap')
+
+    def active_swaps_using(field):
+        swaps = Swap.objects.filter(**{field: models.OuterRef('pk')}, status__in=ACTIVE_STATUSES)
+        count = swaps.order_by().values(field).annotate(count=models.Count('pk')).values('count')
+        return Coalesce(models.Subquery(count), 0)
+
+    Item.objects.update(active_swap_count=active_swaps_using('proposer_item') + active_swaps_using('receiver_item'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0011_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='active_swap_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['owner', 'active_swap_count'], name='item_owner_available_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='swap',
+            index=models.Index(fields=['proposer_item', 'status'], name='swap_proposer_item_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='swap',
+            index=models.Index(fields=['receiver_item', 'status'], name='swap_receiver_item_status_idx'),
+        ),
+        migrations.RunPython(count_active_swaps, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('items', '0012_item_availability'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='item',
+            name='owner',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='items', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='swap',
+            name='proposer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='proposed_swaps', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='swap',
+            name='proposer_item',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='proposer_swaps', to='items.item'),
+        ),
+        migrations.AlterField(
+            model_name='swap',
+            name='receiver',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='received_swaps', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='swap',
+            name='receiver_item',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='receiver_swaps', to='items.item'),
+        ),
+        migrations.AlterField(
+            model_name='swapmessage',
+            name='swap',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='items.swap'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(django.db.models.functions.text.Lower('category'), models.OrderBy(models.F('created_at'), descending=True), models.OrderBy(models.F('id'), descending=True), name='item_category_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(django.db.models.functions.text.Lower('brand'), models.OrderBy(models.F('created_at'), descending=True), models.OrderBy(models.F('id'), descending=True), name='item_brand_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['size', '-created_at', '-id'], name='item_size_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['condition', '-created_at', '-id'], name='item_condition_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['owner', '-created_at', '-id'], name='item_owner_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='swap',
+            index=models.Index(fields=['proposer', '-created_at'], name='swap_proposer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='swap',
+            index=models.Index(fields=['receiver', '-created_at'], name='swap_receiver_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='swap',
+            index=models.Index(fields=['receiver', 'is_read'], name='swap_receiver_unread_idx'),
+        ),
+    ]
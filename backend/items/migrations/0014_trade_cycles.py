@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0013_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TradeCycle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('proposed', 'Proposed'), ('accepted', 'Accepted'), ('declined', 'Declined'), ('expired', 'Expired')], default='proposed', max_length=20)),
+                ('signature', models.CharField(db_index=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TradeCycleLeg',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('accepted', models.BooleanField(default=False)),
+                ('open', models.BooleanField(default=True)),
+                ('cycle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='legs', to='items.tradecycle')),
+                ('swap', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trade_cycle_legs', to='items.swap')),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='tradecycleleg',
+            constraint=models.UniqueConstraint(condition=models.Q(('open', True)), fields=('swap',), name='tradecycleleg_open_swap_uniq'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('signup', '0001_initial'),
+        ('items', '0014_trade_cycles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PointsAccount',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='points_account', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('balance', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PointsTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField()),
+                ('kind', models.CharField(choices=[('swap', 'Swap settlement'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('item', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='items.item')),
+                ('swap', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='points_transactions', to='items.swap')),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='points_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='pointsaccount',
+            constraint=models.CheckConstraint(check=models.Q(('balance__gte', 0)), name='pointsaccount_balance_gte_0'),
+        ),
+        migrations.AddIndex(
+            model_name='pointstransaction',
+            index=models.Index(fields=['user', '-created_at'], name='pointstx_user_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pointstransaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('kind', 'swap')), fields=('swap', 'user'), name='pointstx_swap_user_uniq'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Statuses as items.stats.STATUS_COUNTERS counts them.
+STATUS_COUNTERS = {
+    'pending': 'pending_swaps',
+    'accepted': 'accepted_swaps',
+    'meetup_pending': 'accepted_swaps',
+    'awaiting_response': 'accepted_swaps',
+    'completed': 'completed_swaps',
+}
+
+
+def backfill(apps, schema_editor):
+    """Count every existing user's row, so reads never have to create one."""
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Swap = apps.get_model('items', 'Swap')
+    Item = apps.get_model('items', 'Item')
+    UserStats = apps.get_model('items', 'UserStats')
+    rows = {user_id: UserStats(user_id=user_id) for user_id in User.objects.values_list('pk', flat=True)}
+    for party in ('proposer', 'receiver'):
+        for user_id, status, n in Swap.objects.values_list(party, 'status').annotate(n=models.Count('pk')).order_by():
+            if status in STATUS_COUNTERS:
+                row = rows[user_id]
+                setattr(row, STATUS_COUNTERS[status], getattr(row, STATUS_COUNTERS[status]) + n)
+    unread = Swap.objects.filter(is_read=False).values_list('receiver').annotate(n=models.Count('pk')).order_by()
+    for user_id, n in unread:
+        rows[user_id].unread_swaps = n
+    for user_id, n in Item.objects.values_list('owner').annotate(n=models.Count('pk')).order_by():
+        rows[user_id].listed_items = n
+    UserStats.objects.bulk_create(rows.values(), batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('signup', '0001_initial'),
+        ('items', '0015_points_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread_swaps', models.IntegerField(default=0)),
+                ('pending_swaps', models.IntegerField(default=0)),
+                ('accepted_swaps', models.IntegerField(default=0)),
+                ('completed_swaps', models.IntegerField(default=0)),
+                ('listed_items', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
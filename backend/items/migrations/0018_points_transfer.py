@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 10:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0017_saved_searches'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pointstransaction',
+            name='kind',
+            field=models.CharField(choices=[('swap', 'Swap settlement'), ('transfer', 'Transfer'), ('adjustment', 'Adjustment')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def link_accepted_rings(apps, schema_editor):
+    """Move the still-accepted leg swaps of accepted rings to 'in_cycle', as trades.accept now does."""
+    Swap = apps.get_model('items', 'Swap')
+    TradeCycleLeg = apps.get_model('items', 'TradeCycleLeg')
+    UserStats = apps.get_model('items', 'UserStats')
+    legs = TradeCycleLeg.objects.filter(cycle__status='accepted', swap__status='accepted')
+    for swap_id, cycle_id in legs.values_list('swap_id', 'cycle_id'):
+        swap = Swap.objects.get(pk=swap_id)
+        Swap.objects.filter(pk=swap_id).update(status='in_cycle', trade_cycle_id=cycle_id)
+        # 'in_cycle' is not counted as accepted; see items.stats.
+        UserStats.objects.filter(pk__in=[swap.proposer_id, swap.receiver_id]).update(
+            accepted_swaps=models.F('accepted_swaps') - 1
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('items', '0018_points_transfer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='swap',
+            name='trade_cycle',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='swaps', to='items.tradecycle'),
+        ),
+        migrations.AlterField(
+            model_name='swap',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('declined', 'Declined'), ('completed', 'Completed'), ('cancelled', 'Cancelled'), ('meetup_pending', 'Pending Meetup'), ('awaiting_response', 'Awaiting Response'), ('in_cycle', 'In Trade Cycle')], default='pending', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='tradecycle',
+            name='status',
+            field=models.CharField(choices=[('proposed', 'Proposed'), ('accepted', 'Accepted'), ('completed', 'Completed'), ('declined', 'Declined'), ('expired', 'Expired')], default='proposed', max_length=20),
+        ),
+        migrations.RunPython(link_accepted_rings, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Lower
 
 # Create your models here.
 
@@ -24,6 +26,12 @@ class Item(models.Model):
         ('used', 'Used'),
         ('vintage', 'Vintage'),
     ]
+    MEDIA_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
     title = models.CharField(max_length=255)
     description = models.TextField()
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES)
@@ -33,11 +41,32 @@ class Item(models.Model):
     condition = models.CharField(max_length=20, choices=CONDITION_CHOICES)
     tags = models.CharField(max_length=255, blank=True)
     photo = models.ImageField(upload_to='item_photos/', blank=True, null=True)
-    owner = models.ForeignKey('signup.User', on_delete=models.CASCADE, related_name='items')
+    photo_variants = models.JSONField(default=dict, blank=True)  # see items.images
+    # Indexed by the (owner, ...) composites in Meta.indexes.
+    owner = models.ForeignKey('signup.User', on_delete=models.CASCADE, related_name='items', db_index=False)
     status = models.CharField(max_length=20, default='pending')
     points = models.IntegerField(default=0)
+    media_status = models.CharField(max_length=20, choices=MEDIA_STATUS_CHOICES, default='ready')
+    # Swaps in Swap.ACTIVE_STATUSES that use this item; maintained by items.availability.
+    active_swap_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Backs keyset pagination on (created_at, id), newest first.
+            models.Index(fields=['-created_at', '-id'], name='item_created_id_idx'),
+            # Browse filters, each ending in the keyset order so a filtered page
+            # is an index range scan instead of a walk of item_created_id_idx.
+            # Category and brand are matched case-insensitively on Lower().
+            models.Index(Lower('category'), F('created_at').desc(), F('id').desc(), name='item_category_created_idx'),
+            models.Index(Lower('brand'), F('created_at').desc(), F('id').desc(), name='item_brand_created_idx'),
+            models.Index(fields=['size', '-created_at', '-id'], name='item_size_created_idx'),
+            models.Index(fields=['condition', '-created_at', '-id'], name='item_condition_created_idx'),
+            # my_items (newest first) and AvailableItemsView.
+            models.Index(fields=['owner', '-created_at', '-id'], name='item_owner_created_idx'),
+            models.Index(fields=['owner', 'active_swap_count'], name='item_owner_available_idx'),
+        ]
+
     def __str__(self):
         return f"{self.id}: {self.title}"
 
@@ -51,31 +80,247 @@ class Swap(models.Model):
         ('cancelled', 'Cancelled'),
         ('meetup_pending', 'Pending Meetup'),
         ('awaiting_response', 'Awaiting Response'),
+        ('in_cycle', 'In Trade Cycle'),
     ]
-    proposer = models.ForeignKey('signup.User', on_delete=models.CASCADE, related_name='proposed_swaps')
-    receiver = models.ForeignKey('signup.User', on_delete=models.CASCADE, related_name='received_swaps')
-    proposer_item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='proposer_swaps')
-    receiver_item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='receiver_swaps')
+    # Statuses that keep both items out of other swaps.
+    ACTIVE_STATUSES = ['pending', 'accepted', 'meetup_pending', 'awaiting_response', 'in_cycle']
+    # Agreed-on statuses: a swap in one of them can be completed.
+    ACCEPTED_STATUSES = ['accepted', 'meetup_pending', 'awaiting_response']
+    # Foreign keys are indexed by the composites in Meta.indexes.
+    proposer = models.ForeignKey('signup.User', on_delete=models.CASCADE, related_name='proposed_swaps', db_index=False)
+    receiver = models.ForeignKey('signup.User', on_delete=models.CASCADE, related_name='received_swaps', db_index=False)
+    proposer_item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='proposer_swaps', db_index=False)
+    receiver_item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='receiver_swaps', db_index=False)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Set, with status 'in_cycle', once the ring this swap is a leg of is
+    # accepted: the items move around the ring, not between this pair.
+    trade_cycle = models.ForeignKey('TradeCycle', on_delete=models.SET_NULL, null=True, blank=True, related_name='swaps')
     is_read = models.BooleanField(default=False)  # For receiver notifications
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # SwapListCreateView: (proposer OR receiver) newest first, plus the
+            # receiver's unread count.
+            models.Index(fields=['proposer', '-created_at'], name='swap_proposer_created_idx'),
+            models.Index(fields=['receiver', '-created_at'], name='swap_receiver_created_idx'),
+            models.Index(fields=['receiver', 'is_read'], name='swap_receiver_unread_idx'),
+            models.Index(fields=['proposer_item', 'status'], name='swap_proposer_item_status_idx'),
+            models.Index(fields=['receiver_item', 'status'], name='swap_receiver_item_status_idx'),
+        ]
+
     def __str__(self):
         return f"Swap: {self.proposer_item} <-> {self.receiver_item} ({self.status})"
 
+class TradeCycle(models.Model):
+    """A ring of pending swaps proposed as one trade; see items.trades."""
+    STATUS_CHOICES = [
+        ('proposed', 'Proposed'),
+        ('accepted', 'Accepted'),
+        ('completed', 'Completed'),
+        ('declined', 'Declined'),
+        ('expired', 'Expired'),
+    ]
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='proposed')
+    # Sorted, comma-separated swap ids, so a declined ring is not proposed again.
+    signature = models.CharField(max_length=255, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Trade cycle {self.id} ({self.status})"
+
+class TradeCycleLeg(models.Model):
+    """One participant of a ring: ``swap.proposer`` gives ``swap.proposer_item`` and gets ``swap.receiver_item``."""
+    cycle = models.ForeignKey(TradeCycle, on_delete=models.CASCADE, related_name='legs')
+    swap = models.ForeignKey(Swap, on_delete=models.CASCADE, related_name='trade_cycle_legs')
+    position = models.PositiveSmallIntegerField()
+    accepted = models.BooleanField(default=False)
+    # True while the cycle is proposed; a swap is in at most one open cycle.
+    open = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['swap'], condition=models.Q(open=True), name='tradecycleleg_open_swap_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Leg {self.position} of trade cycle {self.cycle_id}"
+
+class PointsAccount(models.Model):
+    """A user's points balance, materialized from PointsTransaction rows by items.ledger."""
+    user = models.OneToOneField('signup.User', on_delete=models.CASCADE, primary_key=True, related_name='points_account')
+    balance = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(check=models.Q(balance__gte=0), name='pointsaccount_balance_gte_0'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.balance} points"
+
+class PointsTransaction(models.Model):
+    """An append-only points ledger entry; see items.ledger."""
+    KIND_CHOICES = [
+        ('swap', 'Swap settlement'),
+        ('transfer', 'Transfer'),
+        ('adjustment', 'Adjustment'),
+    ]
+    # Indexed by pointstx_user_created_idx.
+    user = models.ForeignKey('signup.User', on_delete=models.CASCADE, related_name='points_transactions', db_index=False)
+    amount = models.IntegerField()
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # The history outlives the swap and item it records.
+    swap = models.ForeignKey(Swap, on_delete=models.SET_NULL, null=True, blank=True, related_name='points_transactions')
+    item = models.ForeignKey(Item, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='pointstx_user_created_idx'),
+        ]
+        constraints = [
+            # A swap is settled at most once per party, however many times it is completed.
+            models.UniqueConstraint(fields=['swap', 'user'], condition=models.Q(kind='swap'), name='pointstx_swap_user_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.amount:+d} ({self.kind})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Points transactions are append-only.')
+        super().save(*args, **kwargs)
+
+class UserStats(models.Model):
+    """Per-user dashboard counters, kept current by items.stats."""
+    user = models.OneToOneField('signup.User', on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    # Swaps received and not yet read, in any status.
+    unread_swaps = models.IntegerField(default=0)
+    # Swaps the user proposed or received, by status; accepted_swaps covers
+    # accepted, meetup_pending and awaiting_response.
+    pending_swaps = models.IntegerField(default=0)
+    accepted_swaps = models.IntegerField(default=0)
+    completed_swaps = models.IntegerField(default=0)
+    listed_items = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"Stats for {self.user_id}"
+
+class SavedSearch(models.Model):
+    """A set of browse filters whose new matches are notified; see items.saved_searches.
+
+    The fields take the same values as the browse_items query parameters.
+    """
+    user = models.ForeignKey('signup.User', on_delete=models.CASCADE, related_name='saved_searches')
+    name = models.CharField(max_length=100, blank=True)
+    search = models.CharField(max_length=255, blank=True)
+    category = models.CharField(max_length=50, blank=True)
+    size = models.CharField(max_length=255, blank=True)  # comma-separated, any of
+    condition = models.CharField(max_length=255, blank=True)  # comma-separated, any of
+    brand = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Saved search {self.id} of {self.user_id}"
+
+class SearchNotification(models.Model):
+    """A new item that matched a saved search."""
+    # Indexed by searchnotif_user_created_idx.
+    user = models.ForeignKey('signup.User', on_delete=models.CASCADE, related_name='search_notifications', db_index=False)
+    saved_search = models.ForeignKey(SavedSearch, on_delete=models.CASCADE, related_name='notifications')
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='+')
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='searchnotif_user_created_idx'),
+        ]
+        constraints = [
+            # A retried matching job notifies each search of an item once.
+            models.UniqueConstraint(fields=['saved_search', 'item'], name='searchnotif_search_item_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Item {self.item_id} for saved search {self.saved_search_id}"
+
 class SwapMessage(models.Model):
-    swap = models.ForeignKey(Swap, on_delete=models.CASCADE, related_name='messages')
+    # Indexed by swapmessage_swap_created_idx.
+    swap = models.ForeignKey(Swap, on_delete=models.CASCADE, related_name='messages', db_index=False)
     sender = models.ForeignKey('signup.User', on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['swap', 'created_at'], name='swapmessage_swap_created_idx'),
+        ]
+
     def __str__(self):
         return f"Message from {self.sender} in Swap {self.swap.id}"
 
 class ItemImage(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='item_photos/')
+    variants = models.JSONField(default=dict, blank=True)  # see items.images
 
     def __str__(self):
         return f"Image for {self.item.title} ({self.id})"
+
+
+class Job(models.Model):
+    """A unit of background work, run by the in-process queue in items.tasks."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id}: {self.task} ({self.status})"
+
+
+class SearchDocumentField(models.TextField):
+    """The FTS5 hidden column named after its table; supports ``__match``."""
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class ItemSearchEntry(models.Model):
+    """Row of the SQLite FTS5 index over Item, maintained by triggers (see items.search)."""
+    item = models.OneToOneField(Item, on_delete=models.DO_NOTHING, primary_key=True,
+                                db_column='rowid', related_name='search_entry')
+    document = SearchDocumentField(db_column='items_item_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'items_item_fts'
@@ -0,0 +1,88 @@
+import base64
+from datetime import datetime
+
+from django.db import models
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Keyset pagination over (created_at, id), newest first.
+
+    Each page is a range scan on a (created_at, id) index (item_created_id_idx
+    for items), so the cost of fetching page N does not depend on N.
+    Pagination is opt-in: requests that pass neither ``cursor`` nor
+    ``page_size`` keep getting a plain list.
+
+    A queryset annotated with ``search_rank`` (see items.search) is paged in
+    relevance order instead, on (search_rank, created_at, id), best first,
+    and its cursors carry the rank too.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 24
+    max_page_size = 100
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, obj):
+        raw = f'{obj.created_at.isoformat()}|{obj.pk}'
+        if self.ranked:
+            raw = f'{obj.search_rank!r}|{raw}'
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, token):
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            parts = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+            if len(parts) != (3 if self.ranked else 2):
+                raise ValueError(token)
+            *rank, created_at, pk = parts
+            return [float(value) for value in rank], datetime.fromisoformat(created_at), int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        self.ranked = 'search_rank' in queryset.query.annotations
+        queryset = queryset.order_by(*(('-search_rank',) if self.ranked else ()), *self.ordering)
+        token = params.get(self.cursor_query_param)
+        if token:
+            rank, created_at, pk = self.decode_cursor(token)
+            after = models.Q(created_at__lt=created_at) | models.Q(created_at=created_at, pk__lt=pk)
+            if rank:
+                after = models.Q(search_rank__lt=rank[0]) | (models.Q(search_rank=rank[0]) & after)
+            queryset = queryset.filter(after)
+        page = list(queryset[:self.page_size_value + 1])
+        self.has_next = len(page) > self.page_size_value
+        page = page[:self.page_size_value]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size_value)
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data,
+        })
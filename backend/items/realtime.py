@@ -0,0 +1,247 @@
+"""Server-sent events for swap chats.
+
+``GET /api/swaps/<swap_id>/events/`` is an async view that holds the
+connection open and pushes ``message`` events (new SwapMessage rows),
+``status`` events (Swap.status changes) and a final ``deleted`` event.
+An idle subscriber is a coroutine parked on a queue, so it costs no queries
+and no CPU. Reconnecting clients send Last-Event-ID (the last message id) and
+are replayed what they missed.
+
+Events are published by model signals after the transaction commits, through
+a channel layer. The default InMemoryChannelLayer needs no broker but only
+reaches subscribers in the same process. Multi-process deployments can plug a
+shared implementation in via ``settings.SWAP_CHANNEL_LAYER``.
+
+Streaming needs an ASGI server (``uvicorn backend.asgi:application``). Under
+WSGI the endpoint answers 501, and clients fall back to polling.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import models, transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .models import Swap, SwapMessage
+
+KEEPALIVE_SECONDS = 20
+RETRY_MILLISECONDS = 3000
+
+
+class InMemoryChannelLayer:
+    """Process-local pub/sub. publish() is thread-safe; subscribe() runs on an event loop."""
+
+    def __init__(self):
+        self._groups = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, group):
+        subscription = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._groups[group].add(subscription)
+        return subscription
+
+    def unsubscribe(self, group, subscription):
+        with self._lock:
+            self._groups[group].discard(subscription)
+            if not self._groups[group]:
+                del self._groups[group]
+
+    def has_subscribers(self, group):
+        with self._lock:
+            return group in self._groups
+
+    def publish(self, group, event):
+        with self._lock:
+            subscriptions = list(self._groups.get(group, ()))
+        for subscription in subscriptions:
+            loop, queue = subscription
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # The subscriber's loop has shut down without unsubscribing.
+                self.unsubscribe(group, subscription)
+
+
+class MessageWaiters:
+    """Wakes long-polling request threads when a swap gets a new message.
+
+    Only same-process writes wake a waiter; callers re-check the database
+    between short waits, so writes from other processes are still seen.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        # swap id -> [waiting threads, messages since the first one arrived].
+        # Entries go when their last waiter leaves, so only swaps being
+        # polled right now are kept.
+        self._counters = {}
+
+    def notify(self, swap_id):
+        with self._condition:
+            counter = self._counters.get(swap_id)
+            if counter is not None:
+                counter[1] += 1
+                self._condition.notify_all()
+
+    def wait(self, swap_id, timeout):
+        with self._condition:
+            counter = self._counters.setdefault(swap_id, [0, 0])
+            counter[0] += 1
+            seen = counter[1]
+            try:
+                return self._condition.wait_for(lambda: counter[1] != seen, timeout)
+            finally:
+                counter[0] -= 1
+                if not counter[0]:
+                    del self._counters[swap_id]
+
+
+message_waiters = MessageWaiters()
+
+
+@lru_cache(maxsize=None)
+def get_channel_layer():
+    path = getattr(settings, 'SWAP_CHANNEL_LAYER', None)
+    return import_string(path)() if path else InMemoryChannelLayer()
+
+
+def swap_group(swap_id):
+    return f'swap:{swap_id}'
+
+
+def message_payload(message):
+    from .views import SwapMessageSerializer
+    return SwapMessageSerializer(message).data
+
+
+def publish_on_commit(swap_id, event):
+    transaction.on_commit(lambda: get_channel_layer().publish(swap_group(swap_id), event))
+
+
+def remember_status(sender, instance, **kwargs):
+    """post_init receiver: keep the loaded status to detect changes on save."""
+    # Read __dict__ so instances loaded with status deferred don't query.
+    instance._loaded_status = instance.__dict__.get('status')
+
+
+def swap_saved(sender, instance, created, **kwargs):
+    if not created and instance.status != getattr(instance, '_loaded_status', None):
+        publish_on_commit(instance.pk, {'event': 'status', 'data': {'id': instance.pk, 'status': instance.status}})
+    instance._loaded_status = instance.status
+
+
+def swap_deleted(sender, instance, **kwargs):
+    publish_on_commit(instance.pk, {'event': 'deleted', 'data': {'id': instance.pk}})
+
+
+def has_subscribers(group):
+    layer = get_channel_layer()
+    # Layers that cannot tell are always published to.
+    return getattr(layer, 'has_subscribers', lambda group: True)(group)
+
+
+def message_saved(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    def publish():
+        # Checked after commit, when the event would go out: streams opened
+        # later replay the message from the database instead. Skipping idle
+        # swaps saves serializing the message and loading its sender.
+        group = swap_group(instance.swap_id)
+        if has_subscribers(group):
+            get_channel_layer().publish(group, {'event': 'message', 'id': instance.pk, 'data': message_payload(instance)})
+        message_waiters.notify(instance.swap_id)
+
+    transaction.on_commit(publish)
+
+
+def format_event(event):
+    lines = [f"event: {event['event']}"]
+    if 'id' in event:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"data: {json.dumps(event['data'], default=str)}")
+    return '\n'.join(lines) + '\n\n'
+
+
+def authenticate(request):
+    """JWT from the Authorization header or, for EventSource clients, ?token=."""
+    auth = JWTAuthentication()
+    try:
+        token = request.GET.get('token')
+        if token:
+            return auth.get_user(auth.get_validated_token(token))
+        result = auth.authenticate(request)
+        return result[0] if result else None
+    except (InvalidToken, TokenError, AuthenticationFailed):
+        return None
+
+
+def missed_messages(swap_id, after_id):
+    messages = SwapMessage.objects.filter(swap_id=swap_id, pk__gt=after_id).select_related('sender').order_by('pk')
+    return [{'event': 'message', 'id': m.pk, 'data': message_payload(m)} for m in messages]
+
+
+async def event_stream(group, subscription, backlog):
+    layer = get_channel_layer()
+    _, queue = subscription
+    last_id = 0
+    try:
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+        for event in backlog:
+            last_id = event['id']
+            yield format_event(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if 'id' in event and event['id'] <= last_id:
+                continue  # Already sent as part of the replayed backlog.
+            yield format_event(event)
+            if event['event'] == 'deleted':
+                return
+    finally:
+        layer.unsubscribe(group, subscription)
+
+
+async def swap_events(request, swap_id):
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': 'Event streaming requires the ASGI server.'}, status=501)
+    user = await sync_to_async(authenticate)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+    is_party = await Swap.objects.filter(
+        models.Q(proposer=user) | models.Q(receiver=user), pk=swap_id
+    ).aexists()
+    if not is_party:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+
+    try:
+        after_id = int(request.headers.get('Last-Event-ID') or request.GET.get('after_id') or 0)
+    except ValueError:
+        after_id = 0
+    group = swap_group(swap_id)
+    # Subscribe before reading the backlog so nothing falls between the two.
+    subscription = get_channel_layer().subscribe(group)
+    try:
+        backlog = await sync_to_async(missed_messages)(swap_id, after_id) if after_id else []
+    except Exception:
+        get_channel_layer().unsubscribe(group, subscription)
+        raise
+
+    response = StreamingHttpResponse(event_stream(group, subscription, backlog), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,303 @@
+"""Swap-match recommendations scored over in-memory NumPy feature arrays.
+
+MatchIndex keeps one row per item: integer codes for category, size, brand
+and condition, points, owner, availability and a 64-bit hashed tag set. A
+score compares one item against every candidate row at once:
+
+    3.0 * same category + 2.0 * same size + 1.0 * same brand (if set)
+    + 0.5 * same condition + 2.0 * points parity + 1.5 * tag Jaccard
+
+where points parity is 1 - |a - b| / max(a, b), floored at 0, and tags are
+compared with popcounts. Top-k comes from a partial sort.
+
+Two queries use it: a user's available items ranked against one catalog item
+(GET /api/items/<pk>/matches/), and available catalog items ranked against a
+user's whole wardrobe (GET /api/recommendations/), where each catalog item
+scores as its best match. For the second, the available catalog is kept as
+one category-sorted block of contiguous columns, and each wardrobe item is
+first scored against its own category only; see matches_for_wardrobe().
+
+The index is built on first use and kept current by Item post_save/post_delete
+(after commit) and by refresh() for writes made with update() or
+bulk_create. Those hooks only reach the process that made the write, so each
+process also rebuilds its index once it is RECOMMENDATION_INDEX_MAX_AGE
+seconds old (default 300). Candidates are re-read from the database before
+they are returned, so a stale row can only affect ranking, never return a
+deleted or unavailable item.
+"""
+import threading
+import time
+import zlib
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import Item
+
+WEIGHTS = {
+    'category': 3.0,
+    'size': 2.0,
+    'brand': 1.0,
+    'condition': 0.5,
+    'points': 2.0,
+    'tags': 1.5,
+}
+FEATURE_FIELDS = ('category', 'size', 'brand', 'condition', 'points', 'tags', 'owner_id', 'active_swap_count')
+CODED_FIELDS = ('category', 'size', 'brand', 'condition')
+# Model field names, as save(update_fields=...) gives them.
+INDEXED_FIELDS = {'category', 'size', 'brand', 'condition', 'points', 'tags', 'owner', 'active_swap_count'}
+ARRAYS = ('points', 'tags', 'owner', 'available', 'alive', 'item_ids')
+# The most a pair of items in different categories can score.
+OTHER_FIELDS_MAX = sum(weight for field, weight in WEIGHTS.items() if field != 'category')
+INITIAL_CAPACITY = 1024
+MISSING = -1  # code for an empty value, which matches nothing
+
+
+def tag_bits(tags):
+    """Comma-separated tags hashed into a 64-bit set."""
+    bits = 0
+    for tag in (tags or '').split(','):
+        tag = tag.strip().lower()
+        if tag:
+            bits |= 1 << (zlib.crc32(tag.encode()) & 63)
+    return np.uint64(bits)
+
+
+def popcount(values):
+    if hasattr(np, 'bitwise_count'):  # NumPy 2.0+
+        return np.bitwise_count(values)
+    # SWAR popcount for older NumPy.
+    values = values - ((values >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    values = (values & np.uint64(0x3333333333333333)) + ((values >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    values = (values + (values >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (values * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+class MatchIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built_at = None
+
+    def reset(self):
+        with self.lock:
+            self.built_at = None
+
+    def allocate(self, capacity):
+        self.codes = {field: np.full(capacity, MISSING, dtype=np.int32) for field in CODED_FIELDS}
+        self.points = np.zeros(capacity, dtype=np.float32)
+        self.tags = np.zeros(capacity, dtype=np.uint64)
+        self.owner = np.zeros(capacity, dtype=np.int64)
+        self.available = np.zeros(capacity, dtype=bool)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.item_ids = np.zeros(capacity, dtype=np.int64)
+
+    def grow(self):
+        codes = self.codes
+        arrays = {name: getattr(self, name) for name in ARRAYS}
+        self.allocate(len(self.alive) * 2)
+        for field in CODED_FIELDS:
+            self.codes[field][:len(codes[field])] = codes[field]
+        for name, values in arrays.items():
+            getattr(self, name)[:len(values)] = values
+
+    def build(self):
+        rows = list(Item.objects.values_list('pk', *FEATURE_FIELDS).iterator(chunk_size=2000))
+        with self.lock:
+            self.vocabularies = {field: {} for field in CODED_FIELDS}
+            self.rows = {}
+            self.free = []
+            self.version = 0
+            self.catalog_cache = None
+            self.allocate(max(INITIAL_CAPACITY, len(rows) * 5 // 4))
+            for pk, *values in rows:
+                self.put(pk, dict(zip(FEATURE_FIELDS, values)))
+            self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        max_age = getattr(settings, 'RECOMMENDATION_INDEX_MAX_AGE', 300)
+        with self.lock:
+            if self.built_at is None or time.monotonic() - self.built_at > max_age:
+                self.build()
+
+    def code(self, field, value):
+        value = (value or '').strip().lower()
+        if not value:
+            return MISSING
+        return self.vocabularies[field].setdefault(value, len(self.vocabularies[field]))
+
+    def put(self, pk, values):
+        row = self.rows.get(pk)
+        if row is None:
+            if self.free:
+                row = self.free.pop()
+            else:
+                row = len(self.rows)
+                if row >= len(self.alive):
+                    self.grow()
+            self.rows[pk] = row
+        for field in CODED_FIELDS:
+            self.codes[field][row] = self.code(field, values[field])
+        self.points[row] = values['points'] or 0
+        self.tags[row] = tag_bits(values['tags'])
+        self.owner[row] = values['owner_id']
+        self.available[row] = values['active_swap_count'] == 0
+        self.item_ids[row] = pk
+        self.alive[row] = True
+        self.version += 1
+
+    def remove(self, pk):
+        with self.lock:
+            if self.built_at is None:
+                return
+            row = self.rows.pop(pk, None)
+            if row is not None:
+                self.alive[row] = False
+                self.available[row] = False
+                self.free.append(row)
+                self.version += 1
+
+    def update(self, pk, values):
+        with self.lock:
+            if self.built_at is not None:
+                self.put(pk, values)
+
+    def refresh(self, item_ids):
+        """Re-read ``item_ids`` after writes that send no post_save."""
+        with self.lock:
+            if self.built_at is None:
+                return
+            item_ids = set(item_ids)
+            for pk, *values in Item.objects.filter(pk__in=item_ids).values_list('pk', *FEATURE_FIELDS):
+                self.put(pk, dict(zip(FEATURE_FIELDS, values)))
+                item_ids.discard(pk)
+            for pk in item_ids:
+                self.remove(pk)
+
+    def refresh_missing(self, item_ids):
+        # Items created by another process since the last build.
+        missing = [pk for pk in item_ids if pk not in self.rows]
+        if missing:
+            self.refresh(missing)
+
+    def features(self, candidates):
+        """The feature columns of ``candidates`` (an array of rows), gathered into contiguous arrays."""
+        return {
+            'codes': {field: self.codes[field][candidates] for field in CODED_FIELDS},
+            'points': self.points[candidates],
+            'tags': self.tags[candidates],
+            'tag_counts': popcount(self.tags[candidates]).astype(np.float32),
+            'owner': self.owner[candidates],
+        }
+
+    def catalog(self):
+        """Rows and features of every available item, sorted by category and
+        cached until the next write, plus each category's (start, end) slice.
+        """
+        if self.catalog_cache is None or self.catalog_cache[0] != self.version:
+            candidates = np.flatnonzero(self.alive & self.available)
+            candidates = candidates[np.argsort(self.codes['category'][candidates], kind='stable')]
+            features = self.features(candidates)
+            categories = features['codes']['category']
+            codes = np.unique(categories)
+            starts = np.searchsorted(categories, codes, side='left')
+            ends = np.searchsorted(categories, codes, side='right')
+            slices = {int(code): (int(start), int(end)) for code, start, end in zip(codes, starts, ends)}
+            self.catalog_cache = (self.version, candidates, features, slices)
+        return self.catalog_cache[1:]
+
+    def scores(self, row, features):
+        """Scores of ``row`` against the rows whose ``features`` are given."""
+        score = np.zeros(len(features['points']), dtype=np.float32)
+        for field in CODED_FIELDS:
+            code = self.codes[field][row]
+            if code != MISSING:
+                score += np.float32(WEIGHTS[field]) * (features['codes'][field] == code)
+        points, own_points = features['points'], self.points[row]
+        larger = np.maximum(np.maximum(points, own_points), np.float32(1))
+        score += np.float32(WEIGHTS['points']) * np.clip(1 - np.abs(points - own_points) / larger, 0, 1)
+        own_tags = self.tags[row]
+        if own_tags:
+            # |a & b| / |a | b| = shared / (|a| + |b| - shared)
+            shared = popcount(features['tags'] & own_tags).astype(np.float32)
+            union = features['tag_counts'] + np.float32(popcount(own_tags)) - shared
+            score += np.float32(WEIGHTS['tags']) * (shared / union)
+        return score
+
+    def signature(self, row):
+        return (*(self.codes[field][row] for field in CODED_FIELDS), self.points[row], self.tags[row])
+
+    def top(self, candidates, score, k):
+        if len(candidates) > k:
+            # Keep everything tied with the k-th score, so ties go to the newest item.
+            keep = score >= np.partition(score, len(score) - k)[len(score) - k]
+            candidates, score = candidates[keep], score[keep]
+        order = np.lexsort((-self.item_ids[candidates], -score))[:k]
+        return [(int(self.item_ids[candidates[i]]), float(score[i])) for i in order if np.isfinite(score[i])]
+
+    def matches_for_item(self, item_id, candidate_ids, k):
+        """(item id, score) for the best ``k`` of ``candidate_ids`` against one item, best first."""
+        self.ensure_built()
+        with self.lock:
+            self.refresh_missing([item_id, *candidate_ids])
+            row = self.rows.get(item_id)
+            candidates = np.array([self.rows[pk] for pk in candidate_ids if pk in self.rows], dtype=np.int64)
+            if row is None or not len(candidates):
+                return []
+            return self.top(candidates, self.scores(row, self.features(candidates)), k)
+
+    def matches_for_wardrobe(self, owner_id, wardrobe_ids, k):
+        """(item id, score) for the best ``k`` available catalog items for any of ``wardrobe_ids``.
+
+        Each catalog item scores as its best match in the wardrobe.
+        """
+        self.ensure_built()
+        with self.lock:
+            self.refresh_missing(wardrobe_ids)
+            # Items with identical features score identically; score each once.
+            rows = {self.signature(self.rows[pk]): self.rows[pk] for pk in wardrobe_ids if pk in self.rows}
+            candidates, features, slices = self.catalog()
+            if not rows or not len(candidates):
+                return []
+            owned = features['owner'] == owner_id
+
+            # A pair in different categories scores at most OTHER_FIELDS_MAX. So
+            # first score each wardrobe item against its own category only; if
+            # the k-th best of those beats OTHER_FIELDS_MAX, no other pair can
+            # enter the top k or raise a score in it, and the result is exact.
+            best = np.full(len(candidates), -np.inf, dtype=np.float32)
+            for row in rows.values():
+                start, end = slices.get(int(self.codes['category'][row]), (0, 0))
+                if start < end:
+                    part = {
+                        'codes': {field: codes[start:end] for field, codes in features['codes'].items()},
+                        **{name: features[name][start:end] for name in ('points', 'tags', 'tag_counts', 'owner')},
+                    }
+                    np.maximum(best[start:end], self.scores(row, part), out=best[start:end])
+            best[owned] = -np.inf
+            if np.count_nonzero(best > OTHER_FIELDS_MAX) >= k:
+                return self.top(candidates, best, k)
+
+            for row in rows.values():
+                np.maximum(best, self.scores(row, features), out=best)
+            best[owned] = -np.inf
+            return self.top(candidates, best, k)
+
+
+index = MatchIndex()
+
+
+def item_saved(sender, instance, update_fields=None, **kwargs):
+    """Item post_save receiver; the row is indexed once the write commits."""
+    if update_fields is not None and not set(update_fields) & INDEXED_FIELDS:
+        return
+    if instance.get_deferred_fields() & set(FEATURE_FIELDS):
+        transaction.on_commit(lambda: index.refresh([instance.pk]))
+        return
+    values = {field: getattr(instance, field) for field in FEATURE_FIELDS}
+    transaction.on_commit(lambda: index.update(instance.pk, values))
+
+
+def item_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: index.remove(pk))
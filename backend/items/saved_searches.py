@@ -0,0 +1,247 @@
+"""Saved searches, and an inverted index that finds the ones a new item matches.
+
+A SavedSearch stores browse_items filters. Each new item gets a
+``match_saved_searches`` job (see items.tasks; a bulk import gets one job for
+all its items). The job asks SavedSearchIndex which searches the item matches
+and inserts their SearchNotification rows with one bulk_create.
+
+Matching follows filter_items: category and brand compare case-insensitively,
+size and condition match any of their comma-separated values, and every
+keyword must be a prefix of a word in the item's title, description, brand,
+category or tags, as items.search matches them. A user's own items never
+match their searches.
+
+The index files each search under a single key, a (field, value) pair that
+every item it matches must have. A search for ``nike`` tops in size M or L
+could go under ('term', 'nike'), ('category', 'tops') or both ('size', 'M')
+and ('size', 'L'). It takes whichever the fewest of the latest
+KEY_SAMPLE_SIZE items have, so it is visited by as few new items as
+possible. An item looks up its own keys: its category, brand, size and
+condition, and every prefix of every word in its search fields. Only the
+searches filed there are candidates, and each candidate is checked against
+all of its filters. The cost per item grows with its text and its candidates,
+not with the number of saved searches.
+
+The index is built on first use and kept current by SavedSearch
+post_save/post_delete (after commit). Each process rebuilds it once it is
+SAVED_SEARCH_INDEX_MAX_AGE seconds old (default 300). Searches created by
+other processes are picked up before every match, by id. Matches are
+re-checked against the database before they are notified, so a stale entry
+can never notify a deleted search, or one edited elsewhere to no longer match.
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Item, SavedSearch, SearchNotification
+from .search import SEARCH_FIELDS, TOKEN_RE, tokenize
+
+FILTER_FIELDS = ('search', 'category', 'size', 'condition', 'brand')
+ITEM_FIELDS = ('owner_id', *SEARCH_FIELDS, 'size', 'condition')
+BATCH_SIZE = 500
+# Recent items whose keys guide where each search is filed.
+KEY_SAMPLE_SIZE = 2000
+
+
+def criteria(search='', category='', size='', condition='', brand=''):
+    """Filters in browse_items parameter form, normalized as filter_items applies them."""
+    def split(value):
+        return frozenset(v.strip() for v in (value or '').split(',') if v.strip())
+    category = category or ''
+    brand = brand or ''
+    return {
+        'terms': frozenset(tokenize(search or '')),
+        'category': '' if category == 'All Categories' else category.lower(),
+        'size': split(size),
+        'condition': split(condition),
+        'brand': '' if brand == 'All Brands' else brand.lower(),
+    }
+
+
+def search_criteria(search):
+    return criteria(**{field: getattr(search, field) for field in FILTER_FIELDS})
+
+
+def item_features(values):
+    """What criteria are compared with, from an item's ITEM_FIELDS."""
+    prefixes = set()
+    for field in SEARCH_FIELDS:
+        for word in TOKEN_RE.findall((values[field] or '').lower()):
+            prefixes.update(word[:n] for n in range(1, len(word) + 1))
+    return {
+        'category': (values['category'] or '').lower(),
+        'brand': (values['brand'] or '').lower(),
+        'size': values['size'],
+        'condition': values['condition'],
+        'prefixes': prefixes,
+    }
+
+
+def item_keys(features):
+    return [
+        ('category', features['category']),
+        ('brand', features['brand']),
+        ('size', features['size']),
+        ('condition', features['condition']),
+        *(('term', prefix) for prefix in features['prefixes']),
+    ]
+
+
+def matches(filters, features):
+    return (
+        (not filters['category'] or filters['category'] == features['category'])
+        and (not filters['brand'] or filters['brand'] == features['brand'])
+        and (not filters['size'] or features['size'] in filters['size'])
+        and (not filters['condition'] or features['condition'] in filters['condition'])
+        and filters['terms'] <= features['prefixes']
+    )
+
+
+class SavedSearchIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built_at = None
+
+    def reset(self):
+        with self.lock:
+            self.built_at = None
+
+    def build(self):
+        rows = list(SavedSearch.objects.values_list('pk', 'user_id', *FILTER_FIELDS).iterator(chunk_size=2000))
+        sample = Item.objects.order_by('-created_at', '-id').values(*ITEM_FIELDS)[:KEY_SAMPLE_SIZE]
+        frequency = Counter(key for values in sample for key in item_keys(item_features(values)))
+        with self.lock:
+            # How many of the latest items have each key.
+            self.frequency = frequency
+            # search id -> (user id, filters, keys it is filed under)
+            self.searches = {}
+            self.postings = defaultdict(set)
+            # Searches without filters, which match every item.
+            self.unfiltered = set()
+            self.latest = 0
+            for pk, user_id, *values in rows:
+                self.put(pk, user_id, criteria(**dict(zip(FILTER_FIELDS, values))))
+                self.latest = max(self.latest, pk)
+            self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        max_age = getattr(settings, 'SAVED_SEARCH_INDEX_MAX_AGE', 300)
+        with self.lock:
+            if self.built_at is None or time.monotonic() - self.built_at > max_age:
+                self.build()
+
+    def choose_keys(self, filters):
+        """The keys, one per value of one filter, that the fewest sampled items have."""
+        options = [[('term', term)] for term in sorted(filters['terms'], key=len, reverse=True)]
+        for field in ('brand', 'category'):
+            if filters[field]:
+                options.append([(field, filters[field])])
+        for field in ('size', 'condition'):
+            if filters[field]:
+                options.append([(field, value) for value in sorted(filters[field])])
+        if not options:
+            return []
+        return min(options, key=lambda keys: sum(self.frequency.get(key, 0) for key in keys))
+
+    def put(self, pk, user_id, filters):
+        self.discard(pk)
+        keys = self.choose_keys(filters)
+        for key in keys:
+            self.postings[key].add(pk)
+        if not keys:
+            self.unfiltered.add(pk)
+        self.searches[pk] = (user_id, filters, keys)
+
+    def discard(self, pk):
+        entry = self.searches.pop(pk, None)
+        if entry is None:
+            return
+        for key in entry[2]:
+            self.postings[key].discard(pk)
+            if not self.postings[key]:
+                del self.postings[key]
+        self.unfiltered.discard(pk)
+
+    def update(self, pk, user_id, filters):
+        with self.lock:
+            if self.built_at is not None:
+                self.put(pk, user_id, filters)
+
+    def remove(self, pk):
+        with self.lock:
+            if self.built_at is not None:
+                self.discard(pk)
+
+    def refresh_new(self):
+        # Searches created by another process since the last build. Saves in
+        # this process do not move ``latest``: ids are not committed in order.
+        with self.lock:
+            for pk, user_id, *values in SavedSearch.objects.filter(pk__gt=self.latest).values_list(
+                'pk', 'user_id', *FILTER_FIELDS
+            ):
+                self.put(pk, user_id, criteria(**dict(zip(FILTER_FIELDS, values))))
+
+    def candidates(self, features):
+        found = set(self.unfiltered)
+        for key in item_keys(features):
+            found.update(self.postings.get(key, ()))
+        return found
+
+    def match(self, owner_id, features):
+        """Ids of the searches an item with ``features`` matches, other than its owner's."""
+        with self.lock:
+            return [
+                pk for pk in self.candidates(features)
+                if self.searches[pk][0] != owner_id and matches(self.searches[pk][1], features)
+            ]
+
+
+index = SavedSearchIndex()
+
+
+def notify(item_ids):
+    """Notify every saved search each of ``item_ids`` matches; returns the number of matches."""
+    index.ensure_built()
+    index.refresh_new()
+    items = {
+        values['id']: (values['owner_id'], item_features(values))
+        for values in Item.objects.filter(pk__in=item_ids).values('id', *ITEM_FIELDS)
+    }
+    matched = defaultdict(list)
+    for item_id, (owner_id, features) in items.items():
+        for search_id in index.match(owner_id, features):
+            matched[search_id].append(item_id)
+
+    notifications = []
+    search_ids = sorted(matched)
+    for start in range(0, len(search_ids), BATCH_SIZE):
+        for search in SavedSearch.objects.filter(pk__in=search_ids[start:start + BATCH_SIZE]):
+            filters = search_criteria(search)
+            notifications += [
+                SearchNotification(user_id=search.user_id, saved_search=search, item_id=item_id)
+                for item_id in matched[search.pk]
+                if items[item_id][0] != search.user_id and matches(filters, items[item_id][1])
+            ]
+    # A retried job finds its earlier rows already there.
+    SearchNotification.objects.bulk_create(notifications, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return len(notifications)
+
+
+def item_saved(sender, instance, created=False, raw=False, **kwargs):
+    """Item post_save receiver: match a new item once it commits."""
+    if created and not raw:
+        from .tasks import enqueue
+        enqueue('match_saved_searches', item=instance)
+
+
+def search_saved(sender, instance, **kwargs):
+    pk, user_id, filters = instance.pk, instance.user_id, search_criteria(instance)
+    transaction.on_commit(lambda: index.update(pk, user_id, filters))
+
+
+def search_deleted(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: index.remove(pk))
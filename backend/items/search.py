@@ -0,0 +1,180 @@
+"""Full-text search over the item catalog.
+
+The ``search`` parameter of the item list endpoints is answered by a backend
+picked from the database vendor (or ``settings.ITEM_SEARCH_BACKEND``):
+
+* SQLite: an external-content FTS5 table kept in sync by triggers.
+* PostgreSQL: a GIN expression index over ``to_tsvector``.
+* Anything else: the original five-column ``icontains`` scan.
+
+Every backend matches each search word as a prefix, requires all words to
+match, and returns the queryset ordered by relevance (``search_rank``, higher
+is better), newest first on ties.
+"""
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Item
+
+SEARCH_FIELDS = ['title', 'description', 'brand', 'category', 'tags']
+MAX_TERMS = 8
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())[:MAX_TERMS]
+
+
+class LikeSearchBackend:
+    """Unindexed fallback: OR of icontains over every search field, per word."""
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        for term in terms:
+            match = models.Q()
+            for field in SEARCH_FIELDS:
+                match |= models.Q(**{f'{field}__icontains': term})
+            queryset = queryset.filter(match)
+        return queryset.annotate(search_rank=models.Value(0.0)).order_by('-created_at', '-id')
+
+
+class SQLiteFTSBackend:
+    table = 'items_item_fts'
+
+    def match_expression(self, terms):
+        # Quoted prefix tokens joined by spaces, which FTS5 treats as AND.
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset
+        # Joining the FTS table lets SQLite drive the query from the index
+        # and read bm25() (``rank``, smaller is better) for each hit directly.
+        return queryset.filter(
+            search_entry__document__match=self.match_expression(terms)
+        ).annotate(
+            search_rank=-models.F('search_entry__rank')
+        ).order_by('-search_rank', '-created_at', '-id')
+
+    def install(self, conn):
+        item_table = Item._meta.db_table
+        columns = ', '.join(SEARCH_FIELDS)
+        new_values = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+        old_values = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+        delete_old = (
+            f"INSERT INTO {self.table}({self.table}, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old_values});"
+        )
+        insert_new = f'INSERT INTO {self.table}(rowid, {columns}) VALUES (new.id, {new_values});'
+        triggers = {
+            f'{self.table}_ai': f'AFTER INSERT ON {item_table} BEGIN {insert_new} END',
+            f'{self.table}_ad': f'AFTER DELETE ON {item_table} BEGIN {delete_old} END',
+            f'{self.table}_au': (
+                f'AFTER UPDATE OF {columns} ON {item_table} BEGIN {delete_old} {insert_new} END'
+            ),
+        }
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5('
+                f"{columns}, content='{item_table}', content_rowid='id', prefix='2 3')"
+            )
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                [item_table],
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+            missing = [name for name in triggers if name not in existing]
+            for name in missing:
+                cursor.execute(f'CREATE TRIGGER {name} {triggers[name]}')
+            if missing:
+                # Table remakes during schema changes drop triggers, so any
+                # writes made meanwhile are unindexed; rebuild from the content table.
+                cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+    def uninstall(self, conn):
+        with conn.cursor() as cursor:
+            for suffix in ('ai', 'ad', 'au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {self.table}_{suffix}')
+            cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+
+class PostgresSearchBackend:
+    index = 'items_item_search_idx'
+    config = 'simple'
+
+    def vector_sql(self):
+        document = " || ' ' || ".join(f"coalesce({field}, '')" for field in SEARCH_FIELDS)
+        return f"to_tsvector('{self.config}', {document})"
+
+    def tsquery(self, terms):
+        return ' & '.join(f"'{term}':*" for term in terms)
+
+    def search(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset
+        tsquery = self.tsquery(terms)
+        # Must match the indexed expression exactly for the GIN index to be used.
+        vector = self.vector_sql()
+        return queryset.filter(
+            RawSQL(f"{vector} @@ to_tsquery('{self.config}', %s)", [tsquery],
+                   output_field=models.BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f"ts_rank({vector}, to_tsquery('{self.config}', %s))", [tsquery],
+                               output_field=models.FloatField())
+        ).order_by('-search_rank', '-created_at', '-id')
+
+    def install(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {self.index} '
+                f'ON {Item._meta.db_table} USING GIN (({self.vector_sql()}))'
+            )
+
+    def uninstall(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute(f'DROP INDEX IF EXISTS {self.index}')
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def backend_for(conn):
+    path = getattr(settings, 'ITEM_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return VENDOR_BACKENDS.get(conn.vendor, LikeSearchBackend)()
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    return backend_for(connection)
+
+
+def install_search_index(conn):
+    backend = backend_for(conn)
+    if hasattr(backend, 'install'):
+        backend.install(conn)
+
+
+def uninstall_search_index(conn):
+    backend = backend_for(conn)
+    if hasattr(backend, 'uninstall'):
+        backend.uninstall(conn)
+
+
+def ensure_search_index(sender, using='default', **kwargs):
+    """post_migrate hook: restore triggers dropped by table remakes."""
+    from django.db import connections
+    conn = connections[using]
+    if Item._meta.db_table in conn.introspection.table_names():
+        install_search_index(conn)
@@ -0,0 +1,138 @@
+"""Per-user dashboard counters (UserStats), maintained incrementally.
+
+GET /api/me/stats/ and the swap list's unread count read one UserStats row
+by primary key instead of counting swaps and items on every request.
+
+Each Swap and Item write applies its change to the affected rows as a single
+``UPDATE ... SET counter = counter + <delta>`` (an F() expression), so
+concurrent writes never lose an increment. A swap's contribution is worked
+out from its state as loaded (post_init) and as saved:
+
+* each party counts the swap once, under pending, accepted (accepted,
+  meetup_pending, awaiting_response) or completed;
+* the receiver counts it as unread until is_read is set.
+
+A row is created with its user, and migration 0016 backfilled the users that
+existed before. Writes that send no signals (bulk_create, QuerySet.update)
+must call add() themselves. A write for a user without a row (one made with
+bulk_create) recounts the user inside the write's transaction, so the row
+starts out including it. recount() locks the rows before it counts, so a
+concurrent add() either lands before the count or waits and applies on top
+of it. Reads never write: for_user() computes a missing row without saving
+it. ``manage.py recount_user_stats`` rebuilds every row to repair any drift.
+"""
+from collections import Counter, defaultdict
+
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+
+from .models import Item, PointsAccount, Swap, UserStats
+
+STATUS_COUNTERS = {
+    'pending': 'pending_swaps',
+    **dict.fromkeys(Swap.ACCEPTED_STATUSES, 'accepted_swaps'),
+    'completed': 'completed_swaps',
+}
+COUNTERS = ('unread_swaps', 'pending_swaps', 'accepted_swaps', 'completed_swaps', 'listed_items')
+
+
+def add(deltas, create=True):
+    """Apply ``{user id: {counter: delta}}``.
+
+    A user without a row is recounted, which takes in the write being
+    applied; with ``create=False`` (deletes, which may be cascading from the
+    user) they are skipped instead.
+    """
+    for user_id in sorted(deltas):
+        changes = {name: models.F(name) + delta for name, delta in deltas[user_id].items() if delta}
+        if changes and not UserStats.objects.filter(pk=user_id).update(**changes) and create:
+            recount([user_id])
+
+
+def counts(user_ids):
+    """``{user id: {counter: value}}`` counted from swaps and items."""
+    counts = defaultdict(Counter)
+    for party in ('proposer', 'receiver'):
+        rows = Swap.objects.filter(**{f'{party}__in': user_ids}).values_list(party, 'status').annotate(n=models.Count('pk'))
+        for user_id, status, n in rows.order_by():
+            if status in STATUS_COUNTERS:
+                counts[user_id][STATUS_COUNTERS[status]] += n
+    unread = Swap.objects.filter(receiver__in=user_ids, is_read=False).values_list('receiver')
+    for user_id, n in unread.annotate(n=models.Count('pk')).order_by():
+        counts[user_id]['unread_swaps'] = n
+    listed = Item.objects.filter(owner__in=user_ids).values_list('owner')
+    for user_id, n in listed.annotate(n=models.Count('pk')).order_by():
+        counts[user_id]['listed_items'] = n
+    return {user_id: {name: counts[user_id][name] for name in COUNTERS} for user_id in user_ids}
+
+
+def recount(user_ids):
+    """Rebuild the rows of ``user_ids`` from swaps and items."""
+    with transaction.atomic():
+        UserStats.objects.bulk_create([UserStats(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+        # Lock before counting: add() on these rows now waits for this transaction.
+        list(UserStats.objects.select_for_update().filter(pk__in=user_ids).order_by('pk').values_list('pk'))
+        for user_id, values in counts(user_ids).items():
+            UserStats.objects.filter(pk=user_id).update(**values)
+
+
+def for_user(user):
+    """The user's UserStats with ``points`` (their ledger balance), in one query.
+
+    A user without a row gets one computed from the source tables and not saved.
+    """
+    balance = PointsAccount.objects.filter(pk=models.OuterRef('pk')).values('balance')
+    row = UserStats.objects.filter(pk=user.pk).annotate(points=Coalesce(models.Subquery(balance), 0)).first()
+    if row is None:
+        row = UserStats(user_id=user.pk, **counts([user.pk])[user.pk])
+        row.points = PointsAccount.objects.filter(pk=user.pk).values_list('balance', flat=True).first() or 0
+    return row
+
+
+def swap_state(swap):
+    # Read __dict__ so instances loaded with fields deferred don't query.
+    return tuple(swap.__dict__.get(name) for name in ('proposer_id', 'receiver_id', 'status', 'is_read'))
+
+
+def contribution(state, sign, deltas):
+    proposer_id, receiver_id, status, is_read = state
+    counter = STATUS_COUNTERS.get(status)
+    for user_id in (proposer_id, receiver_id):
+        if counter and user_id is not None:
+            deltas[user_id][counter] += sign
+    if receiver_id is not None and is_read is False:
+        deltas[receiver_id]['unread_swaps'] += sign
+
+
+def remember_swap(sender, instance, **kwargs):
+    """post_init receiver."""
+    instance._stats_state = swap_state(instance)
+
+
+def swap_saved(sender, instance, created, **kwargs):
+    deltas = defaultdict(Counter)
+    if not created:
+        contribution(getattr(instance, '_stats_state', swap_state(instance)), -1, deltas)
+    contribution(swap_state(instance), 1, deltas)
+    add(deltas)
+    instance._stats_state = swap_state(instance)
+
+
+def swap_deleted(sender, instance, **kwargs):
+    deltas = defaultdict(Counter)
+    contribution(getattr(instance, '_stats_state', swap_state(instance)), -1, deltas)
+    add(deltas, create=False)
+
+
+def item_saved(sender, instance, created, **kwargs):
+    if created:
+        add({instance.owner_id: {'listed_items': 1}})
+
+
+def item_deleted(sender, instance, **kwargs):
+    add({instance.owner_id: {'listed_items': -1}}, create=False)
+
+
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.bulk_create([UserStats(user=instance)], ignore_conflicts=True)
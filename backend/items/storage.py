@@ -0,0 +1,90 @@
+"""Content-addressed file storage for uploaded media.
+
+ContentAddressedStorage (the default storage, see STORAGES in settings) names
+every file after the SHA-256 of its contents::
+
+    item_photos/lower.jpg  ->  item_photos/3f/3fa94c0e21d7b6a85e0f1c9d4b2a7e61.jpg
+
+The first directory of the requested name is kept, so originals and their
+variants (``item_photos/variants/...``) share one ``item_photos/<xx>/`` fan-out.
+Saving content that is already stored writes nothing and returns the existing
+name, so identical uploads are kept once. A stored file never changes, which
+lets items.media serve these names as immutable.
+
+Because files are shared, delete only names no row references any more; see
+items.media.unreferenced().
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+
+DIGEST_LENGTH = 32  # hex characters, i.e. 128 bits of SHA-256
+CONTENT_ADDRESSED_NAME = re.compile(
+    rf'(?:^|/)(?P<fanout>[0-9a-f]{{2}})/(?P<digest>(?P=fanout)[0-9a-f]{{{DIGEST_LENGTH - 2}}})(?:\.[\w]+)?$'
+)
+
+
+def content_digest(content):
+    sha = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        sha.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return sha.hexdigest()[:DIGEST_LENGTH]
+
+
+def name_digest(name):
+    """The digest in a content-addressed name, or None for any other name."""
+    match = CONTENT_ADDRESSED_NAME.search(name)
+    return match['digest'] if match else None
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def hashed_name(self, name, digest):
+        parts = name.replace('\\', '/').split('/')
+        root = parts[0] if len(parts) > 1 else ''
+        extension = os.path.splitext(name)[1].lower()
+        return '/'.join(part for part in (root, digest[:2], digest + extension) if part)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        validate_file_name(name, allow_relative_path=True)
+        name = self.hashed_name(name, content_digest(content))
+        if self.exists(name):
+            return name
+        name = self._save(name, content)
+        validate_file_name(name, allow_relative_path=True)
+        return name
+
+    def _save(self, name, content):
+        # Write to a temporary file and rename it into place, so readers never
+        # see a partial file and a concurrent save of the same content simply
+        # replaces it with identical bytes.
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                for chunk in content.chunks():
+                    fh.write(chunk)
+            # mkstemp creates the file 0600; apply FILE_UPLOAD_PERMISSIONS instead.
+            os.chmod(temp_path, self.file_permissions_mode if self.file_permissions_mode is not None else 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return name
@@ -0,0 +1,204 @@
+"""In-process background jobs backed by the Job table.
+
+``enqueue()`` inserts a Job row and, once the surrounding transaction
+commits, hands its id to a thread pool in the same process. The pool claims a
+job with a conditional UPDATE, so a job runs once even if several processes
+try to pick it up. Because every job is a row, nothing is lost on restart:
+``recover_jobs()`` (run at server start, see backend/wsgi.py and
+backend/asgi.py) resubmits queued jobs and jobs whose runner died, and
+``manage.py run_jobs`` drains the table from a separate process.
+
+Settings (all optional):
+
+* ``JOB_QUEUE_WORKERS``: pool size, default 2.
+* ``JOB_QUEUE_EAGER``: run jobs inline on commit instead of in the pool.
+* ``JOB_QUEUE_MAX_ATTEMPTS``: runs before a job is marked failed, default 3.
+* ``JOB_QUEUE_LEASE_SECONDS``: how long a running job may go without
+  finishing before it is considered abandoned, default 600.
+"""
+import logging
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, models, transaction
+from django.utils import timezone
+
+from .models import Item, Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+
+def task(name):
+    """Register a job handler; it receives the Job instance."""
+    def register(func):
+        TASKS[name] = func
+        return func
+    return register
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+class JobWorker:
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=setting('JOB_QUEUE_WORKERS', 2), thread_name_prefix='jobs'
+                )
+            return self._executor
+
+    def submit(self, job_id):
+        if setting('JOB_QUEUE_EAGER', False):
+            run_job(job_id)
+        else:
+            self.executor.submit(self._run_in_thread, job_id)
+
+    def shutdown(self, wait=True):
+        """Stop the pool, by default after running everything submitted so far."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def _run_in_thread(self, job_id):
+        try:
+            run_job(job_id)
+        except Exception:
+            logger.exception('Job %s crashed the runner', job_id)
+        finally:
+            # Worker threads outlive requests, so close their connection here.
+            connection.close()
+
+
+worker = JobWorker()
+
+
+def enqueue(task_name, item=None, **payload):
+    if task_name not in TASKS:
+        raise ValueError(f'Unknown task: {task_name}')
+    job = Job.objects.create(task=task_name, item=item, payload=payload)
+    transaction.on_commit(lambda: worker.submit(job.pk))
+    return job
+
+
+def enqueue_many(task_name, items):
+    """enqueue() for one job per item, inserted with a single bulk_create."""
+    if task_name not in TASKS:
+        raise ValueError(f'Unknown task: {task_name}')
+    jobs = Job.objects.bulk_create([Job(task=task_name, item=item) for item in items])
+    transaction.on_commit(lambda: [worker.submit(job.pk) for job in jobs])
+    return jobs
+
+
+def claim(job_id):
+    """Atomically move a queued job to running; False if someone else has it."""
+    return Job.objects.filter(pk=job_id, status='queued').update(
+        status='running', started_at=timezone.now(), attempts=models.F('attempts') + 1
+    ) == 1
+
+
+def run_job(job_id):
+    if not claim(job_id):
+        return
+    job = Job.objects.select_related('item').get(pk=job_id)
+    try:
+        TASKS[job.task](job)
+    except Exception:
+        retry = job.attempts < setting('JOB_QUEUE_MAX_ATTEMPTS', 3)
+        job.status = 'queued' if retry else 'failed'
+        job.last_error = traceback.format_exc()
+        job.finished_at = None if retry else timezone.now()
+        job.save(update_fields=['status', 'last_error', 'finished_at'])
+        if retry:
+            worker.submit(job.pk)
+        else:
+            on_failure = getattr(TASKS[job.task], 'on_failure', None)
+            if on_failure:
+                on_failure(job)
+        return
+    job.status = 'done'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'finished_at'])
+
+
+def recover_jobs(inline=False):
+    """Requeue abandoned jobs and submit (or, inline, run) everything queued.
+
+    Returns the number of jobs picked up.
+    """
+    lease = timedelta(seconds=setting('JOB_QUEUE_LEASE_SECONDS', 600))
+    Job.objects.filter(status='running', started_at__lt=timezone.now() - lease).update(status='queued')
+    job_ids = list(Job.objects.filter(status='queued').order_by('created_at').values_list('pk', flat=True))
+    for job_id in job_ids:
+        if inline:
+            run_job(job_id)
+        else:
+            worker.submit(job_id)
+    return len(job_ids)
+
+
+def start_recovery():
+    """Run recover_jobs() off the startup path; used by the server entry points."""
+    def recover():
+        close_old_connections()
+        try:
+            count = recover_jobs()
+            if count:
+                logger.info('Resubmitted %s background jobs', count)
+        except DatabaseError:
+            # Typically an unmigrated database; jobs will wait for run_jobs.
+            logger.warning('Background job recovery skipped', exc_info=True)
+        finally:
+            connection.close()
+    threading.Thread(target=recover, name='jobs-recovery', daemon=True).start()
+
+
+def set_media_status(item, status):
+    item.media_status = status
+    # save() rather than update() so post_save invalidates cached responses.
+    item.save(update_fields=['media_status'])
+
+
+@task('process_item_images')
+def process_item_images_job(job):
+    from .images import process_item_images
+    item = job.item
+    if item is None:
+        return
+    set_media_status(item, 'processing')
+    process_item_images(item)
+    set_media_status(item, 'ready')
+
+
+def process_item_images_failed(job):
+    item = Item.objects.filter(pk=job.item_id).first()
+    if item is not None:
+        set_media_status(item, 'failed')
+
+
+process_item_images_job.on_failure = process_item_images_failed
+
+
+@task('find_trade_cycles')
+def find_trade_cycles_job(job):
+    from .trades import propose_cycles_through
+    propose_cycles_through(job.payload['swap_id'])
+
+
+@task('match_saved_searches')
+def match_saved_searches_job(job):
+    from .saved_searches import notify
+    # One job per created item, or one for a whole bulk import.
+    notify(job.payload.get('item_ids') or [job.item_id])
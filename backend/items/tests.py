@@ -1,3 +1,1817 @@
-from django.test import TestCase
+import asyncio
+import gc
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import warnings
+import zipfile
+from datetime import timedelta
+from itertools import permutations
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from PIL import Image
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, models
+from django.db.utils import ConnectionHandler
+from django.test import AsyncRequestFactory, Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend import instrumentation
+from backend.routers import ReadReplicaRouter, replica_reads
+from signup.models import User
+from . import ledger, loadtest, recommendations, saved_searches, stats, tasks, trades
+from .models import (
+    Item, ItemImage, Job, PointsAccount, PointsTransaction, SavedSearch, SearchNotification, Swap, SwapMessage,
+    TradeCycle, UserStats,
+)
+from .images import VARIANT_FORMATS, VARIANT_SIZES, process_item_images
+from .media import variant_names
+from .pagination import KeysetPagination
+from .search import get_search_backend
+from .realtime import message_waiters
+from .caching import CATALOG_SCOPE, fill_reads, get_version, item_scope
+from .views import browse_items, filter_items
+
+
+def make_user(email='owner@example.com'):
+    return User.objects.create(email=email, username=email, full_name='Test Owner')
+
+
+def make_item(owner, images=2, **kwargs):
+    fields = {
+        'title': 'Denim jacket',
+        'description': 'Barely worn',
+        'category': 'jackets',
+        'brand': 'Levis',
+        'size': 'M',
+        'condition': 'good',
+        'points': 30,
+    }
+    fields.update(kwargs)
+    item = Item.objects.create(owner=owner, **fields)
+    for n in range(images):
+        ItemImage.objects.create(item=item, image=f'item_photos/{item.pk}_{n}.jpg')
+    return item
+
+
+class ListQueryCountTests(TestCase):
+    """Every list endpoint must issue the same number of queries for 1 row or 20."""
+
+    endpoints = ['/api/items/', '/api/my-items/', '/api/available-items/']
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_queries_do_not_scale_with_rows(self):
+        make_item(self.user)
+        small = {url: self.count_queries(url) for url in self.endpoints}
+        for _ in range(19):
+            make_item(self.user)
+        for url in self.endpoints:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), small[url])
+
+    def test_images_are_absolute_urls(self):
+        make_item(self.user, images=1)
+        data = self.client.get('/api/items/').json()
+        self.assertTrue(data[0]['images'][0].startswith('http://testserver/media/'))
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.items = [make_item(self.user, images=0) for _ in range(5)]
+        # Force ties on created_at so the id tiebreaker is exercised.
+        Item.objects.filter(pk__in=[i.pk for i in self.items[1:4]]).update(
+            created_at=self.items[0].created_at
+        )
+        self.client = APIClient()
+
+    def test_unpaginated_request_returns_list(self):
+        data = self.client.get('/api/items/').json()
+        self.assertIsInstance(data, list)
+        self.assertEqual(len(data), 5)
+
+    def test_walk_pages_without_gaps_or_duplicates(self):
+        seen = []
+        url = '/api/items/?page_size=2'
+        while url:
+            data = self.client.get(url).json()
+            self.assertLessEqual(len(data['results']), 2)
+            seen.extend(row['id'] for row in data['results'])
+            url = data['next']
+        expected = list(Item.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(KeysetPagination, 'max_page_size', 3):
+            data = self.client.get('/api/items/?page_size=100000').json()
+        self.assertEqual(len(data['results']), 3)
+        self.assertIsNotNone(data['next_cursor'])
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get('/api/items/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class ItemSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client = APIClient()
+
+    def search(self, query):
+        return [row['title'] for row in self.client.get('/api/items/', {'search': query}).json()]
+
+    def test_prefix_matching_across_fields(self):
+        make_item(self.user, images=0, title='Wool sweater', category='knitwear', brand='Uniqlo')
+        make_item(self.user, images=0, title='Denim jacket', tags='vintage,blue')
+        self.assertEqual(self.search('swea'), ['Wool sweater'])
+        self.assertEqual(self.search('knit'), ['Wool sweater'])
+        self.assertEqual(self.search('vint'), ['Denim jacket'])
+        self.assertEqual(self.search('denim vint'), ['Denim jacket'])
+        self.assertEqual(self.search('denim knit'), [])
+
+    def test_index_follows_updates_and_deletes(self):
+        item = make_item(self.user, images=0, title='Linen shirt')
+        item.title = 'Silk blouse'
+        item.save()
+        self.assertEqual(self.search('linen'), [])
+        self.assertEqual(self.search('silk'), ['Silk blouse'])
+        item.delete()
+        self.assertEqual(self.search('silk'), [])
+
+    def test_results_are_ranked(self):
+        make_item(self.user, images=0, title='Plain tee', description='Goes with a red scarf')
+        make_item(self.user, images=0, title='Red red dress', description='Red', tags='red')
+        self.assertEqual(self.search('red')[0], 'Red red dress')
+
+    def test_fts_syntax_is_treated_as_text(self):
+        make_item(self.user, images=0, title='Denim jacket')
+        self.assertEqual(self.search('"denim" (jack*'), ['Denim jacket'])
+
+    def test_paginated_search_keeps_relevance_order(self):
+        for n in range(1, 8):
+            # More mentions rank higher under bm25; the least relevant is newest.
+            make_item(self.user, images=0, title=f'Item {n}', description=' '.join(['red'] * (8 - n) + ['plain'] * n))
+        make_item(self.user, images=0, title='Unrelated')
+        seen, url = [], '/api/items/?search=red&page_size=3'
+        while url:
+            data = self.client.get(url).json()
+            seen += [row['title'] for row in data['results']]
+            url = data['next']
+        self.assertEqual(seen, self.search('red'))
+        ranked = get_search_backend().search(Item.objects.all(), 'red')
+        self.assertEqual(seen, [item.title for item in ranked])
+        self.assertEqual(seen, [f'Item {n}' for n in range(1, 8)])
+
+
+class ItemFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        make_item(self.user, images=0, category='tops', size='S', condition='good', brand='Zara')
+        make_item(self.user, images=0, category='tops', size='M', condition='new', brand='Nike')
+        make_item(self.user, images=0, category='shoes', size='M', condition='good', brand='Nike', title='Runner')
+        self.client = APIClient()
+
+    def test_counts_for_every_facet_in_one_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/api/items/facets/').json()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(data['category'], {'tops': 2, 'shoes': 1})
+        self.assertEqual(data['size'], {'S': 1, 'M': 2})
+        self.assertEqual(data['condition'], {'good': 2, 'new': 1})
+        self.assertEqual(data['brand'], {'Zara': 1, 'Nike': 2})
+
+    def test_facet_ignores_its_own_filter_only(self):
+        data = self.client.get('/api/items/facets/', {'category': 'tops', 'search': 'denim'}).json()
+        self.assertEqual(data['category'], {'tops': 2})
+        self.assertEqual(data['brand'], {'Zara': 1, 'Nike': 1})
+        self.assertEqual(data['size'], {'S': 1, 'M': 1})
+
+    def test_equivalent_filters_share_cache_entry(self):
+        self.client.get('/api/items/facets/', {'size': 'M,S', 'brand': 'nike'})
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/items/facets/', {'size': 'S, M', 'brand': 'NIKE'})
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.item = make_item(self.user, images=1)
+        self.client = APIClient()
+
+    def test_unchanged_listing_revalidates_without_queries(self):
+        first = self.client.get('/api/items/', {'size': 'M'})
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get('/api/items/', {'size': ' M'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+    def test_repeat_listing_is_served_from_cache(self):
+        self.client.get('/api/items/')
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/items/')
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(response.json()[0]['id'], self.item.pk)
+
+    def test_item_write_invalidates_listing_and_detail(self):
+        listing = self.client.get('/api/items/')
+        detail = self.client.get(f'/api/items/{self.item.pk}/')
+        ItemImage.objects.create(item=self.item, image='item_photos/extra.jpg')
+        listing_again = self.client.get('/api/items/', HTTP_IF_NONE_MATCH=listing['ETag'])
+        detail_again = self.client.get(f'/api/items/{self.item.pk}/', HTTP_IF_NONE_MATCH=detail['ETag'])
+        self.assertEqual(listing_again.status_code, 200)
+        self.assertEqual(len(detail_again.json()['images']), 2)
+
+    def test_detail_cache_is_scoped_to_its_item(self):
+        other = make_item(self.user, images=0)
+        detail = self.client.get(f'/api/items/{self.item.pk}/')
+        other.title = 'Renamed'
+        other.save()
+        response = self.client.get(f'/api/items/{self.item.pk}/', HTTP_IF_NONE_MATCH=detail['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_entries_are_filled_from_the_primary_just_after_a_write(self):
+        router = ReadReplicaRouter()
+        cache.clear()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # overriding DATABASES warns
+            with override_settings(DATABASES={**settings.DATABASES, 'replica': {}}):
+                with replica_reads(), fill_reads(CATALOG_SCOPE):
+                    self.assertEqual(router.db_for_read(Item), 'replica')
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.item.save()
+                # The replica may not have this write yet; don't cache from it.
+                with replica_reads(), fill_reads(CATALOG_SCOPE):
+                    self.assertIsNone(router.db_for_read(Item))
+                with replica_reads(), fill_reads(item_scope(0)):
+                    self.assertEqual(router.db_for_read(Item), 'replica')
+
+
+class SwapEventStreamTests(TestCase):
+    def setUp(self):
+        self.proposer = make_user('proposer@example.com')
+        self.receiver = make_user('receiver@example.com')
+        self.swap = Swap.objects.create(
+            proposer=self.proposer, receiver=self.receiver,
+            proposer_item=make_item(self.proposer, images=0),
+            receiver_item=make_item(self.receiver, images=0),
+        )
+        self.token = str(AccessToken.for_user(self.receiver))
+
+    async def next_event(self, stream):
+        chunk = await asyncio.wait_for(stream.__anext__(), 1)
+        return chunk.decode()
+
+    async def test_pushes_messages_and_status_changes(self):
+        response = await self.async_client.get(f'/api/swaps/{self.swap.pk}/events/', {'token': self.token})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertTrue((await self.next_event(stream)).startswith('retry:'))
+
+        def write():
+            with self.captureOnCommitCallbacks(execute=True):
+                SwapMessage.objects.create(swap=self.swap, sender=self.proposer, content='Still available?')
+            with self.captureOnCommitCallbacks(execute=True):
+                swap = Swap.objects.get(pk=self.swap.pk)
+                swap.status = 'accepted'
+                swap.save()
+        await sync_to_async(write)()
+
+        message = await self.next_event(stream)
+        self.assertIn('event: message', message)
+        self.assertIn('Still available?', message)
+        self.assertIn('"sender_name": "Test Owner"', message)
+        self.assertIn('"status": "accepted"', await self.next_event(stream))
+        await stream.aclose()
+
+    async def test_replays_messages_after_last_event_id(self):
+        def write():
+            return [SwapMessage.objects.create(swap=self.swap, sender=self.proposer, content=f'm{n}').pk
+                    for n in range(3)]
+        ids = await sync_to_async(write)()
+        response = await self.async_client.get(f'/api/swaps/{self.swap.pk}/events/', {'token': self.token},
+                                               headers={'Last-Event-ID': str(ids[0])})
+        stream = response.streaming_content
+        await self.next_event(stream)
+        self.assertIn(f'id: {ids[1]}', await self.next_event(stream))
+        self.assertIn(f'id: {ids[2]}', await self.next_event(stream))
+        await stream.aclose()
+
+    async def test_rejects_non_participants(self):
+        outsider = await sync_to_async(make_user)('outsider@example.com')
+        response = await self.async_client.get(f'/api/swaps/{self.swap.pk}/events/',
+                                               {'token': str(AccessToken.for_user(outsider))})
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(f'/api/swaps/{self.swap.pk}/events/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_messages_without_subscribers_are_not_serialized(self):
+        with mock.patch('items.realtime.message_payload') as payload:
+            with self.captureOnCommitCallbacks(execute=True):
+                SwapMessage.objects.create(swap=self.swap, sender_id=self.proposer.pk, content='Anyone there?')
+        payload.assert_not_called()
+
+    def test_wsgi_requests_get_501(self):
+        response = Client().get(f'/api/swaps/{self.swap.pk}/events/', {'token': self.token})
+        self.assertEqual(response.status_code, 501)
+
+
+def make_swap(proposer, receiver):
+    return Swap.objects.create(
+        proposer=proposer, receiver=receiver,
+        proposer_item=make_item(proposer, images=0),
+        receiver_item=make_item(receiver, images=0),
+    )
+
+
+class SwapMessageHistoryTests(TestCase):
+    def setUp(self):
+        self.proposer = make_user('proposer@example.com')
+        self.receiver = make_user('receiver@example.com')
+        self.swap = make_swap(self.proposer, self.receiver)
+        self.messages = [
+            SwapMessage.objects.create(swap=self.swap, sender=sender, content=f'm{n}')
+            for n, sender in enumerate([self.proposer, self.receiver] * 3)
+        ]
+        self.url = f'/api/swaps/{self.swap.pk}/messages/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.receiver)
+
+    def test_after_id_returns_only_newer_messages(self):
+        data = self.client.get(self.url, {'after_id': self.messages[3].pk}).json()
+        self.assertEqual([m['content'] for m in data], ['m4', 'm5'])
+
+    def test_since_returns_only_newer_messages(self):
+        SwapMessage.objects.filter(pk=self.messages[5].pk).update(
+            created_at=self.messages[4].created_at + timedelta(seconds=5)
+        )
+        since = (self.messages[4].created_at + timedelta(seconds=1)).isoformat()
+        data = self.client.get(self.url, {'since': since}).json()
+        self.assertEqual([m['content'] for m in data], ['m5'])
+
+    def test_invalid_cursor_values_are_400(self):
+        self.assertEqual(self.client.get(self.url, {'after_id': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'since': 'yesterday'}).status_code, 400)
+        response = self.client.get(self.url, {'since': '2024-13-45T25:00:00Z'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('since', response.json())
+
+    def test_sender_names_do_not_cost_a_query_each(self):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get(self.url).json()
+        self.assertEqual(len(data), 6)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_long_poll_times_out_with_empty_list(self):
+        started = time.monotonic()
+        data = self.client.get(self.url, {'after_id': self.messages[-1].pk, 'wait': '0.3'}).json()
+        self.assertEqual(data, [])
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(message_waiters._counters, {})
+
+
+class SwapMessageLongPollTests(TransactionTestCase):
+    def test_long_poll_wakes_on_new_message(self):
+        proposer = make_user('proposer@example.com')
+        receiver = make_user('receiver@example.com')
+        swap = make_swap(proposer, receiver)
+        client = APIClient()
+        client.force_authenticate(receiver)
+
+        def post_later():
+            time.sleep(0.2)
+            SwapMessage.objects.create(swap=swap, sender=proposer, content='Hello')
+            connection.close()
+
+        writer = threading.Thread(target=post_later)
+        writer.start()
+        started = time.monotonic()
+        # A long recheck interval proves the wake-up comes from the notification.
+        with mock.patch('items.views.LONG_POLL_RECHECK_SECONDS', 10):
+            data = client.get(f'/api/swaps/{swap.pk}/messages/', {'after_id': 0, 'wait': 20}).json()
+        writer.join()
+        self.assertEqual([m['content'] for m in data], ['Hello'])
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(message_waiters._counters, {})
+
+    def test_notify_without_waiters_keeps_nothing(self):
+        for swap_id in range(100):
+            message_waiters.notify(swap_id)
+        self.assertEqual(message_waiters._counters, {})
+
+
+class SwapListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_swaps(self, count):
+        for n in range(count):
+            other = make_user(f'other{Swap.objects.count()}@example.com')
+            swap = make_swap(other, self.user)
+            swap.is_read = n % 2 == 0
+            swap.save()
+
+    def count_queries(self, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/api/swaps/', params or {}).json()
+        return len(ctx.captured_queries), data
+
+    def test_queries_do_not_scale_with_swaps(self):
+        self.add_swaps(2)
+        small, _ = self.count_queries()
+        self.add_swaps(10)
+        large, data = self.count_queries()
+        self.assertEqual(small, large)
+        self.assertEqual(large, 2)
+        self.assertEqual(len(data['swaps']), 12)
+        self.assertEqual(data['unread_count'], 6)
+
+    def test_items_are_serialized_once_with_details(self):
+        self.add_swaps(1)
+        swap = self.client.get('/api/swaps/').json()['swaps'][0]
+        self.assertNotIn('proposer_item', swap)
+        self.assertEqual(len(swap['proposer_item_detail']['images']), 0)
+        self.assertEqual(swap['receiver_item_detail']['owner'], self.user.pk)
+
+    def test_paginated_unread_count_covers_all_swaps(self):
+        self.add_swaps(5)
+        first = self.client.get('/api/swaps/', {'page_size': 2}).json()
+        self.assertEqual(len(first['swaps']), 2)
+        self.assertEqual(first['unread_count'], 2)
+        rest = self.client.get(first['next']).json()
+        self.assertEqual(rest['unread_count'], 2)
+
+
+def jpeg_upload(name='photo.jpg', size=(1600, 1200)):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(JOB_QUEUE_EAGER=True)
+    def test_upload_generates_resized_jpeg_and_webp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/items/', {
+                'title': 'Red coat', 'description': 'Warm', 'category': 'jackets', 'condition': 'good',
+                'images': [jpeg_upload('a.jpg'), jpeg_upload('b.jpg', (300, 200))],
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['media_status'], 'pending')
+        large, small = ItemImage.objects.order_by('pk')
+        self.assertEqual(set(large.variants), set(VARIANT_SIZES))
+        for size, edge in VARIANT_SIZES.items():
+            for fmt, name in large.variants[size].items():
+                with default_storage.open(name) as fh, Image.open(fh) as variant:
+                    self.assertEqual(max(variant.size), edge)
+                    self.assertEqual(variant.format, VARIANT_FORMATS[fmt][0])
+        with default_storage.open(small.variants['medium']['webp']) as fh, Image.open(fh) as variant:
+            self.assertEqual(variant.size, (300, 200))  # never upscaled
+
+        data = self.client.get(f'/api/items/{large.item_id}/').json()
+        self.assertEqual(data['media_status'], 'ready')
+        self.assertEqual(len(data['image_variants']), 2)
+        self.assertTrue(data['image_variants'][0]['thumb']['webp'].startswith('http://testserver/media/'))
+        self.assertEqual(data['photo_variants'], {})
+
+    @override_settings(JOB_QUEUE_EAGER=True)
+    def test_photo_only_upload_is_pending_until_processed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/items/', {
+                'title': 'Blue scarf', 'description': 'Wool', 'category': 'accessories', 'condition': 'good',
+                'photo': jpeg_upload('cover.jpg'),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['media_status'], 'pending')
+        data = self.client.get(f"/api/items/{response.json()['id']}/").json()
+        self.assertEqual(data['media_status'], 'ready')
+        self.assertEqual(set(data['photo_variants']), set(VARIANT_SIZES))
+
+    def test_backfill_command_processes_existing_rows(self):
+        item = make_item(self.user, images=0, photo=jpeg_upload('cover.jpg'))
+        image = ItemImage.objects.create(item=item, image=jpeg_upload())
+        ItemImage.objects.create(item=item, image='item_photos/missing.jpg')
+        call_command('backfill_image_variants', stdout=StringIO(), stderr=StringIO())
+        item.refresh_from_db()
+        image.refresh_from_db()
+        self.assertEqual(set(item.photo_variants), set(VARIANT_SIZES))
+        self.assertEqual(set(image.variants), set(VARIANT_SIZES))
+        self.assertEqual(ItemImage.objects.filter(variants={}).count(), 1)
+
+    def test_regenerating_deletes_variants_no_row_uses(self):
+        first = make_item(self.user, images=0, photo=jpeg_upload('cover.jpg'))
+        second = make_item(self.user, images=0, photo=jpeg_upload('cover.jpg'))
+        process_item_images(first)
+        process_item_images(second)
+        second.refresh_from_db()
+        old = variant_names(second.photo_variants)
+        self.assertEqual(old, variant_names(first.photo_variants))  # stored once, shared
+
+        first.photo = jpeg_upload('new.jpg', (900, 700))
+        first.save()
+        process_item_images(first)
+        self.assertTrue(all(default_storage.exists(name) for name in old))  # second still uses them
+
+        second.photo = jpeg_upload('new.jpg', (900, 700))
+        second.save()
+        process_item_images(second)
+        self.assertFalse(any(default_storage.exists(name) for name in old))
+        self.assertTrue(all(default_storage.exists(name) for name in variant_names(second.photo_variants)))
+
+
+@tasks.task('test_flaky')
+def flaky_job(job):
+    if job.attempts < job.payload['succeed_on']:
+        raise RuntimeError('try again')
+
+
+@override_settings(JOB_QUEUE_EAGER=True, JOB_QUEUE_MAX_ATTEMPTS=3)
+class JobQueueTests(TestCase):
+    def test_job_runs_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            job = tasks.enqueue('test_flaky', succeed_on=1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        for callback in callbacks:
+            callback()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('done', 1))
+
+    def test_failures_retry_then_give_up(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            retried = tasks.enqueue('test_flaky', succeed_on=2)
+            failed = tasks.enqueue('test_flaky', succeed_on=5)
+        retried.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual((retried.status, retried.attempts), ('done', 2))
+        self.assertEqual((failed.status, failed.attempts), ('failed', 3))
+        self.assertIn('try again', failed.last_error)
+
+    def test_job_is_claimed_only_once(self):
+        job = Job.objects.create(task='test_flaky', payload={'succeed_on': 1})
+        self.assertTrue(tasks.claim(job.pk))
+        self.assertFalse(tasks.claim(job.pk))
+
+    def test_recovery_resubmits_queued_and_abandoned_jobs(self):
+        queued = Job.objects.create(task='test_flaky', payload={'succeed_on': 1})
+        abandoned = Job.objects.create(task='test_flaky', payload={'succeed_on': 1}, status='running',
+                                       started_at=timezone.now() - timedelta(hours=1))
+        running = Job.objects.create(task='test_flaky', payload={'succeed_on': 1}, status='running',
+                                     started_at=timezone.now())
+        self.assertEqual(tasks.recover_jobs(), 2)
+        statuses = dict(Job.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {queued.pk: 'done', abandoned.pk: 'done', running.pk: 'running'})
+
+    def test_failed_image_job_marks_item(self):
+        item = make_item(make_user(), images=0, media_status='pending')
+        with mock.patch('items.images.process_item_images', side_effect=OSError('disk full')):
+            with self.captureOnCommitCallbacks(execute=True):
+                tasks.enqueue('process_item_images', item=item)
+        item.refresh_from_db()
+        self.assertEqual(item.media_status, 'failed')
+
+
+class JobWorkerThreadTests(TransactionTestCase):
+    def test_pool_runs_jobs_off_the_request_thread(self):
+        job = tasks.enqueue('test_flaky', succeed_on=1)
+        deadline = time.monotonic() + 5
+        while Job.objects.get(pk=job.pk).status != 'done' and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'done')
+
+
+def zip_upload(members):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return SimpleUploadedFile('images.zip', buffer.getvalue(), content_type='application/zip')
+
+
+class BulkItemImportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = make_user()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, manifest, name='items.jsonl', archive=None):
+        data = {'manifest': SimpleUploadedFile(name, manifest.encode())}
+        if archive is not None:
+            data['archive'] = archive
+        response = self.client.post('/api/items/bulk/', data, format='multipart')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        return response.status_code, [json.loads(line) for line in lines]
+
+    def jsonl(self, count, **extra):
+        row = {'title': 'Tee', 'description': 'Cotton', 'category': 'tops', 'condition': 'good', **extra}
+        return '\n'.join(json.dumps(row) for _ in range(count))
+
+    def test_jsonl_with_archive(self):
+        archive = zip_upload({'photos/a.jpg': jpeg_upload().read()})
+        status_code, results = self.post(self.jsonl(2, images=['photos/a.jpg']), archive=archive)
+        self.assertEqual(status_code, 201)
+        self.assertEqual([r['status'] for r in results], ['created', 'created'])
+        items = Item.objects.order_by('pk')
+        self.assertEqual([i.points for i in items], [30, 30])
+        self.assertEqual([i.owner_id for i in items], [self.user.pk] * 2)
+        self.assertEqual(ItemImage.objects.count(), 2)
+        # The same image twice is stored once, under its content hash.
+        self.assertEqual(len({i.image.name for i in ItemImage.objects.all()}), 1)
+        self.assertRegex(ItemImage.objects.first().image.name, r'^item_photos/[0-9a-f]{2}/[0-9a-f]{32}\.jpg$')
+        self.assertEqual(Job.objects.filter(task='process_item_images').count(), 2)
+
+    def test_csv_manifest(self):
+        manifest = 'title,description,category,condition,brand,images\nCoat,Warm,jackets,vintage,COS,\n'
+        status_code, results = self.post(manifest, name='items.csv')
+        self.assertEqual(status_code, 201)
+        item = Item.objects.get(pk=results[0]['id'])
+        self.assertEqual((item.brand, item.points, item.media_status), ('COS', 40, 'ready'))
+
+    def test_invalid_row_rejects_whole_batch(self):
+        rows = self.jsonl(1) + '\n' + json.dumps({'title': 'No category', 'description': 'x', 'condition': 'good',
+                                                  'images': ['missing.jpg']})
+        status_code, results = self.post(rows, archive=zip_upload({'a.jpg': b'not an image'}))
+        self.assertEqual(status_code, 400)
+        self.assertEqual(results[0], {'row': 1, 'status': 'valid'})
+        self.assertEqual(results[1]['status'], 'invalid')
+        self.assertIn('category', results[1]['errors'])
+        self.assertIn('missing.jpg: not found in archive.', results[1]['errors']['images'])
+        self.assertFalse(Item.objects.exists())
+
+    def test_unreadable_images_are_row_errors(self):
+        image = jpeg_upload().read()
+        corrupt = zip_upload({'crc.jpg': image}).read()
+        # Flip a byte of the stored member: its CRC no longer matches.
+        offset = corrupt.index(image) + len(image) // 2
+        corrupt = corrupt[:offset] + bytes([corrupt[offset] ^ 0xFF]) + corrupt[offset + 1:]
+        status_code, results = self.post(self.jsonl(1, images=['crc.jpg']),
+                                         archive=SimpleUploadedFile('images.zip', corrupt))
+        self.assertEqual(status_code, 400)
+        self.assertEqual(results[0]['errors']['images'], ['crc.jpg: cannot be read from the archive.'])
+
+        archive = zip_upload({'ok.jpg': jpeg_upload('ok.jpg', (20, 20)).read(),
+                              'bomb.jpg': jpeg_upload('bomb.jpg', (200, 200)).read()})
+        with mock.patch('PIL.Image.MAX_IMAGE_PIXELS', 5000):
+            status_code, results = self.post(self.jsonl(1, images=['ok.jpg', 'bomb.jpg']), archive=archive)
+        self.assertEqual(status_code, 400)
+        self.assertEqual(results[0]['errors']['images'], ['bomb.jpg: not a valid image.'])
+        self.assertFalse(Item.objects.exists())
+        # Images stored while validating a rejected batch are removed again.
+        self.assertEqual([files for _, _, files in os.walk(settings.MEDIA_ROOT) if files], [])
+
+    def test_queries_do_not_scale_with_rows(self):
+        def count(rows):
+            with CaptureQueriesContext(connection) as ctx:
+                status_code, _ = self.post(self.jsonl(rows))
+            self.assertEqual(status_code, 201)
+            return len(ctx.captured_queries)
+        self.assertEqual(count(2), count(20))
+
+
+class ItemAvailabilityTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = make_user()
+        self.other = make_user('other@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+    def available_ids(self):
+        return {item['id'] for item in self.client.get('/api/available-items/').json()}
+
+    def test_swap_status_changes_lock_and_release_items(self):
+        free = make_item(self.owner, images=0)
+        swap = make_swap(self.owner, self.other)
+        self.assertEqual(self.available_ids(), {free.pk})
+        self.assertEqual(Item.objects.get(pk=swap.receiver_item_id).active_swap_count, 1)
+
+        swap.status = 'declined'
+        swap.save()
+        self.assertEqual(self.available_ids(), {free.pk, swap.proposer_item_id})
+        self.assertEqual(Item.objects.get(pk=swap.receiver_item_id).active_swap_count, 0)
+
+        swap.status = 'accepted'
+        swap.save()
+        self.assertEqual(self.available_ids(), {free.pk})
+        swap.delete()
+        self.assertEqual(self.available_ids(), {free.pk, swap.proposer_item_id})
+
+    def test_item_stays_locked_until_every_active_swap_ends(self):
+        first = make_swap(self.owner, self.other)
+        second = Swap.objects.create(
+            proposer=self.owner, receiver=self.other,
+            proposer_item=first.proposer_item, receiver_item=make_item(self.other, images=0),
+        )
+        self.assertEqual(Item.objects.get(pk=first.proposer_item_id).active_swap_count, 2)
+        first.status = 'cancelled'
+        first.save()
+        self.assertNotIn(first.proposer_item_id, self.available_ids())
+        second.delete()
+        self.assertIn(first.proposer_item_id, self.available_ids())
+
+    def test_repointed_swap_releases_old_item(self):
+        swap = make_swap(self.owner, self.other)
+        old_item = swap.proposer_item
+        swap = Swap.objects.get(pk=swap.pk)
+        swap.proposer_item = make_item(self.owner, images=0)
+        swap.save()
+        self.assertEqual(self.available_ids(), {old_item.pk})
+
+    def test_saves_that_change_no_count_leave_the_catalog_cached(self):
+        swap = Swap.objects.get(pk=make_swap(self.owner, self.other).pk)
+        version = get_version(CATALOG_SCOPE)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.patch(f'/api/swaps/{swap.pk}/', {'is_read': True})
+            self.client.patch(f'/api/swaps/{swap.pk}/', {'status': 'accepted'})
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "items_item"')])
+        self.assertEqual(get_version(CATALOG_SCOPE), version)
+        self.client.patch(f'/api/swaps/{swap.pk}/', {'status': 'cancelled'})
+        self.assertNotEqual(get_version(CATALOG_SCOPE), version)
+        self.assertEqual(Item.objects.get(pk=swap.proposer_item_id).active_swap_count, 0)
+
+    def test_queries_do_not_scale_with_swaps(self):
+        def count():
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get('/api/available-items/')
+            return len(ctx.captured_queries)
+        make_swap(self.owner, self.other)
+        small = count()
+        for _ in range(10):
+            make_swap(self.owner, self.other)
+        self.assertEqual(small, count())
+
+
+# "SCAN <table>" reads every row of the table, or of the named index when it
+# ends in "USING [COVERING] INDEX <name>". FTS lookups ("VIRTUAL TABLE") are
+# not scans of a Django table.
+TABLE_SCAN = re.compile(r'^SCAN (TABLE )?(?P<table>\S+)( AS \S+)?( USING (COVERING )?INDEX (?P<index>\S+))?$')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output is SQLite specific')
+class QueryPlanTests(TestCase):
+    """Fails when an endpoint's SQL plans a full table (or whole index) scan."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.other = make_user('other@example.com')
+        self.swap = make_swap(self.other, self.user)
+        SwapMessage.objects.create(swap=self.swap, sender=self.other, content='Hi')
+        make_item(self.user, images=1, category='tops', brand='Levi', size='M', condition='good')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def full_scans(self, queries, allowed_indexes):
+        scans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if not query['sql'].lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                for row in cursor.fetchall():
+                    match = TABLE_SCAN.match(row[-1])
+                    if match and match['index'] not in allowed_indexes:
+                        scans.append(f"{row[-1]}\n    in: {query['sql']}")
+        return scans
+
+    def assertNoFullScans(self, fetch, allowed_indexes=()):
+        """``allowed_indexes`` names indexes whose full walk is the intended plan."""
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            response = fetch()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(ctx.captured_queries)
+        scans = self.full_scans(ctx.captured_queries, set(allowed_indexes))
+        self.assertFalse(scans, 'Full scans:\n' + '\n'.join(scans))
+
+    def test_item_listings(self):
+        factory = APIRequestFactory()
+        unfiltered = [{}, {'page_size': 24}]
+        filtered = [
+            {'category': 'Tops'}, {'brand': 'levi'}, {'size': 'M,L'}, {'condition': 'good,new'},
+            {'search': 'denim'}, {'category': 'tops', 'page_size': 24}, {'brand': 'Levi', 'size': 'M'},
+        ]
+        for params in unfiltered + filtered:
+            # The unfiltered listing walks the keyset index; a LIMIT bounds it when paginated.
+            allowed = ['item_created_id_idx'] if params in unfiltered else []
+            with self.subTest(params=params):
+                self.assertNoFullScans(lambda: self.client.get('/api/items/', params), allowed)
+                self.assertNoFullScans(lambda: browse_items(factory.get('/api/browse/', params)), allowed)
+
+    def test_owner_listings(self):
+        self.assertNoFullScans(lambda: self.client.get('/api/my-items/'))
+        self.assertNoFullScans(lambda: self.client.get('/api/available-items/'))
+
+    def test_swap_list(self):
+        self.assertNoFullScans(lambda: self.client.get('/api/swaps/'))
+        self.assertNoFullScans(lambda: self.client.get('/api/swaps/', {'page_size': 10}))
+
+    def test_swap_messages(self):
+        url = f'/api/swaps/{self.swap.pk}/messages/'
+        self.assertNoFullScans(lambda: self.client.get(url))
+        self.assertNoFullScans(lambda: self.client.get(url, {'after_id': 0}))
+        self.assertNoFullScans(lambda: self.client.get(url, {'since': '2020-01-01T00:00:00Z'}))
+
+
+class SQLiteProductionProfileTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = f'{directory}/db.sqlite3'
+        self.handler = ConnectionHandler({'default': {
+            'ENGINE': 'backend.sqlite', 'NAME': self.path, 'OPTIONS': settings.SQLITE_PRODUCTION_OPTIONS,
+        }})
+        self.connection = self.handler['default']
+        self.addCleanup(self.handler.close_all)
+
+    def pragma(self, name):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_to_new_connections(self):
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('busy_timeout'), 20000)
+        self.assertGreater(self.pragma('mmap_size'), 0)
+
+    def test_transactions_take_the_write_lock_at_begin(self):
+        self.connection.ensure_connection()
+        self.connection.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+        other = sqlite3.connect(self.path, timeout=0)
+        try:
+            with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+                other.execute('BEGIN IMMEDIATE')
+        finally:
+            other.close()
+            self.connection.rollback()
+            self.connection.set_autocommit(True)
+
+    def test_invalid_transaction_mode(self):
+        handler = ConnectionHandler({'default': {
+            'ENGINE': 'backend.sqlite', 'NAME': self.path, 'OPTIONS': {'transaction_mode': 'LAZY'},
+        }})
+        with self.assertRaises(ImproperlyConfigured):
+            handler['default'].ensure_connection()
+
+
+class ReadReplicaRouterTests(TestCase):
+    def test_only_replica_reads_blocks_are_routed(self):
+        router = ReadReplicaRouter()
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # overriding DATABASES warns
+            with override_settings(DATABASES={**settings.DATABASES, 'replica': {}}):
+                self.assertIsNone(router.db_for_read(Item))
+                with replica_reads():
+                    self.assertEqual(router.db_for_read(Item), 'replica')
+                    self.assertEqual(router.db_for_write(Item), 'default')
+                self.assertIsNone(router.db_for_read(Item))
+        self.assertFalse(router.allow_migrate('replica', 'items'))
+
+    def test_no_replica_configured(self):
+        with replica_reads():
+            self.assertIsNone(ReadReplicaRouter().db_for_read(Item))
+
+
+class LoadTestTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        media_root = override_settings(MEDIA_ROOT=media)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def test_seed_builds_dataset_at_requested_scale(self):
+        scale = loadtest.Scale(users=5, items=20, images_per_item=2, swaps=10, messages=30)
+        dataset = loadtest.seed(scale, random.Random(0))
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(Item.objects.count(), 20)
+        self.assertEqual(ItemImage.objects.count(), 40)
+        self.assertEqual(Swap.objects.count(), len(dataset.swaps))
+        self.assertEqual(SwapMessage.objects.count(), 30 if dataset.swaps else 0)
+        response = loadtest.swaps_list(Client(), dataset, random.Random(0))
+        self.assertEqual(response.status_code, 200)
+
+    def test_compare_flags_latency_query_error_and_request_regressions(self):
+        def result(p95_ms, queries, errors, requests=200):
+            return {'p95_ms': p95_ms, 'queries': queries, 'errors': errors, 'requests': requests}
+        baseline = {'items': result(10.0, 2.0, 0)}
+        self.assertEqual(loadtest.compare({'items': result(12.0, 2.0, 0)}, baseline, 0.25), [])
+        regressions = loadtest.compare({'items': result(20.0, 3.0, 1, requests=150)}, baseline, 0.25)
+        self.assertEqual(len(regressions), 4)
+        self.assertIn('items: requests 200 -> 150', regressions)
+        self.assertEqual(loadtest.compare({'login': result(1.0, 1.0, 0)}, baseline, 0.25), [])
+
+    def test_scenario_exceptions_count_as_errors(self):
+        def flaky(client, dataset, rng):
+            if rng.random() < 0.5:
+                raise RuntimeError('view blew up')
+            return mock.Mock(status_code=200)
+        summary = loadtest.run_scenario(flaky, None, requests=40, concurrency=4)
+        self.assertEqual(summary['requests'], 40)
+        self.assertGreater(summary['errors'], 0)
+        self.assertLess(summary['errors'], 40)
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        instrumentation.metrics.reset()
+        make_item(make_user(), images=2)
+        self.client = APIClient()
+
+    def test_server_timing_reports_queries_and_serializer_time(self):
+        response = self.client.get('/api/items/')
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="2 queries"')
+        self.assertRegex(timing, r'serialize;dur=[\d.]+')
+        self.assertRegex(timing, r'total;dur=[\d.]+')
+
+    def test_metrics_endpoint_aggregates_per_view(self):
+        self.client.get('/api/items/')
+        self.client.get('/api/items/')
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('http_requests_total{view="item-list-create",method="GET",status="200"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{view="item-list-create"} 2', body)
+        # The second request is answered from the response cache.
+        self.assertIn('db_queries_total{view="item-list-create"} 2', body)
+        with override_settings(INSTRUMENTATION_METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
+    def test_repeated_queries_share_a_fingerprint(self):
+        record = instrumentation.RequestRecord()
+        execute = lambda sql, params, many, context: None
+        for pk in range(3):
+            record.execute(execute, 'SELECT * FROM items_itemimage WHERE item_id = %s', [pk], False, {})
+        record.execute(execute, 'SELECT * FROM items_item WHERE id IN (%s, %s)', [1, 2], False, {})
+        record.execute(execute, 'SELECT * FROM items_item WHERE id IN (%s, %s, %s)', [1, 2, 3], False, {})
+        self.assertEqual(record.duplicates(3), {'SELECT * FROM items_itemimage WHERE item_id = %s': 3})
+        self.assertEqual(record.duplicates(2)['SELECT * FROM items_item WHERE id IN (...)'], 2)
+
+    def test_slow_sampled_requests_are_profiled_to_disk(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with override_settings(INSTRUMENTATION_PROFILE_DIR=directory, INSTRUMENTATION_PROFILE_SAMPLE_RATE=1,
+                               INSTRUMENTATION_SLOW_MS=0):
+            self.client.get('/api/items/')
+        files = os.listdir(directory)
+        self.assertEqual(len(files), 1)
+        self.assertTrue(files[0].startswith('item-list-create-'))
+
+    @override_settings(INSTRUMENTATION_ENABLED=False)
+    def test_disabled_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get('/api/items/'))
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.other = make_user('other@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, path):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(path)
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            chunks = list(response.streaming_content)
+        rows = [json.loads(line) for line in b''.join(chunks).decode().splitlines()]
+        return rows, chunks, len(ctx.captured_queries)
+
+    def test_items_stream_in_chunks(self):
+        items = [make_item(self.other, title=f'Item {n}') for n in range(5)]
+        rows, chunks, queries = self.export('/api/items/export/?chunk_size=2')
+        self.assertEqual([row['id'] for row in rows], [item.pk for item in reversed(items)])
+        self.assertEqual(rows[0], self.client.get(f'/api/items/{items[-1].pk}/').json())
+        self.assertEqual(len(chunks), 3)
+        # One cursor over the items, then the images of each chunk.
+        self.assertEqual(queries, 4)
+
+    def test_items_honour_filters(self):
+        make_item(self.other, category='Shoes')
+        make_item(self.other, category='jackets')
+        rows, _, _ = self.export('/api/items/export/?category=shoes')
+        self.assertEqual([row['category'] for row in rows], ['Shoes'])
+
+    def test_my_items_and_swaps_are_scoped_to_the_user(self):
+        mine = make_item(self.user)
+        make_item(self.other)
+        swap = make_swap(self.user, self.other)
+        make_swap(self.other, make_user('third@example.com'))
+        rows, _, _ = self.export('/api/my-items/export/')
+        self.assertEqual({row['id'] for row in rows}, {mine.pk, swap.proposer_item_id})
+        rows, _, queries = self.export('/api/swaps/export/')
+        self.assertEqual([row['id'] for row in rows], [swap.pk])
+        self.assertEqual(rows[0]['receiver_item_detail']['id'], swap.receiver_item_id)
+        self.assertEqual(queries, 3)  # swaps with items, then each side's images
+        self.assertEqual(APIClient().get('/api/swaps/export/').status_code, 401)
+
+    def garbage(self, path):
+        gc.collect()
+        gc.disable()
+        try:
+            list(self.client.get(path).streaming_content)
+            return gc.collect()
+        finally:
+            gc.enable()
+
+    def test_rows_are_freed_without_garbage_collection(self):
+        # Memory stays flat only if each row is freed as soon as it is sent:
+        # the cycles left for the collector must not grow with the row count.
+        paths = ['/api/items/export/?chunk_size=2', '/api/swaps/export/?chunk_size=2']
+        make_swap(self.user, self.other)
+        before = [self.garbage(path) for path in paths]
+        for _ in range(5):
+            make_swap(self.user, self.other)
+        self.assertEqual([self.garbage(path) for path in paths], before)
+
+    def test_asgi_requests_get_an_async_body(self):
+        from .views import export_items
+        make_item(self.other)
+        request = AsyncRequestFactory().get('/api/items/export/')
+        response = export_items(request)
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return [chunk async for chunk in response.streaming_content]
+        # async_to_sync runs the chunk fetches back on this thread, as the
+        # ASGI handler does with the view's thread.
+        self.assertEqual(len(b''.join(async_to_sync(read)()).splitlines()), 1)
+
+
+class MediaStorageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        override = override_settings(MEDIA_ROOT=self.media)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = make_user()
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.media)
+            for directory, _, names in os.walk(self.media) for name in names
+        )
+
+    def test_identical_uploads_are_stored_once(self):
+        first = make_item(self.user, images=0, photo=jpeg_upload('lower.jpg'))
+        second = make_item(self.user, images=0, photo=jpeg_upload('LOWER.JPG'))
+        other = make_item(self.user, images=0, photo=jpeg_upload('other.jpg', (10, 10)))
+        self.assertEqual(first.photo.name, second.photo.name)
+        self.assertRegex(first.photo.name, r'^item_photos/([0-9a-f]{2})/\1[0-9a-f]{30}\.jpg$')
+        self.assertEqual(self.files(), sorted([first.photo.name, other.photo.name]))
+
+    def test_content_addressed_files_are_immutable(self):
+        name = make_item(self.user, images=0, photo=jpeg_upload()).photo.name
+        content = default_storage.open(name).read()
+        response = self.client.get(f'/media/{name}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), content)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        etag = response['ETag']
+        self.assertEqual(etag, '"%s"' % os.path.splitext(os.path.basename(name))[0])
+
+        response = self.client.get(f'/media/{name}', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual((response['ETag'], response['Cache-Control']), (etag, 'public, max-age=31536000, immutable'))
+
+    def test_range_requests(self):
+        name = make_item(self.user, images=0, photo=jpeg_upload()).photo.name
+        content = default_storage.open(name).read()
+        size = len(content)
+
+        def get(value, **headers):
+            return self.client.get(f'/media/{name}', headers={'Range': value, **headers})
+
+        response = get('bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{size}')
+        self.assertEqual(b''.join(response.streaming_content), content[:10])
+        self.assertEqual(b''.join(get('bytes=-5').streaming_content), content[-5:])
+        self.assertEqual(b''.join(get(f'bytes={size - 3}-').streaming_content), content[-3:])
+        response = get(f'bytes={size}-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, f'bytes */{size}'))
+        # Multiple ranges, and ranges for a stale If-Range, get the whole file.
+        self.assertEqual(get('bytes=0-1,4-5').status_code, 200)
+        self.assertEqual(get('bytes=0-9', **{'If-Range': '"stale"'}).status_code, 200)
+
+    def test_legacy_names_are_revalidated(self):
+        with open(os.path.join(self.media, 'lower.jpg'), 'wb') as fh:
+            fh.write(b'jpeg')
+        response = self.client.get('/media/lower.jpg')
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+        self.assertEqual(self.client.get('/media/lower.jpg', headers={'If-None-Match': response['ETag']}).status_code, 304)
+        self.assertEqual(self.client.get('/media/missing.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/../settings.py').status_code, 404)
+
+    def test_only_images_are_served_inline(self):
+        os.makedirs(os.path.join(self.media, 'item_photos'))
+        for name in ('page.html', 'logo.svg', 'item_photos/.upload-abc123'):
+            with open(os.path.join(self.media, name), 'w') as fh:
+                fh.write('<script>alert(1)</script>')
+        for name in ('page.html', 'logo.svg'):
+            response = self.client.get(f'/media/{name}')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], 'application/octet-stream')
+            self.assertEqual(response['Content-Disposition'], 'attachment')
+            self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertEqual(self.client.get('/media/item_photos/.upload-abc123').status_code, 404)
+
+    def test_uploads_must_be_images(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        fields = {'title': 'Coat', 'description': 'Warm', 'category': 'jackets', 'condition': 'good'}
+        for field, upload in (
+            ('images', SimpleUploadedFile('x.html', b'<script>alert(1)</script>', content_type='text/html')),
+            ('photo', SimpleUploadedFile('x.svg', b'<svg onload="alert(1)"/>', content_type='image/svg+xml')),
+        ):
+            response = client.post('/api/items/', {**fields, field: upload}, format='multipart')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(field, response.json())
+        self.assertFalse(Item.objects.exists())
+        self.assertEqual(self.files(), [])
+
+    @override_settings(MEDIA_SENDFILE='x-accel-redirect', MEDIA_ACCEL_REDIRECT_PREFIX='/internal/')
+    def test_sendfile(self):
+        name = make_item(self.user, images=0, photo=jpeg_upload()).photo.name
+        response = self.client.get(f'/media/{name}')
+        self.assertEqual(response['X-Accel-Redirect'], f'/internal/{name}')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_dedupe_command(self):
+        for name in ['lower.jpg', 'lower_JSIAiC1.jpg', 'other.jpg', 'variants/lower_thumb.jpg', 'stray.jpg']:
+            path = os.path.join(self.media, 'item_photos', name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as fh:
+                fh.write(b'other' if name == 'other.jpg' else b'thumb' if 'thumb' in name else b'lower')
+        item = make_item(self.user, images=0, photo='item_photos/lower.jpg',
+                         photo_variants={'thumb': {'jpeg': 'item_photos/variants/lower_thumb.jpg'}})
+        copy = ItemImage.objects.create(item=item, image='item_photos/lower_JSIAiC1.jpg')
+        other = ItemImage.objects.create(item=item, image='item_photos/other.jpg')
+
+        call_command('dedupe_media', '--dry-run', '--delete-orphans', stdout=StringIO())
+        self.assertEqual(len(self.files()), 5)
+
+        out = StringIO()
+        call_command('dedupe_media', '--delete-orphans', stdout=out)
+        self.assertIn('4 files hold 3 distinct contents (20 -> 15 bytes)', out.getvalue())
+        item.refresh_from_db()
+        copy.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(item.photo.name, copy.image.name)
+        self.assertNotEqual(item.photo.name, other.image.name)
+        thumb = item.photo_variants['thumb']['jpeg']
+        self.assertEqual(
+            self.files(), sorted(os.path.normpath(name) for name in {item.photo.name, other.image.name, thumb})
+        )
+        self.assertEqual(default_storage.open(thumb).read(), b'thumb')
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        recommendations.index.reset()
+        self.addCleanup(recommendations.index.reset)
+        self.user = make_user()
+        self.other = make_user('other@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.target = make_item(self.other, images=0, brand='Levis', size='M', points=30, tags='denim, blue')
+
+    def matches(self, pk=None, **params):
+        response = self.client.get(f'/api/items/{pk or self.target.pk}/matches/', params)
+        return [(row['title'], row['match_score']) for row in response.json()]
+
+    def test_available_items_ranked_for_target(self):
+        make_item(self.user, images=0, title='Shoes', category='shoes', size='42', brand='', points=5)
+        make_item(self.user, images=0, title='Jacket', size='M', brand='LEVIS', points=30, tags='Denim,blue')
+        make_item(self.user, images=0, title='Top', category='tops', size='M', brand='Gap', points=30)
+        make_swap(self.user, self.other)  # its 'Denim jacket' is not available
+        # Jacket matches on everything; Shoes only on condition and, partly, points.
+        self.assertEqual(self.matches(), [('Jacket', 10.0), ('Top', 4.5), ('Shoes', 0.833)])
+        self.assertEqual(self.client.get('/api/items/999999/matches/').status_code, 404)
+
+    def test_k_all_ranks_every_available_item(self):
+        for n in range(4):
+            make_item(self.user, images=0, title=f'Item {n}', size='M', points=10 * n)
+        with mock.patch('items.views.MAX_MATCH_LIMIT', 2):
+            self.assertEqual(len(self.matches(k=100)), 2)
+            ranked = self.matches(k='all')
+        self.assertEqual(len(ranked), 4)
+        self.assertEqual(ranked, sorted(ranked, key=lambda row: -row[1]))
+
+    @override_settings(JOB_QUEUE_EAGER=True)  # new items queue a saved-search match
+    def test_saves_update_the_index_incrementally(self):
+        top = make_item(self.user, images=0, title='Top', category='tops', points=30)
+        self.assertEqual([title for title, _ in self.matches()], ['Top'])
+        built_at = recommendations.index.built_at
+        with self.captureOnCommitCallbacks(execute=True):
+            coat = make_item(self.user, images=0, title='Coat', points=10)
+        self.assertEqual([title for title, _ in self.matches()], ['Coat', 'Top'])
+        with self.captureOnCommitCallbacks(execute=True):
+            top.category, top.size, top.brand = 'jackets', 'M', 'Levis'
+            top.save()
+            coat.delete()
+        self.assertEqual([title for title, _ in self.matches()], ['Top'])
+        self.assertEqual(recommendations.index.built_at, built_at)
+
+    @override_settings(JOB_QUEUE_EAGER=True)  # new swaps queue a trade-cycle search
+    def test_swaps_refresh_availability(self):
+        make_item(self.user, images=0, title='Jacket')
+        self.assertEqual(len(self.client.get('/api/recommendations/').json()), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Swap.objects.create(proposer=self.user, receiver=self.other,
+                                proposer_item=make_item(self.user, images=0), receiver_item=self.target)
+        self.assertEqual(self.client.get('/api/recommendations/').json(), [])
+
+    def test_recommendations_for_wardrobe(self):
+        make_item(self.user, images=0, title='Mine', category='shoes', size='42')
+        shoes = make_item(self.other, images=0, title='Sneakers', category='shoes', size='42')
+        response = self.client.get('/api/recommendations/?k=1')
+        self.assertEqual([row['id'] for row in response.json()], [shoes.pk])
+        titles = [row['title'] for row in self.client.get('/api/recommendations/').json()]
+        self.assertEqual(titles, ['Sneakers', 'Denim jacket'])
+
+    def test_scores_match_reference(self):
+        index = recommendations.MatchIndex()
+        items = [make_item(self.user, images=0, points=p, tags=t, size=s)
+                 for p, t, s in [(30, 'a,b', 'M'), (60, 'b,c', 'L'), (0, '', '')]]
+        index.ensure_built()
+        rows = np.array([index.rows[item.pk] for item in items])
+        scores = index.scores(index.rows[self.target.pk], index.features(rows))
+        self.assertTrue(np.allclose(scores, [
+            3 + 2 + 1 + 0.5 + 2 + 0,            # tags: no overlap with denim/blue
+            3 + 0 + 1 + 0.5 + 2 * 0.5 + 0,
+            3 + 0 + 1 + 0.5 + 0 + 0,
+        ]))
+
+    def test_category_pruning_is_exact(self):
+        rng = random.Random(7)
+        categories = [c for c, _ in Item.CATEGORY_CHOICES][:3]
+        Item.objects.bulk_create([
+            Item(owner=rng.choice([self.user, self.other]), title='x', description='', category=rng.choice(categories),
+                 size=rng.choice('SML'), brand=rng.choice(['A', 'B', '']), condition=rng.choice(['good', 'fair']),
+                 points=rng.choice([10, 30]), tags=','.join(rng.sample('abcdef', 2)))
+            for _ in range(300)
+        ])
+        index = recommendations.MatchIndex()
+        index.ensure_built()
+        wardrobe = list(Item.objects.filter(owner=self.user).values_list('pk', flat=True)[:5])
+        for k in [1, 5, 50, 400]:
+            candidates = np.array([
+                row for pk, row in index.rows.items() if index.owner[row] != self.user.pk
+            ])
+            features = index.features(candidates)
+            best = np.max([index.scores(index.rows[pk], features) for pk in wardrobe], axis=0)
+            expected = index.top(candidates, best, k)
+            self.assertEqual(index.matches_for_wardrobe(self.user.pk, wardrobe, k), expected)
+
+
+def rotated(cycle):
+    """A cycle written from its smallest node, so rotations compare equal."""
+    start = cycle.index(min(cycle))
+    return tuple(cycle[start:] + cycle[:start])
+
+
+class TradeCycleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        trades.graph.reset()
+        self.addCleanup(trades.graph.reset)
+        self.users = [make_user(f'{name}@example.com') for name in 'abcd']
+        self.items = [make_item(user, images=0) for user in self.users]
+
+    def swap(self, giver, taker):
+        """Pending swap: user ``giver`` offers their item for user ``taker``'s."""
+        return Swap.objects.create(proposer=self.users[giver], receiver=self.users[taker],
+                                   proposer_item=self.items[giver], receiver_item=self.items[taker])
+
+    def ring(self):
+        """a -> b -> c -> a, proposed as a trade cycle."""
+        swaps = [self.swap(0, 1), self.swap(1, 2), self.swap(2, 0)]
+        return trades.propose([swap.pk for swap in swaps]), swaps
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(self.users[user])
+        return client
+
+    def test_search_matches_brute_force(self):
+        rng = random.Random(3)
+        graph = trades.TradeGraph()
+        owners = {node: rng.randrange(8) for node in range(1, 19)}
+        edges = set()
+        while len(edges) < 50:
+            source, target = rng.sample(sorted(owners), 2)
+            if owners[source] != owners[target]:
+                edges.add((source, target))
+        for swap_id, (source, target) in enumerate(sorted(edges)):
+            graph.add(swap_id, source, target, owners[source], owners[target])
+
+        expected = set()
+        for length in range(2, 5):
+            for cycle in permutations(owners, length):
+                ring_edges = zip(cycle, cycle[1:] + cycle[:1])
+                if (cycle[0] == min(cycle) and all(edge in edges for edge in ring_edges)
+                        and len({owners[node] for node in cycle}) == length):
+                    expected.add(cycle)
+        self.assertTrue(expected)
+        self.assertEqual(sorted(graph.cycles(max_length=4)), sorted(expected))
+        self.assertEqual(len(graph.cycles(max_length=4, limit=3)), 3)
+        self.assertEqual(set(graph.cycles(max_length=3)), {cycle for cycle in expected if len(cycle) <= 3})
+        for swap_id, edge in enumerate(sorted(edges)):
+            through = {rotated(cycle) for cycle in graph.cycles_through(swap_id, max_length=4)}
+            self.assertEqual(through, {
+                cycle for cycle in expected if edge in set(zip(cycle, cycle[1:] + cycle[:1]))
+            })
+
+    @override_settings(JOB_QUEUE_EAGER=True)
+    def test_closing_swap_proposes_ring(self):
+        self.swap(0, 1)
+        self.swap(1, 3)  # b -> d -> ... leads nowhere
+        self.swap(1, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(2).post('/api/swaps/', {
+                'proposer_item': self.items[2].pk, 'receiver_item': self.items[0].pk, 'receiver': self.users[0].pk,
+            })
+        self.assertEqual(response.status_code, 201)
+        cycle = TradeCycle.objects.get()
+        self.assertEqual(cycle.status, 'proposed')
+
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client_for(0).get('/api/trade-cycles/').json()
+        self.assertLessEqual(len(ctx.captured_queries), 6)
+        # Legs run in ring order, starting from the new swap.
+        self.assertEqual([(leg['user'], leg['gives']['id'], leg['receives']['id']) for leg in data[0]['legs']], [
+            (self.users[2].pk, self.items[2].pk, self.items[0].pk),
+            (self.users[0].pk, self.items[0].pk, self.items[1].pk),
+            (self.users[1].pk, self.items[1].pk, self.items[2].pk),
+        ])
+        self.assertEqual(self.client_for(3).get('/api/trade-cycles/').json(), [])
+
+    def test_ring_goes_through_once_everyone_accepts(self):
+        cycle, swaps = self.ring()
+        url = f'/api/trade-cycles/{cycle.pk}/accept/'
+        self.assertEqual(self.client_for(3).post(url).status_code, 404)
+        for user in (0, 1):
+            self.assertEqual(self.client_for(user).post(url).json()['status'], 'proposed')
+        data = self.client_for(2).post(url).json()
+        self.assertEqual(data['status'], 'accepted')
+        self.assertTrue(all(leg['accepted'] for leg in data['legs']))
+        # The legs are one trade: linked to the ring, never completed pairwise.
+        self.assertEqual(set(Swap.objects.filter(pk__in=[s.pk for s in swaps]).values_list('status', 'trade_cycle')),
+                         {('in_cycle', cycle.pk)})
+        self.assertEqual(self.client_for(0).post(f'/api/trade-cycles/{cycle.pk}/decline/').status_code, 409)
+        response = self.client_for(0).patch(f'/api/swaps/{swaps[0].pk}/', {'status': 'completed'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client_for(0).get('/api/me/stats/').json()['accepted_swaps'], 0)
+
+        data = self.client_for(1).post(f'/api/trade-cycles/{cycle.pk}/complete/').json()
+        self.assertEqual(data['status'], 'completed')
+        self.assertEqual([ledger.balance(user) for user in self.users[:3]], [item.points for item in self.items[:3]])
+        self.assertEqual(self.client_for(2).post(f'/api/trade-cycles/{cycle.pk}/complete/').status_code, 409)
+        self.assertEqual(PointsTransaction.objects.count(), 3)
+
+    def test_acceptance_locks_the_cycle_row(self):
+        cycle, _ = self.ring()
+        with mock.patch.object(TradeCycle.objects, 'select_for_update', wraps=TradeCycle.objects.select_for_update) as lock:
+            trades.accept(cycle, self.users[0])
+        lock.assert_called_once_with()
+
+    def test_declined_ring_is_not_proposed_again(self):
+        cycle, swaps = self.ring()
+        response = self.client_for(1).post(f'/api/trade-cycles/{cycle.pk}/decline/')
+        self.assertEqual(response.json()['status'], 'declined')
+        self.assertEqual({swap.status for swap in Swap.objects.filter(pk__in=[s.pk for s in swaps])}, {'pending'})
+        self.assertEqual(trades.propose_all(), [])
+        self.assertIsNone(trades.propose([swap.pk for swap in swaps]))
+
+    def test_ring_expires_when_a_leg_leaves_pending(self):
+        cycle, swaps = self.ring()
+        swaps[1].status = 'cancelled'
+        swaps[1].save()
+        cycle.refresh_from_db()
+        self.assertEqual(cycle.status, 'expired')
+        self.assertFalse(cycle.legs.filter(open=True).exists())
+
+        # The remaining swaps, with a new b -> c, form a new ring; deleting a leg expires it too.
+        swaps[1] = self.swap(1, 2)
+        cycle = trades.propose([swap.pk for swap in swaps])
+        swaps[0].delete()
+        cycle.refresh_from_db()
+        self.assertEqual(cycle.status, 'expired')
+
+    def test_proposals_are_validated_and_atomic(self):
+        cycle, swaps = self.ring()
+        legs = [swap.pk for swap in swaps]
+        self.assertIsNone(trades.propose(legs))  # already in an open cycle
+        self.assertIsNone(trades.propose([legs[0], legs[2], legs[1]]))  # not a ring in that order
+        other = self.swap(3, 0)
+        self.assertIsNone(trades.propose([legs[0], legs[1], other.pk]))
+        self.assertEqual(TradeCycle.objects.count(), 1)
+        self.assertEqual(list(cycle.legs.values_list('swap_id', flat=True)), legs)
+
+    @override_settings(JOB_QUEUE_EAGER=True)
+    def test_graph_follows_swaps(self):
+        trades.graph.ensure_built()
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.swap(0, 1)
+            second = self.swap(1, 0)
+        # The pair was proposed as a ring, so both edges are reserved.
+        self.assertEqual(TradeCycle.objects.get().legs.count(), 2)
+        self.assertEqual(trades.graph.edges, {})
+        with self.captureOnCommitCallbacks(execute=True):
+            first.status = 'declined'
+            first.save()
+        self.assertEqual(TradeCycle.objects.get().status, 'expired')
+        self.assertEqual(set(trades.graph.edges), {second.pk})
+        self.assertEqual(trades.graph.cycles(), [])
+
+
+class PointsLedgerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.other = make_user('other@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def balances(self):
+        return {user.pk: ledger.balance(user) for user in (self.user, self.other)}
+
+    def complete(self, swap):
+        swap.status = 'completed'
+        swap.save()
+
+    def assert_balances_match_ledger(self):
+        totals = dict(PointsTransaction.objects.values('user').annotate(total=models.Sum('amount')).values_list('user', 'total'))
+        self.assertEqual(dict(PointsAccount.objects.values_list('user', 'balance')), totals)
+
+    def test_completed_swap_credits_each_party_once(self):
+        swap = make_swap(self.user, self.other)
+        Item.objects.filter(pk=swap.receiver_item_id).update(points=45)
+        self.assertEqual(self.client.patch(f'/api/swaps/{swap.pk}/', {'status': 'accepted'}).status_code, 200)
+        response = self.client.patch(f'/api/swaps/{swap.pk}/', {'status': 'completed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.balances(), {self.user.pk: 30, self.other.pk: 45})
+        self.complete(Swap.objects.get(pk=swap.pk))
+        self.assertEqual(self.balances(), {self.user.pk: 30, self.other.pk: 45})
+
+        data = self.client.get('/api/points/').json()
+        self.assertEqual(data['balance'], 30)
+        self.assertEqual([(row['amount'], row['kind'], row['swap']) for row in data['transactions']],
+                         [(30, 'swap', swap.pk)])
+        self.assert_balances_match_ledger()
+
+    def test_only_parties_complete_accepted_swaps(self):
+        swap = make_swap(self.user, self.other)
+        url = f'/api/swaps/{swap.pk}/'
+        response = self.client.patch(url, {'status': 'completed'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('status', response.json())
+
+        outsider = APIClient()
+        outsider.force_authenticate(make_user('outsider@example.com'))
+        self.assertEqual(outsider.patch(url, {'status': 'accepted'}).status_code, 404)
+        self.assertEqual(Swap.objects.get(pk=swap.pk).status, 'pending')
+
+        self.assertEqual(self.client.patch(url, {'status': 'accepted'}).status_code, 200)
+        elsewhere = make_item(self.other, images=0, points=500)
+        response = self.client.patch(url, {'receiver_item': elsewhere.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('receiver_item', response.json())
+        self.assertEqual(self.balances(), {self.user.pk: 0, self.other.pk: 0})
+        self.assertEqual(self.client.patch(url, {'status': 'completed'}).status_code, 200)
+        self.assertEqual(self.balances(), {self.user.pk: 30, self.other.pk: 30})
+
+    def test_meetup_pending_swaps_can_be_completed(self):
+        swap = make_swap(self.user, self.other)
+        url = f'/api/swaps/{swap.pk}/'
+        for status in ('awaiting_response', 'meetup_pending', 'completed'):
+            self.assertEqual(self.client.patch(url, {'status': status}).status_code, 200)
+        self.assertEqual(self.balances(), {self.user.pk: 30, self.other.pk: 30})
+
+    def test_transfer_moves_points_or_nothing(self):
+        ledger.post([PointsTransaction(user=self.user, amount=40, kind='adjustment')])
+        item = make_item(self.other, images=0, points=25)
+        ledger.transfer(self.user, self.other, item.points, item=item)
+        self.assertEqual(self.balances(), {self.user.pk: 15, self.other.pk: 25})
+        with self.assertRaises(ledger.InsufficientPoints):
+            ledger.transfer(self.user, self.other, 20)
+        with self.assertRaises(ValueError):
+            ledger.transfer(self.user, self.other, 0)
+        self.assertEqual(self.balances(), {self.user.pk: 15, self.other.pk: 25})
+        self.assertEqual(
+            list(PointsTransaction.objects.filter(kind='transfer').values_list('user', 'amount', 'item')),
+            [(self.user.pk, -25, item.pk), (self.other.pk, 25, item.pk)],
+        )
+        self.assert_balances_match_ledger()
+
+    def test_ring_legs_credit_the_giver_only(self):
+        users = [self.user, self.other, make_user('third@example.com')]
+        items = [make_item(user, images=0, points=points) for user, points in zip(users, [10, 30, 50])]
+        swaps = [
+            Swap.objects.create(proposer=users[n], receiver=users[(n + 1) % 3],
+                                proposer_item=items[n], receiver_item=items[(n + 1) % 3])
+            for n in range(3)
+        ]
+        cycle = trades.propose([swap.pk for swap in swaps])
+        for user in users:
+            trades.accept(cycle, user)
+        trades.complete(cycle, users[0])
+        self.assertEqual([ledger.balance(user) for user in users], [10, 30, 50])
+        self.assertFalse(ledger.settle_cycle(cycle))
+        self.assertEqual([ledger.balance(user) for user in users], [10, 30, 50])
+        self.assert_balances_match_ledger()
+
+    def test_concurrent_settlement_credits_once(self):
+        first, second = make_swap(self.user, self.other), make_swap(self.user, self.other)
+        self.complete(first)
+        Swap.objects.filter(pk=second.pk).update(status='completed')  # no signal, so unsettled
+        swaps = list(Swap.objects.filter(pk__in=[first.pk, second.pk]))
+        # As if another process settled ``first`` between the check and the insert.
+        with mock.patch.object(PointsTransaction.objects, 'filter') as check:
+            check.return_value.values_list.return_value = []
+            self.assertEqual(ledger.settle(swaps), 1)
+        self.assertEqual(self.balances(), {self.user.pk: 60, self.other.pk: 60})
+        with self.assertRaises(IntegrityError):
+            ledger.post(ledger.settlement_entries(swaps[:1]))
+        self.assert_balances_match_ledger()
+
+    def test_debits_never_overdraw(self):
+        def entry(user, amount):
+            return PointsTransaction(user=user, amount=amount, kind='adjustment')
+        ledger.post([entry(self.user, 50), entry(self.other, 5)])
+        ledger.post([entry(self.user, -30)])
+        with self.assertRaises(ledger.InsufficientPoints):
+            ledger.post([entry(self.user, 10), entry(self.other, -10)])  # all or nothing
+        with self.assertRaises(ledger.InsufficientPoints):
+            ledger.post([entry(make_user('new@example.com'), -1)])
+        self.assertEqual(self.balances(), {self.user.pk: 20, self.other.pk: 5})
+        self.assertEqual(PointsTransaction.objects.count(), 3)
+        self.assert_balances_match_ledger()
+        with self.assertRaises(ValueError):
+            PointsTransaction.objects.first().save()
+
+    def test_settle_points_batches(self):
+        def complete_without_signals(count):
+            swaps = [make_swap(self.user, self.other) for _ in range(count)]
+            Swap.objects.filter(pk__in=[swap.pk for swap in swaps]).update(status='completed')
+
+        def settle_points(batch_size):
+            out = StringIO()
+            call_command('settle_points', batch_size=batch_size, stdout=out)
+            return out.getvalue()
+
+        complete_without_signals(5)
+        self.assertIn('Settled 5 swaps', settle_points(batch_size=2))
+        self.assertEqual(self.balances(), {self.user.pk: 150, self.other.pk: 150})
+        complete_without_signals(20)
+        # One batch: find swaps, settled check, item points, a savepoint around
+        # one INSERT and one UPDATE per user, then the empty next batch.
+        with self.assertNumQueries(9):
+            self.assertIn('Settled 20 swaps', settle_points(batch_size=100))
+        self.assertFalse(ledger.unsettled_swaps().exists())
+        self.assert_balances_match_ledger()
+
+
+class UserStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user()
+        self.other = make_user('other@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def counters(self, user):
+        return {name: getattr(UserStats.objects.get(pk=user.pk), name) for name in stats.COUNTERS}
+
+    def assert_counters(self, user, **expected):
+        counters = self.counters(user)
+        self.assertEqual({name: value for name, value in counters.items() if value}, expected)
+        # The incremental counters agree with counting from scratch.
+        stats.recount([user.pk])
+        self.assertEqual(self.counters(user), counters)
+
+    def test_counters_follow_writes(self):
+        swap = make_swap(self.other, self.user)
+        self.assert_counters(self.user, pending_swaps=1, unread_swaps=1, listed_items=1)
+        self.assert_counters(self.other, pending_swaps=1, listed_items=1)
+
+        swap = Swap.objects.get(pk=swap.pk)
+        swap.is_read, swap.status = True, 'accepted'
+        swap.save()
+        self.assert_counters(self.user, accepted_swaps=1, listed_items=1)
+        SwapMessage.objects.create(swap=swap, sender=self.other, content='Tomorrow')
+        self.assert_counters(self.user, accepted_swaps=1, listed_items=1)
+
+        self.client.patch(f'/api/swaps/{swap.pk}/', {'status': 'completed'})
+        self.assert_counters(self.other, completed_swaps=1, listed_items=1)
+        make_item(self.other, images=0)
+        Item.objects.get(pk=swap.receiver_item_id).delete()  # deletes the swap with it
+        self.assert_counters(self.user)
+        self.assert_counters(self.other, listed_items=2)
+
+    def test_stats_endpoint_is_one_primary_key_lookup(self):
+        swap = make_swap(self.user, self.other)
+        swap.status = 'completed'
+        swap.save()
+        with CaptureQueriesContext(connection) as ctx:
+            data = self.client.get('/api/me/stats/').json()
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertEqual(data, {
+            'unread_swaps': 0, 'pending_swaps': 0, 'accepted_swaps': 0, 'completed_swaps': 1,
+            'listed_items': 1, 'points': 30,
+        })
+        self.assertEqual(APIClient().get('/api/me/stats/').status_code, 401)
+
+    def test_missing_rows_are_computed_on_read_and_created_on_write(self):
+        [legacy] = User.objects.bulk_create([User(email='legacy@example.com', username='legacy', full_name='Legacy')])
+        [wanted] = Item.objects.bulk_create([Item(owner=legacy, title='Scarf', description='', category='accessories',
+                                                   condition='good')])
+        Swap.objects.bulk_create([
+            Swap(proposer=self.user, receiver=legacy, proposer_item=make_item(self.user, images=0), receiver_item=wanted)
+        ])
+        self.assertFalse(UserStats.objects.filter(pk=legacy.pk).exists())
+        client = APIClient()
+        client.force_authenticate(legacy)
+        self.assertEqual(client.get('/api/swaps/').json()['unread_count'], 1)
+        self.assertEqual(client.get('/api/me/stats/').json()['pending_swaps'], 1)
+        # Reads never write.
+        self.assertFalse(UserStats.objects.filter(pk=legacy.pk).exists())
+
+        # The first write recounts the user, including itself.
+        make_swap(self.user, legacy)
+        self.assertEqual(self.counters(legacy), {
+            'unread_swaps': 2, 'pending_swaps': 2, 'accepted_swaps': 0, 'completed_swaps': 0, 'listed_items': 2,
+        })
+
+        UserStats.objects.update(listed_items=99)
+        call_command('recount_user_stats', stdout=StringIO())
+        self.assertEqual(self.counters(legacy)['listed_items'], 2)
+
+
+@override_settings(JOB_QUEUE_EAGER=True)
+class SavedSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        saved_searches.index.reset()
+        self.addCleanup(saved_searches.index.reset)
+        self.user = make_user()
+        self.other = make_user('other@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def list_item(self, owner, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return make_item(owner, images=0, **fields)
+
+    def test_new_items_notify_matching_searches(self):
+        self.assertEqual(self.client.post('/api/saved-searches/', {'name': 'Nothing'}).status_code, 400)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/saved-searches/', {
+                'name': 'Denim', 'search': 'den', 'category': 'Jackets', 'size': 'M,L',
+            })
+        self.assertEqual(response.status_code, 201)
+        search_id = response.json()['id']
+
+        match = self.list_item(self.other, title='Denim jacket', size='L')
+        self.list_item(self.other, title='Denim jacket', size='S')
+        self.list_item(self.other, title='Wool jacket', size='M')
+        self.list_item(self.user, title='Denim jacket', size='M')  # the user's own
+        data = self.client.get('/api/saved-searches/notifications/').json()
+        self.assertEqual(data['unread_count'], 1)
+        [notification] = data['notifications']
+        self.assertEqual((notification['saved_search'], notification['item']['id']), (search_id, match.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/saved-searches/{search_id}/', {'size': ''})
+        self.list_item(self.other, title='Denim jacket', size='S')
+        self.assertEqual(self.client.post('/api/saved-searches/notifications/read/', {}, format='json').json(),
+                         {'updated': 2})
+        self.assertEqual(self.client.get('/api/saved-searches/notifications/?unread').json()['notifications'], [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/saved-searches/{search_id}/')
+        self.list_item(self.other, title='Denim jacket')
+        self.assertEqual(SearchNotification.objects.count(), 0)
+        self.assertEqual(APIClient().get('/api/saved-searches/').status_code, 401)
+
+    def test_matches_agree_with_browse_filters(self):
+        rng = random.Random(4)
+        words = ['denim', 'dress', 'wool', 'woven', 'silk', 'scarf', 'linen']
+        owners = [self.user, self.other, make_user('third@example.com')]
+        searches = []
+        for n in range(40):
+            searches.append(SavedSearch.objects.create(
+                user=rng.choice(owners),
+                search=' '.join(word[:rng.randint(2, len(word))] for word in rng.sample(words, rng.randint(0, 2))),
+                category=rng.choice(['', 'Tops', 'jackets', 'All Categories']),
+                size=','.join(rng.sample(['S', 'M', 'L'], rng.randint(0, 2))),
+                condition=rng.choice(['', 'good', 'good,fair']),
+                brand=rng.choice(['', 'Zara', 'levis', 'All Brands']),
+            ))
+        for _ in range(60):
+            self.list_item(
+                rng.choice(owners), title=' '.join(rng.sample(words, 2)), description=rng.choice(words),
+                category=rng.choice(['tops', 'jackets']), size=rng.choice(['S', 'M', 'L']),
+                condition=rng.choice(['good', 'fair']), brand=rng.choice(['Zara', 'Levis', '']),
+            )
+        notified = set(SearchNotification.objects.values_list('saved_search_id', 'item_id'))
+        expected = set()
+        for search in searches:
+            params = {field: getattr(search, field) for field in saved_searches.FILTER_FIELDS}
+            for pk in filter_items(Item.objects.exclude(owner=search.user_id), params).values_list('pk', flat=True):
+                expected.add((search.pk, pk))
+        self.assertTrue(expected)
+        self.assertEqual(notified, expected)
+
+    def test_candidates_come_from_the_rarest_key(self):
+        for n in range(50):
+            SavedSearch.objects.create(user=self.user, category='tops', brand=f'brand{n}')
+        SavedSearch.objects.create(user=self.user, category='tops', size='M,L')
+        saved_searches.index.ensure_built()
+        item = make_item(self.other, images=0, category='tops', brand='brand7', size='M')
+        features = saved_searches.item_features(
+            Item.objects.filter(pk=item.pk).values(*saved_searches.ITEM_FIELDS).get()
+        )
+        self.assertEqual(len(saved_searches.index.candidates(features)), 2)
+        self.assertEqual(len(saved_searches.index.match(self.other.pk, features)), 2)
+
+    def test_batch_notify_rechecks_stale_searches(self):
+        saved_searches.index.ensure_built()
+        # Neither write reaches the index: on_commit callbacks do not run here,
+        # as for writes made by another process.
+        SavedSearch.objects.bulk_create([SavedSearch(user=self.user, brand='zara')])
+        removed = SavedSearch.objects.create(user=self.user, category='tops')
+        saved_searches.index.update(removed.pk, self.user.pk, saved_searches.search_criteria(removed))
+        SavedSearch.objects.filter(pk=removed.pk).update(category='shoes')
+        items = [make_item(self.other, images=0, category='tops', brand='Zara') for _ in range(30)]
+        with self.assertNumQueries(4):
+            created = saved_searches.notify([item.pk for item in items])
+        self.assertEqual(created, 30)
+        self.assertEqual(set(SearchNotification.objects.values_list('saved_search__brand', flat=True)), {'zara'})
+        # Retried jobs notify nothing twice.
+        saved_searches.notify([item.pk for item in items])
+        self.assertEqual(SearchNotification.objects.count(), 30)
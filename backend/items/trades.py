@@ -0,0 +1,349 @@
+"""Multi-party trade cycles found in the graph of pending swaps.
+
+A pending Swap says its proposer would give ``proposer_item`` for
+``receiver_item``. Read as an edge proposer_item -> receiver_item, every
+directed cycle is a ring trade: for a -> b -> c -> a, a's owner gets b, b's
+owner gets c and c's owner gets a, each giving up one item. Proposals that no
+receiver wants directly can still be satisfied that way.
+
+TradeGraph keeps the edges of pending swaps in memory (swaps already in an
+open cycle are left out). Cycle search is bounded enumeration with pruning:
+
+* A breadth-first pass over incoming edges first finds every node within
+  ``max_length - 1`` steps of the cycle's start. The depth-first walk then
+  only steps to a node if it can still get back in the edges left, so dead
+  ends are never explored.
+* An owner may appear once per ring: nobody gives away two items.
+* The full scan (cycles()) roots each cycle at its smallest item id and only
+  walks larger ids (the distance pass already leaves smaller ones out), so
+  every cycle is found once. Enumeration stops after ``limit`` cycles.
+
+When a swap is proposed, a ``find_trade_cycles`` job searches only the cycles
+through its edge, since any new cycle must use it, and proposes the shortest
+(see propose_cycles_through()). ``manage.py find_trade_cycles`` runs the full
+scan. Rings are proposed atomically: the swaps are re-read and a TradeCycle
+with one leg per swap is written in a single transaction. A conditional
+unique index keeps a swap in one open cycle even when two processes race.
+The ring goes through once every participant accepts. It is declined when
+any participant declines, and expires if a leg swap stops being pending.
+
+An accepted ring is one trade, not a set of pairwise ones: its leg swaps move
+to status 'in_cycle' and point at the cycle (Swap.trade_cycle), which keeps
+their items reserved but never shows a leg as an exchange between its two
+parties, and no leg can be completed on its own. A participant completes the
+ring as a whole (complete()), which settles each giver's points once. The
+cycle row is locked before its legs are checked, so participants accepting
+at the same moment cannot each miss the other's acceptance.
+
+The graph follows Swap signals after commit, which only reach the process
+that made the write. Each process therefore rebuilds once its graph is
+TRADE_GRAPH_MAX_AGE seconds old (default 300). Since proposals are
+re-validated against the database, a stale graph can miss a ring but never
+propose an invalid one.
+
+Settings (all optional): TRADE_CYCLE_MAX_LENGTH, the most participants in a
+ring, default 4; TRADE_CYCLE_SEARCH_LIMIT, the most cycles one search
+enumerates, default 1000.
+"""
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.utils import timezone
+
+from .ledger import settle_cycle
+from .models import Swap, TradeCycle, TradeCycleLeg
+
+
+class TradeCycleClosed(Exception):
+    """The cycle is no longer proposed, so it cannot be accepted or declined."""
+
+
+def setting(name, default):
+    return getattr(settings, name, default)
+
+
+def signature(swap_ids):
+    return ','.join(str(pk) for pk in sorted(swap_ids))
+
+
+class TradeGraph:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.built_at = None
+        self.clear()
+
+    def clear(self):
+        self.out = defaultdict(dict)  # item -> {next item: {swap ids}}
+        self.inc = defaultdict(set)  # item -> {previous items}
+        self.edges = {}  # swap id -> (proposer item, receiver item)
+        self.owner = {}
+        self.declined = set()
+
+    def reset(self):
+        with self.lock:
+            self.built_at = None
+            self.clear()
+
+    def build(self):
+        rows = list(pending_swaps(Swap.objects.all()).iterator(chunk_size=2000))
+        declined = set(TradeCycle.objects.filter(status='declined').values_list('signature', flat=True))
+        with self.lock:
+            self.clear()
+            for row in rows:
+                self.add(*row)
+            self.declined = declined
+            self.built_at = time.monotonic()
+
+    def ensure_built(self):
+        with self.lock:
+            if self.built_at is None or time.monotonic() - self.built_at > setting('TRADE_GRAPH_MAX_AGE', 300):
+                self.build()
+
+    def add(self, swap_id, source, target, proposer_id, receiver_id):
+        if source == target or proposer_id == receiver_id or swap_id in self.edges:
+            return
+        self.edges[swap_id] = (source, target)
+        self.out[source].setdefault(target, set()).add(swap_id)
+        self.inc[target].add(source)
+        self.owner[source], self.owner[target] = proposer_id, receiver_id
+
+    def discard(self, swap_id):
+        edge = self.edges.pop(swap_id, None)
+        if edge is None:
+            return
+        source, target = edge
+        swap_ids = self.out[source][target]
+        swap_ids.discard(swap_id)
+        if not swap_ids:
+            del self.out[source][target]
+            self.inc[target].discard(source)
+
+    def refresh(self, swap_ids):
+        """Re-read ``swap_ids``: pending swaps outside open cycles are edges, the rest are dropped."""
+        with self.lock:
+            if self.built_at is None:
+                return
+            rows = list(pending_swaps(Swap.objects.filter(pk__in=swap_ids)))
+            for swap_id in swap_ids:
+                self.discard(swap_id)
+            for row in rows:
+                self.add(*row)
+
+    def decline(self, swap_ids):
+        with self.lock:
+            self.declined.add(signature(swap_ids))
+
+    def distances_to(self, target, max_depth, floor):
+        """{node: fewest edges from node to ``target``} for nodes within ``max_depth`` and above ``floor``."""
+        depth = {target: 0}
+        frontier = [target]
+        for distance in range(1, max_depth + 1):
+            reached = []
+            for node in frontier:
+                for previous in self.inc.get(node, ()):
+                    if previous > floor and previous not in depth:
+                        depth[previous] = distance
+                        reached.append(previous)
+            if not reached:
+                break
+            frontier = reached
+        return depth
+
+    def extend(self, path, owners, depth, max_length, found, limit):
+        """Walk forward from ``path[-1]`` back to ``path[0]``; False once ``limit`` cycles are found."""
+        start, steps = path[0], len(path)
+        for node in self.out.get(path[-1], ()):
+            if node == start:
+                found.append(tuple(path))
+                if len(found) >= limit:
+                    return False
+            elif (
+                steps + depth.get(node, max_length) <= max_length
+                and node not in path and self.owner[node] not in owners
+            ):
+                path.append(node)
+                owners.append(self.owner[node])
+                more = self.extend(path, owners, depth, max_length, found, limit)
+                path.pop()
+                owners.pop()
+                if not more:
+                    return False
+        return True
+
+    def cycles_through(self, swap_id, max_length=None, limit=None):
+        """Cycles (tuples of items, in ring order) that use ``swap_id``'s edge."""
+        max_length = max_length or setting('TRADE_CYCLE_MAX_LENGTH', 4)
+        limit = limit or setting('TRADE_CYCLE_SEARCH_LIMIT', 1000)
+        with self.lock:
+            if swap_id not in self.edges:
+                return []
+            source, target = self.edges[swap_id]
+            depth = self.distances_to(source, max_length - 1, floor=-1)
+            if target not in depth:
+                return []
+            found = []
+            self.extend([source, target], [self.owner[source], self.owner[target]], depth, max_length, found, limit)
+            return found
+
+    def cycles(self, max_length=None, limit=None):
+        """Every cycle of at most ``max_length`` items, up to ``limit`` of them."""
+        max_length = max_length or setting('TRADE_CYCLE_MAX_LENGTH', 4)
+        limit = limit or setting('TRADE_CYCLE_SEARCH_LIMIT', 1000)
+        found = []
+        with self.lock:
+            for start in sorted(self.out):
+                # A node without both an incoming and an outgoing edge is on no cycle.
+                if not self.out[start] or not self.inc.get(start):
+                    continue
+                depth = self.distances_to(start, max_length - 1, floor=start)
+                if len(depth) > 1 and not self.extend([start], [self.owner[start]], depth, max_length, found, limit):
+                    break
+        return found
+
+    def swaps(self, cycle):
+        """The swap ids of a cycle's edges, in ring order (the oldest swap where several share an edge)."""
+        return [min(self.out[node][cycle[(n + 1) % len(cycle)]]) for n, node in enumerate(cycle)]
+
+    def choose(self, cycles):
+        """Disjoint cycles as lists of swap ids: shortest first, then those whose newest swap is oldest."""
+        with self.lock:
+            candidates = sorted((self.swaps(cycle) for cycle in cycles), key=lambda legs: (len(legs), max(legs)))
+            chosen, used = [], set()
+            for legs in candidates:
+                items = {item for swap_id in legs for item in self.edges[swap_id]}
+                if items & used or signature(legs) in self.declined:
+                    continue
+                chosen.append(legs)
+                used |= items
+            return chosen
+
+
+def pending_swaps(swaps):
+    """(swap id, proposer item, receiver item, proposer, receiver) of swaps that may join a cycle."""
+    open_legs = TradeCycleLeg.objects.filter(swap=models.OuterRef('pk'), open=True)
+    return swaps.filter(status='pending').exclude(models.Exists(open_legs)).values_list(
+        'pk', 'proposer_item_id', 'receiver_item_id', 'proposer_id', 'receiver_id'
+    )
+
+
+graph = TradeGraph()
+
+
+def propose(swap_ids):
+    """Propose the ring of ``swap_ids`` (in ring order) as one TradeCycle, or None if it no longer holds."""
+    with transaction.atomic():
+        swaps = {swap.pk: swap for swap in Swap.objects.select_for_update().filter(pk__in=swap_ids, status='pending')}
+        legs = [swaps.get(pk) for pk in swap_ids]
+        if (
+            None in legs or len({swap.proposer_id for swap in legs}) != len(legs)
+            or any(swap.receiver_item_id != legs[(n + 1) % len(legs)].proposer_item_id for n, swap in enumerate(legs))
+            or TradeCycle.objects.filter(signature=signature(swap_ids), status='declined').exists()
+        ):
+            return None
+        try:
+            with transaction.atomic():
+                cycle = TradeCycle.objects.create(signature=signature(swap_ids))
+                TradeCycleLeg.objects.bulk_create([
+                    TradeCycleLeg(cycle=cycle, swap=swap, position=n) for n, swap in enumerate(legs)
+                ])
+        except IntegrityError:
+            return None  # a leg joined another open cycle meanwhile
+    transaction.on_commit(lambda: graph.refresh(swap_ids))
+    return cycle
+
+
+def propose_cycles_through(swap_id):
+    """Propose the best ring through a newly proposed swap, if there is one."""
+    graph.ensure_built()
+    graph.refresh([swap_id])
+    for legs in graph.choose(graph.cycles_through(swap_id)):
+        cycle = propose(legs)
+        if cycle is not None:
+            return cycle
+    return None
+
+
+def propose_all(max_length=None, limit=None):
+    """Rebuild the graph, then propose every disjoint ring it holds; returns the new cycles."""
+    graph.build()
+    proposed = []
+    for legs in graph.choose(graph.cycles(max_length, limit)):
+        cycle = propose(legs)
+        if cycle is not None:
+            proposed.append(cycle)
+    return proposed
+
+
+def close(cycle_id, status):
+    """Move a proposed cycle to ``status`` and free its legs; False if it was not proposed."""
+    if not TradeCycle.objects.filter(pk=cycle_id, status='proposed').update(status=status, updated_at=timezone.now()):
+        return False
+    legs = TradeCycleLeg.objects.filter(cycle_id=cycle_id)
+    swap_ids = list(legs.values_list('swap_id', flat=True))
+    legs.update(open=False)
+    transaction.on_commit(lambda: graph.refresh(swap_ids))
+    return swap_ids
+
+
+def lock(cycle, status):
+    """The cycle's row, locked for this transaction, if it is in ``status``; else raise TradeCycleClosed."""
+    locked = TradeCycle.objects.select_for_update().filter(pk=cycle.pk, status=status).first()
+    if locked is None:
+        raise TradeCycleClosed
+    return locked
+
+
+def accept(cycle, user):
+    """Record ``user``'s acceptance; once everyone has accepted, the ring is accepted as one trade."""
+    with transaction.atomic():
+        cycle = lock(cycle, 'proposed')
+        cycle.legs.filter(swap__proposer=user).update(accepted=True)
+        if cycle.legs.filter(accepted=False).exists():
+            return False
+        swap_ids = close(cycle.pk, 'accepted')
+        # save() rather than update() so availability, stats and swap events follow.
+        for swap in Swap.objects.filter(pk__in=swap_ids):
+            swap.status, swap.trade_cycle = 'in_cycle', cycle
+            swap.save(update_fields=['status', 'trade_cycle', 'updated_at'])
+    return True
+
+
+def complete(cycle, user):
+    """Complete an accepted ring: every item has changed hands. Each giver is credited once."""
+    with transaction.atomic():
+        cycle = lock(cycle, 'accepted')
+        cycle.status = 'completed'
+        cycle.save(update_fields=['status', 'updated_at'])
+        settle_cycle(cycle)
+    return True
+
+
+def decline(cycle, user):
+    with transaction.atomic():
+        swap_ids = close(cycle.pk, 'declined')
+        if swap_ids is False:
+            raise TradeCycleClosed
+    transaction.on_commit(lambda: graph.decline(swap_ids))
+
+
+def swap_saved(sender, instance, created=False, **kwargs):
+    """Swap post_save receiver: follow the edge, search new proposals and expire rings a leg has left."""
+    if instance.status != 'pending':
+        for cycle_id in set(TradeCycleLeg.objects.filter(swap=instance, open=True).values_list('cycle_id', flat=True)):
+            close(cycle_id, 'expired')
+    pk = instance.pk
+    transaction.on_commit(lambda: graph.refresh([pk]))
+    if created and instance.status == 'pending':
+        from .tasks import enqueue
+        enqueue('find_trade_cycles', swap_id=pk)
+
+
+def swap_deleting(sender, instance, **kwargs):
+    """Swap pre_delete receiver, while the legs still exist."""
+    for cycle_id in set(TradeCycleLeg.objects.filter(swap=instance, open=True).values_list('cycle_id', flat=True)):
+        close(cycle_id, 'expired')
+    pk = instance.pk
+    transaction.on_commit(lambda: graph.refresh([pk]))
@@ -3,141 +3,371 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions, serializers
 from rest_framework.parsers import MultiPartParser, FormParser
-from .models import Item, Swap, SwapMessage, ItemImage
-from rest_framework.decorators import api_view, permission_classes
+from .models import (
+    Item, Swap, SwapMessage, ItemImage, PointsTransaction, SavedSearch, SearchNotification, TradeCycle, TradeCycleLeg,
+    UserStats,
+)
+from .pagination import KeysetPagination
+from . import ledger, recommendations, saved_searches, stats, trades
+from .search import get_search_backend, tokenize
+from .caching import CATALOG_SCOPE, cached_response, fill_reads, get_version, invalidate, item_scope
+from .realtime import message_waiters
+from .tasks import enqueue, enqueue_many
+from .bulk import ManifestError, open_archive, parse_manifest, read_image
+from .images import verify_image
+from .export import export_response
+from .media import unreferenced
+from backend.routers import replica_reads
+from signup.authentication import ClaimsJWTAuthentication
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework import generics
-from django.db import models
+from django.db import models, router, transaction
+from django.http import StreamingHttpResponse
+from django.db.models.functions import Lower
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+import hashlib
+import json
+import time
+from functools import partial
+from django.utils.dateparse import parse_datetime
 
 # Create your views here.
 
+def item_list_queryset():
+    """Base queryset for every endpoint that serializes more than one item.
+
+    Owners are joined and images prefetched in one extra query, so
+    ItemSerializer never touches the database per row.
+    """
+    return Item.objects.select_related('owner').prefetch_related('images')
+
+def filter_items(items, params):
+    search = params.get('search')
+    category = params.get('category')
+    size = params.get('size')
+    condition = params.get('condition')
+    brand = params.get('brand')
+
+    if search:
+        items = get_search_backend().search(items, search)
+    # Case-insensitive matches compare Lower(column) so the functional indexes
+    # item_category_created_idx and item_brand_created_idx apply; iexact would not.
+    if category and category != 'All Categories':
+        items = items.alias(category_key=Lower('category')).filter(category_key=category.lower())
+    if size:
+        size_list = [s.strip() for s in size.split(',') if s.strip()]
+        if size_list:
+            items = items.filter(size__in=size_list)
+    if condition:
+        cond_list = [c.strip() for c in condition.split(',') if c.strip()]
+        if cond_list:
+            items = items.filter(condition__in=cond_list)
+    if brand and brand != 'All Brands':
+        items = items.alias(brand_key=Lower('brand')).filter(brand_key=brand.lower())
+    return items
+
+def calculate_points(condition):
+    if condition == 'excellent': return 50
+    if condition == 'good': return 30
+    if condition == 'fair': return 10
+    if condition == 'new': return 60
+    if condition == 'like_new': return 45
+    if condition == 'used': return 5
+    if condition == 'vintage': return 40
+    return 0
+
 class ItemSerializer(serializers.ModelSerializer):
     photo = serializers.SerializerMethodField()
+    photo_variants = serializers.SerializerMethodField()
     images = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
 
     class Meta:
         model = Item
         fields = '__all__'
-        read_only_fields = ['owner', 'created_at', 'status']
+        read_only_fields = ['owner', 'created_at', 'status', 'media_status', 'active_swap_count']
 
-    def get_photo(self, obj):
+    def build_url(self, url):
+        # Resolve scheme and host once per serializer tree instead of once per file.
         request = self.context.get('request')
-        if obj.photo:
-            url = obj.photo.url
-            if request is not None:
-                return request.build_absolute_uri(url)
+        if request is None:
             return url
+        base = self.context.get('_media_base')
+        if base is None:
+            base = self.context['_media_base'] = request.build_absolute_uri('/')[:-1]
+        if url.startswith('/'):
+            return base + url
+        return request.build_absolute_uri(url)
+
+    def get_photo(self, obj):
+        if obj.photo:
+            return self.build_url(obj.photo.url)
         return None
 
+    def variant_urls(self, variants):
+        # {'thumb': {'jpeg': name, 'webp': name}, ...} with names turned into URLs.
+        return {
+            size: {fmt: self.build_url(default_storage.url(name)) for fmt, name in formats.items()}
+            for size, formats in variants.items()
+        }
+
+    def get_photo_variants(self, obj):
+        return self.variant_urls(obj.photo_variants) if obj.photo else {}
+
     def get_images(self, obj):
-        request = self.context.get('request')
-        images = obj.images.all()
-        urls = []
-        for img in images:
-            url = img.image.url
-            if request is not None:
-                url = request.build_absolute_uri(url)
-            urls.append(url)
-        return urls
+        # Uses the prefetch cache when the queryset came from item_list_queryset().
+        return [self.build_url(img.image.url) for img in obj.images.all()]
+
+    def get_image_variants(self, obj):
+        # Parallel to ``images``; an entry is {} until its variants are generated.
+        return [self.variant_urls(img.variants) for img in obj.images.all()]
 
 class ItemListCreateView(generics.ListCreateAPIView):
     serializer_class = ItemSerializer
     parser_classes = [MultiPartParser, FormParser]
     permission_classes = [permissions.AllowAny]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
-        items = Item.objects.all().order_by('-created_at')
-        request = self.request
-        search = request.GET.get('search')
-        category = request.GET.get('category')
-        size = request.GET.get('size')
-        condition = request.GET.get('condition')
-        brand = request.GET.get('brand')
-
-        if search:
-            from django.db.models import Q
-            items = items.filter(
-                Q(title__icontains=search) |
-                Q(description__icontains=search) |
-                Q(brand__icontains=search) |
-                Q(category__icontains=search) |
-                Q(tags__icontains=search)
-            )
-        if category and category != 'All Categories':
-            items = items.filter(category__iexact=category)
-        if size:
-            size_list = [s.strip() for s in size.split(',') if s.strip()]
-            if size_list:
-                items = items.filter(size__in=size_list)
-        if condition:
-            cond_list = [c.strip() for c in condition.split(',') if c.strip()]
-            if cond_list:
-                items = items.filter(condition__in=cond_list)
-        if brand and brand != 'All Brands':
-            items = items.filter(brand__iexact=brand)
-        return items
+        items = item_list_queryset().order_by('-created_at')
+        return filter_items(items, self.request.GET)
+
+    def list(self, request, *args, **kwargs):
+        with replica_reads():
+            return cached_response(request, CATALOG_SCOPE, listing_cache_params(request.GET),
+                                   partial(super().list, request, *args, **kwargs))
 
     def calculate_points(self, condition):
-        if condition == 'excellent': return 50
-        if condition == 'good': return 30
-        if condition == 'fair': return 10
-        if condition == 'new': return 60
-        if condition == 'like_new': return 45
-        if condition == 'used': return 5
-        if condition == 'vintage': return 40
-        return 0
+        return calculate_points(condition)
 
     def perform_create(self, serializer):
         request = self.request
         condition = request.data.get('condition', '')
         points = self.calculate_points(condition)
         owner = request.user if request.user.is_authenticated else None
-        item = serializer.save(owner=owner, points=points)
-        # Handle multiple images
         images = request.FILES.getlist('images')
+        # ``photo`` is read-only on the serializer (it renders a URL), so the upload is taken here.
+        photo = request.FILES.get('photo')
+        # Checked here, as items.bulk checks imports: only real images are stored.
+        errors = {}
+        for field, uploads in (('images', images), ('photo', [photo] if photo else [])):
+            for upload in uploads:
+                try:
+                    verify_image(upload)
+                except ValueError as exc:
+                    errors.setdefault(field, []).append(f'{upload.name}: {exc}.')
+        if errors:
+            raise serializers.ValidationError(errors)
+        extra = {'photo': photo} if photo else {}
+        # Anything to resize stays 'pending' until process_item_images runs.
+        has_media = bool(images or photo)
+        item = serializer.save(owner=owner, points=points, media_status='pending' if has_media else 'ready', **extra)
+        # Handle multiple images; resizing runs in the background job queue.
         for img in images:
             ItemImage.objects.create(item=item, image=img)
+        # One query for the response's ``images`` and ``image_variants``.
+        models.prefetch_related_objects([item], 'images')
+        if has_media:
+            enqueue('process_item_images', item=item)
+
+class BulkItemImportView(APIView):
+    """Create up to MAX_ROWS items from a manifest plus a zip of their images.
+
+    Every row is validated before any row is written. Each image is stored
+    as soon as it is validated, so the request never holds more than one. If
+    any row is invalid nothing is created and the stored images are removed.
+    Otherwise all items and images are inserted with bulk_create in one
+    transaction. Either way the response is NDJSON with one result per
+    manifest row.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def post(self, request):
+        if 'manifest' not in request.FILES:
+            return Response({'error': 'A manifest file is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            rows = parse_manifest(request.FILES['manifest'])
+            archive = open_archive(request.FILES.get('archive'))
+        except ManifestError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        image_field = ItemImage._meta.get_field('image')
+        results, valid, saved = [], [], []
+        try:
+            for number, row in enumerate(rows, 1):
+                images = row.pop('images', None) or []
+                serializer = ItemSerializer(data=row)
+                errors = {} if serializer.is_valid() else dict(serializer.errors)
+                names = []
+                for name in images if isinstance(images, list) else [images]:
+                    try:
+                        filename, image = read_image(archive, str(name))
+                    except ValueError as e:
+                        errors.setdefault('images', []).append(str(e))
+                        continue
+                    with image:
+                        names.append(default_storage.save(image_field.generate_filename(None, filename), image))
+                    saved.append(names[-1])
+                if errors:
+                    results.append({'row': number, 'status': 'invalid', 'errors': errors})
+                else:
+                    results.append({'row': number, 'status': 'valid'})
+                    valid.append((serializer.validated_data, names))
+
+            if len(valid) < len(rows):
+                self.delete_unused(saved)
+                return self.stream(results, status.HTTP_400_BAD_REQUEST)
+            items = self.create_items(request.user, valid)
+        except Exception:
+            self.delete_unused(saved)
+            raise
+        created = [{'row': n, 'status': 'created', 'id': item.pk} for n, item in enumerate(items, 1)]
+        return self.stream(created, status.HTTP_201_CREATED)
+
+    def delete_unused(self, names):
+        # Identical files are stored once; keep any another row already uses.
+        for name in unreferenced(names):
+            default_storage.delete(name)
+
+    def create_items(self, owner, rows):
+        with transaction.atomic():
+            items = Item.objects.bulk_create([
+                Item(**{**data, 'owner': owner, 'points': calculate_points(data.get('condition', '')),
+                        'media_status': 'pending' if names else 'ready'})
+                for data, names in rows
+            ], batch_size=500)
+            ItemImage.objects.bulk_create([
+                ItemImage(item=item, image=name) for item, (_, names) in zip(items, rows) for name in names
+            ], batch_size=500)
+            enqueue_many('process_item_images', [item for item, (_, names) in zip(items, rows) if names])
+            # bulk_create sends no post_save, so invalidate cached listings,
+            # count the items, index them for matching and match them
+            # against saved searches here.
+            invalidate(CATALOG_SCOPE)
+            stats.add({owner.pk: {'listed_items': len(items)}})
+            transaction.on_commit(lambda: recommendations.index.refresh([item.pk for item in items]))
+            enqueue('match_saved_searches', item_ids=[item.pk for item in items])
+        return items
+
+    def stream(self, results, status_code):
+        lines = (json.dumps(result) + '\n' for result in results)
+        return StreamingHttpResponse(lines, content_type='application/x-ndjson', status=status_code)
 
 @api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
 @permission_classes([permissions.IsAuthenticated])
 def my_items(request):
-    items = Item.objects.filter(owner=request.user).order_by('-created_at')
+    items = item_list_queryset().filter(owner=request.user).order_by('-created_at')
     serializer = ItemSerializer(items, many=True)
     return Response(serializer.data)
 
 @api_view(['GET'])
 @permission_classes([])  # No authentication required
 def browse_items(request):
-    items = Item.objects.all().order_by('-created_at')
-    search = request.GET.get('search')
-    category = request.GET.get('category')
-    size = request.GET.get('size')
-    condition = request.GET.get('condition')
-    brand = request.GET.get('brand')
+    def render():
+        items = filter_items(item_list_queryset().order_by('-created_at'), request.GET)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(items, request)
+        if page is not None:
+            serializer = ItemSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+        serializer = ItemSerializer(items, many=True)
+        return Response(serializer.data)
+    with replica_reads():
+        return cached_response(request, CATALOG_SCOPE, listing_cache_params(request.GET), render)
 
-    if search:
-        from django.db.models import Q
-        items = items.filter(
-            Q(title__icontains=search) |
-            Q(description__icontains=search) |
-            Q(brand__icontains=search) |
-            Q(category__icontains=search) |
-            Q(tags__icontains=search)
+# NDJSON exports; see items/export.py. They share the list endpoints'
+# querysets and filters but are never paginated or cached.
+
+@api_view(['GET'])
+@permission_classes([])  # No authentication required
+def export_items(request):
+    items = filter_items(item_list_queryset().order_by('-created_at', '-id'), request.GET)
+    with replica_reads():
+        # The body is read after the view returns, so pin the alias now.
+        items = items.using(router.db_for_read(Item))
+    return export_response(request, items, ItemSerializer, 'items.ndjson')
+
+@api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
+@permission_classes([permissions.IsAuthenticated])
+def export_my_items(request):
+    items = item_list_queryset().filter(owner=request.user).order_by('-created_at', '-id')
+    return export_response(request, items, ItemSerializer, 'my-items.ndjson')
+
+@api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
+@permission_classes([permissions.IsAuthenticated])
+def export_swaps(request):
+    user = request.user
+    swaps = Swap.objects.filter(
+        models.Q(proposer=user) | models.Q(receiver=user)
+    ).select_related(
+        'proposer_item', 'receiver_item'
+    ).prefetch_related(
+        'proposer_item__images', 'receiver_item__images'
+    ).order_by('-created_at', '-id')
+    return export_response(request, swaps, SwapSerializer, 'swaps.ndjson')
+
+FACET_FIELDS = ['category', 'size', 'condition', 'brand']
+FACET_CACHE_TTL = 30  # seconds
+
+def normalized_filters(params):
+    """Canonical form of the browse filters, so equivalent queries share a cache key."""
+    def split(value):
+        return tuple(sorted({v.strip() for v in (value or '').split(',') if v.strip()}))
+    category = params.get('category') or ''
+    brand = params.get('brand') or ''
+    return (
+        ('search', ' '.join(tokenize(params.get('search') or ''))),
+        ('category', '' if category == 'All Categories' else category.lower()),
+        ('size', split(params.get('size'))),
+        ('condition', split(params.get('condition'))),
+        ('brand', '' if brand == 'All Brands' else brand.lower()),
+    )
+
+def listing_cache_params(params):
+    return normalized_filters(params) + (
+        ('cursor', params.get('cursor') or ''),
+        ('page_size', params.get('page_size') or ''),
+    )
+
+def facet_counts(params):
+    """Per-value counts for every facet in one UNION ALL of grouped aggregates.
+
+    Each facet is counted under all the other filters but not its own, so the
+    UI can show how many items each alternative value would return.
+    """
+    parts = []
+    for field in FACET_FIELDS:
+        others = {key: value for key, value in params.items() if key != field}
+        parts.append(
+            filter_items(Item.objects.all(), others)
+            .order_by()
+            .exclude(**{field: ''})
+            .annotate(facet=models.Value(field), value=models.F(field))
+            .values('facet', 'value')
+            .annotate(count=models.Count('pk'))
         )
-    if category and category != 'All Categories':
-        items = items.filter(category__iexact=category)
-    if size:
-        size_list = [s.strip() for s in size.split(',') if s.strip()]
-        if size_list:
-            items = items.filter(size__in=size_list)
-    if condition:
-        cond_list = [c.strip() for c in condition.split(',') if c.strip()]
-        if cond_list:
-            items = items.filter(condition__in=cond_list)
-    if brand and brand != 'All Brands':
-        items = items.filter(brand__iexact=brand)
+    counts = {field: {} for field in FACET_FIELDS}
+    for row in parts[0].union(*parts[1:], all=True):
+        counts[row['facet']][row['value']] = row['count']
+    return counts
 
-    serializer = ItemSerializer(items, many=True)
-    return Response(serializer.data)
+@api_view(['GET'])
+@permission_classes([])  # No authentication required
+def item_facets(request):
+    filters = normalized_filters(request.GET)
+    key = 'item-facets:' + hashlib.sha1(repr((get_version(CATALOG_SCOPE), filters)).encode()).hexdigest()
+    counts = cache.get(key)
+    if counts is None:
+        params = {name: ','.join(value) if isinstance(value, tuple) else value for name, value in filters}
+        with replica_reads(), fill_reads(CATALOG_SCOPE):
+            counts = facet_counts(params)
+        cache.set(key, counts, FACET_CACHE_TTL)
+    return Response(counts)
 
 class MyItemDetailView(generics.RetrieveAPIView):
     serializer_class = ItemSerializer
@@ -148,9 +378,13 @@ class MyItemDetailView(generics.RetrieveAPIView):
 
 class PublicItemDetailView(generics.RetrieveAPIView):
     serializer_class = ItemSerializer
-    queryset = Item.objects.all()
+    queryset = item_list_queryset()
     permission_classes = []  # No authentication required
 
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(request, item_scope(kwargs['pk']), (),
+                               partial(super().retrieve, request, *args, **kwargs))
+
 class SwapSerializer(serializers.ModelSerializer):
     proposer_item = serializers.PrimaryKeyRelatedField(queryset=Item.objects.all(), write_only=True)
     receiver_item = serializers.PrimaryKeyRelatedField(queryset=Item.objects.all(), write_only=True)
@@ -161,27 +395,262 @@ class SwapSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ['proposer']
 
-    def to_representation(self, instance):
-        rep = super().to_representation(instance)
-        rep['proposer_item_detail'] = ItemSerializer(instance.proposer_item, context=self.context).data if instance.proposer_item else None
-        rep['receiver_item_detail'] = ItemSerializer(instance.receiver_item, context=self.context).data if instance.receiver_item else None
-        return rep
+    def validate_status(self, value):
+        # Completing settles points (see items.ledger), so it needs an accepted swap.
+        current = self.instance.status if self.instance else None
+        if value == 'completed' and current not in [*Swap.ACCEPTED_STATUSES, 'completed']:
+            raise serializers.ValidationError('Only an accepted swap can be completed.')
+        return value
+
+    def validate(self, attrs):
+        if self.instance:
+            changed = [
+                field for field in ('receiver', 'proposer_item', 'receiver_item')
+                if field in attrs and attrs[field] != getattr(self.instance, field)
+            ]
+            if changed:
+                raise serializers.ValidationError({field: 'Cannot be changed once proposed.' for field in changed})
+        return attrs
 
 class AvailableItemsView(APIView):
+    # Reads are served from token claims; see signup.authentication.
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
     def get(self, request):
-        user = request.user
-        # Items not in a pending/active swap as proposer or receiver
-        active_swaps = Swap.objects.filter(
-            models.Q(status__in=['pending', 'accepted', 'meetup_pending', 'awaiting_response']) &
-            (models.Q(proposer_item=models.OuterRef('pk')) | models.Q(receiver_item=models.OuterRef('pk')))
-        )
-        items = Item.objects.filter(owner=user).annotate(
-            in_swap=models.Exists(active_swaps)
-        ).filter(in_swap=False)
+        # Items not in a pending/active swap as proposer or receiver; see items.availability.
+        items = item_list_queryset().filter(owner=request.user, active_swap_count=0)
         serializer = ItemSerializer(items, many=True)
         return Response(serializer.data)
 
+# Swap-match recommendations; see items/recommendations.py.
+MATCH_LIMIT = 10
+MAX_MATCH_LIMIT = 100
+
+def match_limit(request):
+    try:
+        k = int(request.query_params.get('k', MATCH_LIMIT))
+    except (TypeError, ValueError):
+        k = MATCH_LIMIT
+    return max(1, min(k, MAX_MATCH_LIMIT))
+
+def scored_items(request, matches, items):
+    """Serialize ``items`` (already filtered to what may be shown) in ``matches`` order, with scores."""
+    by_id = {item.pk: item for item in items.filter(pk__in=[pk for pk, _ in matches])}
+    ranked = [(by_id[pk], score) for pk, score in matches if pk in by_id]
+    data = ItemSerializer([item for item, _ in ranked], many=True, context={'request': request}).data
+    for row, (_, score) in zip(data, ranked):
+        row['match_score'] = round(score, 3)
+    return data
+
+@api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
+@permission_classes([permissions.IsAuthenticated])
+def item_matches(request, pk):
+    """The requester's available items, best swap match for item ``pk`` first.
+
+    ``?k=all`` ranks every available item, as the swap dialog lists them all.
+    """
+    if not Item.objects.filter(pk=pk).exists():
+        return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    mine = item_list_queryset().filter(owner=request.user, active_swap_count=0).exclude(pk=pk)
+    candidate_ids = list(mine.values_list('pk', flat=True))
+    k = len(candidate_ids) if request.query_params.get('k') == 'all' else match_limit(request)
+    matches = recommendations.index.matches_for_item(pk, candidate_ids, k)
+    return Response(scored_items(request, matches, mine))
+
+@api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
+@permission_classes([permissions.IsAuthenticated])
+def recommended_items(request):
+    """Available catalog items that best match anything in the requester's wardrobe."""
+    k = match_limit(request)
+    wardrobe = list(Item.objects.filter(owner=request.user, active_swap_count=0).values_list('pk', flat=True))
+    # Over-fetch: rows that changed in another process are dropped by the query below.
+    matches = recommendations.index.matches_for_wardrobe(request.user.pk, wardrobe, k * 2)
+    catalog = item_list_queryset().filter(active_swap_count=0).exclude(owner=request.user)
+    return Response(scored_items(request, matches, catalog)[:k])
+
+# Multi-party trade cycles; see items/trades.py.
+class TradeCycleLegSerializer(serializers.ModelSerializer):
+    user = serializers.IntegerField(source='swap.proposer_id', read_only=True)
+    user_name = serializers.CharField(source='swap.proposer.full_name', read_only=True)
+    gives = ItemSerializer(source='swap.proposer_item', read_only=True)
+    receives = ItemSerializer(source='swap.receiver_item', read_only=True)
+    class Meta:
+        model = TradeCycleLeg
+        fields = ['position', 'swap', 'user', 'user_name', 'gives', 'receives', 'accepted']
+
+class TradeCycleSerializer(serializers.ModelSerializer):
+    legs = TradeCycleLegSerializer(many=True, read_only=True)
+    class Meta:
+        model = TradeCycle
+        fields = ['id', 'status', 'legs', 'created_at', 'updated_at']
+
+def participant_cycles(user):
+    """Cycles with a leg proposed by ``user``, with every leg's swap, users, items and images loaded."""
+    legs = TradeCycleLeg.objects.select_related(
+        'swap__proposer', 'swap__proposer_item__owner', 'swap__receiver_item__owner',
+    ).prefetch_related('swap__proposer_item__images', 'swap__receiver_item__images')
+    mine = TradeCycleLeg.objects.filter(swap__proposer=user).values('cycle')
+    return TradeCycle.objects.filter(pk__in=mine).prefetch_related(models.Prefetch('legs', queryset=legs))
+
+@api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
+@permission_classes([permissions.IsAuthenticated])
+def trade_cycles(request):
+    """Ring trades the requester is part of; proposed ones unless ``?status=`` says otherwise."""
+    cycles = participant_cycles(request.user).filter(status=request.query_params.get('status', 'proposed'))
+    serializer = TradeCycleSerializer(cycles.order_by('-created_at'), many=True, context={'request': request})
+    return Response(serializer.data)
+
+def respond_to_cycle(request, pk, action):
+    cycle = participant_cycles(request.user).filter(pk=pk).first()
+    if cycle is None:
+        return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    try:
+        action(cycle, request.user)
+    except trades.TradeCycleClosed:
+        return Response({'detail': 'This trade cycle is no longer open.'}, status=status.HTTP_409_CONFLICT)
+    cycle = participant_cycles(request.user).get(pk=pk)
+    return Response(TradeCycleSerializer(cycle, context={'request': request}).data)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def accept_trade_cycle(request, pk):
+    """Accept a ring; it goes through, as one trade, once all participants have."""
+    return respond_to_cycle(request, pk, trades.accept)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def decline_trade_cycle(request, pk):
+    return respond_to_cycle(request, pk, trades.decline)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def complete_trade_cycle(request, pk):
+    """Complete an accepted ring once its items have changed hands; settles everyone's points."""
+    return respond_to_cycle(request, pk, trades.complete)
+
+# Points ledger; see items/ledger.py.
+class PointsTransactionSerializer(serializers.ModelSerializer):
+    item_title = serializers.CharField(source='item.title', read_only=True, default=None)
+    class Meta:
+        model = PointsTransaction
+        fields = ['id', 'amount', 'kind', 'swap', 'item', 'item_title', 'created_at']
+
+class PointsView(generics.ListAPIView):
+    """The requester's points balance and latest transactions.
+
+    ``?cursor=`` or ``?page_size=`` page through the whole ledger, newest first.
+    """
+    serializer_class = PointsTransactionSerializer
+    # Reads are served from token claims; see signup.authentication.
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        return PointsTransaction.objects.filter(user=self.request.user).select_related('item').order_by('-created_at', '-id')
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        transactions = list(queryset[:self.paginator.page_size]) if page is None else page
+        data = {
+            'balance': ledger.balance(request.user),
+            'transactions': self.get_serializer(transactions, many=True).data,
+        }
+        if page is not None:
+            data['next'] = self.paginator.get_next_link()
+            data['next_cursor'] = self.paginator.next_cursor
+        return Response(data)
+
+@api_view(['GET'])
+@authentication_classes([ClaimsJWTAuthentication])
+@permission_classes([permissions.IsAuthenticated])
+def my_stats(request):
+    """Dashboard counters and points for the requester; see items/stats.py."""
+    row = stats.for_user(request.user)
+    return Response({name: getattr(row, name) for name in (*stats.COUNTERS, 'points')})
+
+# Saved searches and their new-item notifications; see items/saved_searches.py.
+class SavedSearchSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SavedSearch
+        fields = ['id', 'name', 'search', 'category', 'size', 'condition', 'brand', 'created_at']
+        read_only_fields = ['id', 'created_at']
+
+    def validate(self, data):
+        values = {field: data.get(field, getattr(self.instance, field, '')) for field in saved_searches.FILTER_FIELDS}
+        if not any(saved_searches.criteria(**values).values()):
+            raise serializers.ValidationError('A saved search needs at least one filter.')
+        return data
+
+class SavedSearchListCreateView(generics.ListCreateAPIView):
+    serializer_class = SavedSearchSerializer
+    # Reads are served from token claims; see signup.authentication.
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return SavedSearch.objects.filter(user=self.request.user).order_by('-created_at', '-id')
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+class SavedSearchDetailView(generics.RetrieveUpdateDestroyAPIView):
+    serializer_class = SavedSearchSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return SavedSearch.objects.filter(user=self.request.user)
+
+class SearchNotificationSerializer(serializers.ModelSerializer):
+    saved_search_name = serializers.CharField(source='saved_search.name', read_only=True)
+    item = ItemSerializer(read_only=True)
+    class Meta:
+        model = SearchNotification
+        fields = ['id', 'saved_search', 'saved_search_name', 'item', 'is_read', 'created_at']
+
+class SearchNotificationListView(generics.ListAPIView):
+    """New items that matched the requester's saved searches, newest first, with the unread count."""
+    serializer_class = SearchNotificationSerializer
+    authentication_classes = [ClaimsJWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        notifications = SearchNotification.objects.filter(user=self.request.user)
+        if 'unread' in self.request.query_params:
+            notifications = notifications.filter(is_read=False)
+        return notifications.select_related('saved_search', 'item__owner').prefetch_related(
+            'item__images'
+        ).order_by('-created_at', '-id')
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        page = self.paginate_queryset(queryset)
+        data = {
+            'notifications': self.get_serializer(list(queryset) if page is None else page, many=True).data,
+            'unread_count': SearchNotification.objects.filter(user=request.user, is_read=False).count(),
+        }
+        if page is not None:
+            data['next'] = self.paginator.get_next_link()
+            data['next_cursor'] = self.paginator.next_cursor
+        return Response(data)
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def read_search_notifications(request):
+    """Mark the requester's notifications read: those listed in ``ids``, or all of them."""
+    notifications = SearchNotification.objects.filter(user=request.user, is_read=False)
+    ids = request.data.get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+            return Response({'ids': ['Expected a list of notification ids.']}, status=status.HTTP_400_BAD_REQUEST)
+        notifications = notifications.filter(pk__in=ids)
+    return Response({'updated': notifications.update(is_read=True)})
+
 class SwapMessageSerializer(serializers.ModelSerializer):
     sender_name = serializers.CharField(source='sender.full_name', read_only=True)
     class Meta:
@@ -189,36 +658,109 @@ class SwapMessageSerializer(serializers.ModelSerializer):
         fields = ['id', 'swap', 'sender', 'sender_name', 'content', 'created_at']
         read_only_fields = ['id', 'swap', 'sender', 'sender_name', 'created_at']
 
+MAX_LONG_POLL_SECONDS = 25
+LONG_POLL_RECHECK_SECONDS = 1
+
 class SwapMessageListCreateView(generics.ListCreateAPIView):
+    """Message history for a swap.
+
+    ``?after_id=<id>`` or ``?since=<ISO timestamp>`` return only newer
+    messages. Adding ``&wait=<seconds>`` long-polls: an empty result is held
+    until a message arrives or the wait (capped at 25s) runs out.
+    """
     serializer_class = SwapMessageSerializer
+    # Reads are served from token claims; see signup.authentication.
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+
     def get_queryset(self):
         swap_id = self.kwargs['swap_id']
-        return SwapMessage.objects.filter(swap_id=swap_id).order_by('created_at')
+        messages = SwapMessage.objects.filter(swap_id=swap_id).select_related('sender')
+        after_id = self.request.GET.get('after_id')
+        since = self.request.GET.get('since')
+        if after_id:
+            try:
+                messages = messages.filter(pk__gt=int(after_id))
+            except ValueError:
+                raise serializers.ValidationError({'after_id': 'Must be an integer.'})
+        if since:
+            try:
+                since_dt = parse_datetime(since)
+            except ValueError:
+                # Well formed but out of range, e.g. month 13.
+                since_dt = None
+            if since_dt is None:
+                raise serializers.ValidationError({'since': 'Must be an ISO 8601 timestamp.'})
+            messages = messages.filter(created_at__gt=since_dt)
+        return messages.order_by('created_at', 'id')
+
+    def get_wait(self):
+        if not (self.request.GET.get('after_id') or self.request.GET.get('since')):
+            return 0
+        try:
+            return max(0, min(float(self.request.GET.get('wait') or 0), MAX_LONG_POLL_SECONDS))
+        except ValueError:
+            raise serializers.ValidationError({'wait': 'Must be a number of seconds.'})
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.get_queryset()
+        deadline = time.monotonic() + self.get_wait()
+        messages = list(queryset)
+        while not messages and time.monotonic() < deadline:
+            remaining = deadline - time.monotonic()
+            message_waiters.wait(self.kwargs['swap_id'], min(remaining, LONG_POLL_RECHECK_SECONDS))
+            messages = list(queryset.all())
+        serializer = self.get_serializer(messages, many=True)
+        return Response(serializer.data)
+
     def perform_create(self, serializer):
         swap_id = self.kwargs['swap_id']
         serializer.save(sender=self.request.user, swap_id=swap_id)
 
+def prefetch_swap_images(swaps):
+    """Load images for both items of every swap in a single query."""
+    items = [item for swap in swaps for item in (swap.proposer_item, swap.receiver_item)]
+    models.prefetch_related_objects(items, 'images')
+
 # Update SwapListCreateView to include unread count
 class SwapListCreateView(generics.ListCreateAPIView):
     serializer_class = SwapSerializer
+    # Reads are served from token claims; see signup.authentication.
+    authentication_classes = [ClaimsJWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         user = self.request.user
+        # The counter from items.stats: an uncorrelated primary-key lookup,
+        # evaluated once per statement, not per row.
+        unread = UserStats.objects.filter(pk=user.pk).values('unread_swaps')
         return Swap.objects.filter(
             models.Q(proposer=user) | models.Q(receiver=user)
+        ).select_related(
+            'proposer', 'receiver', 'proposer_item', 'receiver_item'
+        ).annotate(
+            unread_count=models.Subquery(unread)
         ).order_by('-created_at')
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
-        unread_count = queryset.filter(receiver=request.user, is_read=False).count()
-        response = super().list(request, *args, **kwargs)
-        response.data = {
-            'swaps': response.data,
+        page = self.paginate_queryset(queryset)
+        swaps = list(queryset) if page is None else page
+        prefetch_swap_images(swaps)
+        if swaps and swaps[0].unread_count is not None:
+            unread_count = swaps[0].unread_count
+        else:
+            # No row to carry the annotation (past the last page), or no stats row yet.
+            unread_count = stats.for_user(request.user).unread_swaps
+        data = {
+            'swaps': self.get_serializer(swaps, many=True).data,
             'unread_count': unread_count
         }
-        return response
+        if page is not None:
+            data['next'] = self.paginator.get_next_link()
+            data['next_cursor'] = self.paginator.next_cursor
+        return Response(data)
 
     def perform_create(self, serializer):
         # Set is_read=False for receiver
@@ -227,9 +769,13 @@ class SwapListCreateView(generics.ListCreateAPIView):
 class SwapUpdateView(generics.UpdateAPIView):
     serializer_class = SwapSerializer
     permission_classes = [permissions.IsAuthenticated]
-    queryset = Swap.objects.all()
     lookup_field = 'pk'
 
+    def get_queryset(self):
+        # Only the swap's parties may change it; anyone else gets a 404.
+        user = self.request.user
+        return Swap.objects.filter(models.Q(proposer=user) | models.Q(receiver=user))
+
 class SwapDeleteView(generics.DestroyAPIView):
     serializer_class = SwapSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -5,3 +5,11 @@ class SignupConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'signup'
     verbose_name = 'Signup'
+
+    def ready(self):
+        from django.contrib.auth import get_user_model
+        from django.db.models.signals import post_delete, post_save
+        from .authentication import forget_user_state
+        User = get_user_model()
+        post_save.connect(forget_user_state, sender=User, dispatch_uid='auth-user-state-save')
+        post_delete.connect(forget_user_state, sender=User, dispatch_uid='auth-user-state-delete')
@@ -0,0 +1,78 @@
+"""JWT authentication that skips the per-request User lookup on reads.
+
+Access tokens from CustomTokenObtainPairSerializer carry ``email``,
+``full_name`` and ``username`` claims. For safe (read-only) requests,
+ClaimsJWTAuthentication builds the User from those claims, and any other
+field is deferred and loaded on first access. The checks the stock
+authentication makes against the row (active flag and, with
+SIMPLE_JWT['CHECK_REVOKE_TOKEN'], the password fingerprint) are answered
+from a per-user cache entry. The entry lives USER_STATE_CACHE_TTL seconds and
+is dropped whenever the user is saved or deleted.
+
+Unsafe methods, and tokens without the claims, fall back to the normal lookup.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework import permissions
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+USER_STATE_CACHE_TTL = 60  # seconds
+CLAIM_FIELDS = ('email', 'full_name', 'username')
+
+
+def user_state_key(user_id):
+    return f'auth:user-state:{user_id}'
+
+
+def get_user_state(user_id):
+    """(is_active, password fingerprint) for a user id, or None if it does not exist."""
+    key = user_state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        row = get_user_model().objects.filter(pk=user_id).values_list('is_active', 'password').first()
+        state = (row[0], get_md5_hash_password(row[1])) if row else ()
+        cache.set(key, state, USER_STATE_CACHE_TTL)
+    return state or None
+
+
+def forget_user_state(sender, instance, **kwargs):
+    """post_save/post_delete receiver: deactivation or a password change applies at once."""
+    cache.delete(user_state_key(instance.pk))
+
+
+def user_from_claims(user_id, claims):
+    # from_db() leaves every field not listed deferred, so reading one queries
+    # the row and an accidental save() only writes the fields set here.
+    User = get_user_model()
+    values = {'id': User._meta.pk.to_python(user_id), 'is_active': True, **claims}
+    fields = [f for f in User._meta.concrete_fields if f.attname in values]
+    return User.from_db(None, [f.attname for f in fields], [values[f.attname] for f in fields])
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def authenticate(self, request):
+        self.use_claims = request.method in permissions.SAFE_METHODS
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        claims = {name: validated_token.get(name) for name in CLAIM_FIELDS}
+        if not getattr(self, 'use_claims', False) or None in claims.values():
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        state = get_user_state(user_id)
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        is_active, password_hash = state
+        if api_settings.CHECK_USER_IS_ACTIVE and not is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != password_hash:
+            raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+        return user_from_claims(user_id, claims)
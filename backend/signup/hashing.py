@@ -0,0 +1,74 @@
+"""Password hashing off the event loop, on a bounded thread pool.
+
+PBKDF2 (hashlib) and Argon2 (argon2-cffi) release the GIL while hashing, so
+a thread pool spreads the work across cores without a process pool's
+pickling and startup costs. The async login and register views await the
+pool, which leaves the event loop free for other requests while a hash runs.
+
+Settings (all optional):
+
+* ``PASSWORD_HASHING_WORKERS``: pool size, default the number of CPUs.
+* ``PASSWORD_HASHING_MAX_PENDING``: hashes running or queued before new ones
+  are refused with HashingBusy (answered as 503), default 256. This bounds
+  how long a login burst can queue.
+"""
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class HashingPool:
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'PASSWORD_HASHING_WORKERS', None) or os.cpu_count() or 2,
+                    thread_name_prefix='password-hashing',
+                )
+            return self._executor
+
+    async def run(self, func, *args):
+        with self._lock:
+            if self._pending >= getattr(settings, 'PASSWORD_HASHING_MAX_PENDING', 256):
+                raise HashingBusy
+            self._pending += 1
+        try:
+            return await asyncio.wrap_future(self.executor.submit(func, *args))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+pool = HashingPool()
+
+
+def verify(password, encoded):
+    """check_password() that reports, rather than performs, a needed rehash.
+
+    Returns (is_correct, must_update). The caller saves the new hash, so the
+    pool threads never touch the database.
+    """
+    upgrades = []
+    return check_password(password, encoded, setter=upgrades.append), bool(upgrades)
+
+
+async def ahash(password):
+    return await pool.run(make_password, password)
+
+
+async def averify(password, encoded):
+    return await pool.run(verify, password, encoded)
@@ -1,3 +1,155 @@
+import importlib.util
+from unittest import skipUnless
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .authentication import ClaimsJWTAuthentication
+from .models import User
+from .views import CustomTokenObtainPairSerializer
+
+
+class ClaimsJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='ada@example.com', username='ada@example.com', full_name='Ada')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access_token()}')
+
+    def access_token(self):
+        return str(CustomTokenObtainPairSerializer.get_token(self.user).access_token)
+
+    def get(self, path):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(path)
+        return response, len(ctx.captured_queries)
+
+    def test_reads_are_served_from_claims(self):
+        response, queries = self.get('/api/user/')
+        self.assertEqual(response.json(), {
+            'id': self.user.pk, 'email': 'ada@example.com', 'full_name': 'Ada', 'username': 'ada@example.com',
+        })
+        self.assertEqual(queries, 1)  # the active-state cache miss
+        _, queries = self.get('/api/user/')
+        self.assertEqual(queries, 0)
+        _, queries = self.get('/api/my-items/')
+        self.assertEqual(queries, 1)  # just the items
+
+    def test_deactivation_applies_immediately(self):
+        self.get('/api/user/')
+        self.user.is_active = False
+        self.user.save()
+        response, _ = self.get('/api/user/')
+        self.assertEqual(response.status_code, 401)
+        self.user.delete()
+        response, _ = self.get('/api/user/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_tokens_without_claims_use_the_database(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        response, queries = self.get('/api/user/')
+        self.assertEqual(response.json()['full_name'], 'Ada')
+        self.assertEqual(queries, 1)
+        _, queries = self.get('/api/user/')
+        self.assertEqual(queries, 1)
+
+    def test_unsafe_methods_load_the_full_user(self):
+        factory = APIRequestFactory()
+        header = {'HTTP_AUTHORIZATION': f'Bearer {self.access_token()}'}
+        user, _ = ClaimsJWTAuthentication().authenticate(factory.get('/', **header))
+        self.assertEqual(user.get_deferred_fields(), {f.attname for f in User._meta.concrete_fields} - {
+            'id', 'email', 'full_name', 'username', 'is_active',
+        })
+        # Deferred fields load from the row on access.
+        self.assertEqual(user.date_joined, self.user.date_joined)
+        user, _ = ClaimsJWTAuthentication().authenticate(factory.post('/', **header))
+        self.assertEqual(user.get_deferred_fields(), set())
+
+    def test_register_issues_tokens_with_claims(self):
+        response = APIClient().post('/api/register/', {
+            'full_name': 'Grace', 'email': 'grace@example.com', 'password': 'x-Strong-pass-1',
+            'confirm_password': 'x-Strong-pass-1', 'terms': True,
+        }, format='json')
+        token = AccessToken(response.json()['access'])
+        self.assertEqual((token['email'], token['full_name']), ('grace@example.com', 'Grace'))
+
+
+# Cheap hashers keep these tests fast; the second entry is an "old" hasher
+# whose hashes get upgraded on login.
+@override_settings(PASSWORD_HASHERS=[
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+])
+class AsyncLoginTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(
+            email='ada@example.com', username='ada@example.com', full_name='Ada', password=make_password('pw-123456'),
+        )
+
+    def post(self, path, data):
+        return APIClient().post(path, data, format='json')
+
+    def test_login_returns_tokens(self):
+        response = self.post('/api/login/', {'email': 'ada@example.com', 'password': 'pw-123456'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['user'], {'id': self.user.pk, 'email': 'ada@example.com', 'full_name': 'Ada'})
+        self.assertEqual(AccessToken(data['access'])['full_name'], 'Ada')
+
+    def test_login_rejects_bad_credentials(self):
+        for data in [{'email': 'ada@example.com', 'password': 'wrong'}, {'email': 'nobody@example.com', 'password': 'x'}]:
+            response = self.post('/api/login/', data)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response.json()['detail'], 'No active account found with the given credentials')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.post('/api/login/', {'email': 'ada@example.com', 'password': 'pw-123456'}).status_code, 401)
+        self.assertEqual(self.post('/api/login/', {'email': 'ada@example.com'}).json(), {'password': ['This field is required.']})
+        self.assertEqual(APIClient().get('/api/login/').status_code, 405)
+
+    def test_login_upgrades_old_hashes(self):
+        self.user.password = make_password('pw-123456', hasher='pbkdf2_sha1')
+        self.user.save()
+        self.assertEqual(self.post('/api/login/', {'email': 'ada@example.com', 'password': 'pw-123456'}).status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('md5$'))
+
+    def test_register(self):
+        data = {'full_name': 'Grace', 'email': 'grace@example.com', 'password': 'pw-654321',
+                'confirm_password': 'pw-654321', 'terms': True}
+        response = self.post('/api/register/', data)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(User.objects.get(email='grace@example.com').check_password('pw-654321'))
+        self.assertEqual(self.post('/api/register/', data).json(), {'error': 'Email already registered.'})
+        self.assertEqual(self.post('/api/register/', {**data, 'confirm_password': 'x'}).json(), {'error': 'Passwords do not match.'})
+
+    def test_non_string_fields_are_400(self):
+        response = self.post('/api/login/', {'email': 'ada@example.com', 'password': 123})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'password': ['Not a valid string.']})
+        self.assertEqual(self.post('/api/login/', {'email': ['ada@example.com'], 'password': 'pw'}).status_code, 400)
+        data = {'full_name': 'Grace', 'email': 'grace@example.com', 'password': 123456,
+                'confirm_password': 123456, 'terms': True}
+        response = self.post('/api/register/', data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'password', 'confirm_password'})
+        self.assertFalse(User.objects.filter(email='grace@example.com').exists())
+
+    @override_settings(PASSWORD_HASHING_MAX_PENDING=0)
+    def test_busy_pool_answers_503(self):
+        response = self.post('/api/login/', {'email': 'ada@example.com', 'password': 'pw-123456'})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
 
-# Create your tests here.
+    @skipUnless(importlib.util.find_spec('argon2'), 'argon2-cffi is not installed')
+    def test_argon2_hasher(self):
+        with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.Argon2PasswordHasher',
+                                                 'django.contrib.auth.hashers.MD5PasswordHasher']):
+            self.post('/api/login/', {'email': 'ada@example.com', 'password': 'pw-123456'})
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('argon2$'))
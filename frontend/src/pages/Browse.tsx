@@ -16,9 +16,13 @@ import {
   Star,
   MapPin,
   SlidersHorizontal,
+  Bell,
   X
 } from 'lucide-react';
 import { Link } from 'react-router-dom';
+import { fetchWithAuth } from '@/lib/utils';
+
+const PAGE_SIZE = 24;
 
 const Browse = () => {
   const [viewMode, setViewMode] = useState<'grid' | 'list'>('grid');
@@ -29,12 +33,16 @@ const Browse = () => {
   const [selectedConditions, setSelectedConditions] = useState<string[]>([]);
   const [brand, setBrand] = useState('All Brands');
   const [items, setItems] = useState<any[]>([]);
+  const [nextPage, setNextPage] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
+  const [saveMessage, setSaveMessage] = useState('');
 
   // Helper to build query string
   const buildQuery = () => {
     const params = new URLSearchParams();
+    params.append('page_size', String(PAGE_SIZE));
     if (searchQuery) params.append('search', searchQuery);
     if (category && category !== 'All Categories') params.append('category', category);
     if (selectedSizes.length > 0) params.append('size', selectedSizes.join(','));
@@ -51,7 +59,8 @@ const Browse = () => {
         const res = await fetch(`http://localhost:8000/api/items/${buildQuery()}`);
         if (res.ok) {
           const data = await res.json();
-          setItems(data);
+          setItems(data.results);
+          setNextPage(data.next);
         } else {
           setError('Failed to fetch items');
         }
@@ -64,6 +73,47 @@ const Browse = () => {
     fetchItems();
   }, [searchQuery, category, selectedSizes, selectedConditions, brand]);
 
+  // Save the current filters; new matching items then show up as notifications.
+  const saveSearch = async () => {
+    setSaveMessage('');
+    try {
+      const res = await fetchWithAuth('/api/saved-searches/', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          name: [searchQuery, category, brand].filter(v => v && !v.startsWith('All ')).join(' · ').slice(0, 100),
+          search: searchQuery,
+          category: category === 'All Categories' ? '' : category,
+          size: selectedSizes.join(','),
+          condition: selectedConditions.join(','),
+          brand: brand === 'All Brands' ? '' : brand,
+        }),
+      });
+      setSaveMessage(res.ok ? "Search saved. We'll let you know when new items match." : 'Choose at least one filter to save.');
+    } catch (err) {
+      setSaveMessage('Network error');
+    }
+  };
+
+  const loadMore = async () => {
+    if (!nextPage) return;
+    setLoadingMore(true);
+    try {
+      const res = await fetch(nextPage);
+      if (res.ok) {
+        const data = await res.json();
+        setItems(prev => [...prev, ...data.results]);
+        setNextPage(data.next);
+      } else {
+        setError('Failed to fetch items');
+      }
+    } catch (err) {
+      setError('Network error');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const categories = [
     'All Categories', 'Tops', 'Bottoms', 'Dresses', 'Jackets', 'Knitwear', 
     'Shoes', 'Accessories', 'Bags', 'Activewear', 'Formal'
@@ -88,14 +138,21 @@ const Browse = () => {
     return photo.startsWith('http') ? photo : `http://localhost:8000${photo}`;
   };
 
+  // Resized WebP variant of the first image when the backend has generated one.
+  const getPreviewUrl = (item: any, size: 'thumb' | 'medium') => {
+    const variant = item.image_variants?.[0]?.[size]?.webp;
+    return getImageUrl(variant || item.images[0]);
+  };
+
   const ItemCard = ({ item }: { item: any }) => (
     <Card className="overflow-hidden hover:shadow-medium transition-all duration-300 group">
       <Link to={`/item/${item.id}`}>
         <div className="aspect-square overflow-hidden relative">
           {item.images && item.images.length > 0 ? (
             <img
-              src={item.images[0].startsWith('http') ? item.images[0] : `http://localhost:8000${item.images[0]}`}
+              src={getPreviewUrl(item, 'medium')}
               alt={item.title}
+              loading="lazy"
               className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300"
             />
           ) : (
@@ -151,8 +208,9 @@ const Browse = () => {
           <Link to={`/item/${item.id}`} className="flex-shrink-0">
             {item.images && item.images.length > 0 ? (
               <img
-                src={item.images[0].startsWith('http') ? item.images[0] : `http://localhost:8000${item.images[0]}`}
+                src={getPreviewUrl(item, 'thumb')}
                 alt={item.title}
+                loading="lazy"
                 className="w-24 h-24 object-cover rounded-md"
               />
             ) : (
@@ -326,6 +384,12 @@ const Browse = () => {
                 </Select>
               </div>
 
+              <Button variant="outline" className="w-full" onClick={saveSearch}>
+                <Bell className="mr-2 h-4 w-4" />
+                Save Search
+              </Button>
+              {saveMessage && <p className="text-sm text-muted-foreground">{saveMessage}</p>}
+
               <Button variant="outline" className="w-full">
                 <X className="mr-2 h-4 w-4" />
                 Clear Filters
@@ -383,11 +447,13 @@ const Browse = () => {
           )}
 
           {/* Load More */}
-          <div className="text-center mt-12">
-            <Button variant="outline" size="lg">
-              Load More Items
-            </Button>
-          </div>
+          {nextPage && (
+            <div className="text-center mt-12">
+              <Button variant="outline" size="lg" onClick={loadMore} disabled={loadingMore}>
+                {loadingMore ? 'Loading...' : 'Load More Items'}
+              </Button>
+            </div>
+          )}
         </div>
       </div>
     </div>
@@ -28,6 +28,7 @@ const Dashboard = () => {
   const [itemsLoading, setItemsLoading] = useState(true);
   const [swaps, setSwaps] = useState([]);
   const [unreadCount, setUnreadCount] = useState(0);
+  const [stats, setStats] = useState<{ points: number; listed_items: number; completed_swaps: number } | null>(null);
   const [swapsLoading, setSwapsLoading] = useState(true);
   const [selectedSwap, setSelectedSwap] = useState<any>(null);
   const [swapMessages, setSwapMessages] = useState<any[]>([]);
@@ -100,6 +101,23 @@ const Dashboard = () => {
     fetchSwaps();
   }, [location]);
 
+  useEffect(() => {
+    // Counters kept by the backend, so the cards don't depend on the full lists.
+    const fetchStats = async () => {
+      try {
+        const res = await fetchWithAuth('/api/me/stats/');
+        if (res.ok) {
+          const data = await res.json();
+          setStats(data);
+          setUnreadCount(data.unread_swaps);
+        }
+      } catch {
+        setStats(null);
+      }
+    };
+    fetchStats();
+  }, [location]);
+
   const userStats = {
     points: 145,
     itemsListed: 12,
@@ -210,7 +228,7 @@ const Dashboard = () => {
             <div className="flex items-center justify-between">
               <div>
                 <p className="text-primary-foreground/80">ReWear Points</p>
-                <p className="text-3xl font-bold">{userStats.points}</p>
+                <p className="text-3xl font-bold">{stats ? stats.points : userStats.points}</p>
               </div>
               <Coins className="h-8 w-8" />
             </div>
@@ -222,7 +240,7 @@ const Dashboard = () => {
             <div className="flex items-center justify-between">
               <div>
                 <p className="text-muted-foreground">Items Listed</p>
-                <p className="text-3xl font-bold text-primary">{myItems.length}</p>
+                <p className="text-3xl font-bold text-primary">{stats ? stats.listed_items : myItems.length}</p>
               </div>
               <ShoppingBag className="h-8 w-8 text-primary" />
             </div>
@@ -234,7 +252,7 @@ const Dashboard = () => {
             <div className="flex items-center justify-between">
               <div>
                 <p className="text-muted-foreground">Successful Swaps</p>
-                <p className="text-3xl font-bold text-success">{successfulSwaps}</p>
+                <p className="text-3xl font-bold text-success">{stats ? stats.completed_swaps : successfulSwaps}</p>
               </div>
               <TrendingUp className="h-8 w-8 text-success" />
             </div>
@@ -418,10 +436,14 @@ const Dashboard = () => {
                         <>
                           <CheckCircle className="h-3 w-3 mr-1" /> Pending Meetup
                         </>
+                      ) : swap.status === 'in_cycle' ? (
+                        'In Trade Cycle'
                       ) : (
                         swap.status.charAt(0).toUpperCase() + swap.status.slice(1)
                       )}
                     </Badge>
+                    {/* Only an accepted swap can be completed; it settles points. */}
+                    {['accepted', 'meetup_pending', 'awaiting_response'].includes(swap.status) && (
                     <Button
                       variant="outline"
                       size="sm"
@@ -444,6 +466,7 @@ const Dashboard = () => {
                     >
                       {swap.status === 'awaiting_response' ? 'Follow Up' : swap.status === 'meetup_pending' ? 'Arrange Meetup' : 'Update'}
                     </Button>
+                    )}
                   </div>
                 </div>
               ))
@@ -108,9 +108,9 @@ const ItemDetail = () => {
     setShowSwapModal(true);
     setSwapMessage('');
     setSelectedMyItem(null);
-    // Fetch user's available items (not in active swaps)
+    // Fetch user's available items (not in active swaps), best match for this item first
     try {
-      const res = await fetchWithAuth('/api/available-items/');
+      const res = await fetchWithAuth(`/api/items/${item.id}/matches/?k=all`);
       if (res.ok) {
         setMyItems(await res.json());
       } else {
@@ -29,10 +29,10 @@ const Landing = () => {
       setLoading(true);
       setError('');
       try {
-        const res = await fetch('http://localhost:8000/api/items/');
+        const res = await fetch('http://localhost:8000/api/items/?page_size=4');
         if (res.ok) {
           const data = await res.json();
-          setFeaturedItems(data.slice(0, 4));
+          setFeaturedItems(data.results);
         } else {
           setError('Failed to fetch items');
         }
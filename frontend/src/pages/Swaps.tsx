@@ -40,39 +40,73 @@ const Swaps = () => {
     fetchSwaps();
   }, []);
 
-  const fetchMessages = async (swapId: number) => {
+  const fetchMessages = async (swapId: number): Promise<any[]> => {
     setMessageLoading(true);
     try {
       const res = await fetchWithAuth(`/api/swaps/${swapId}/messages/`);
-      if (res.ok) {
-        setSwapMessages(await res.json());
-      } else {
-        setSwapMessages([]);
-      }
+      const messages = res.ok ? await res.json() : [];
+      setSwapMessages(messages);
+      return messages;
     } catch {
       setSwapMessages([]);
+      return [];
     } finally {
       setMessageLoading(false);
     }
   };
 
-  // Polling for messages when modal is open
+  // Live updates while the modal is open: server-sent events when the backend
+  // runs under ASGI, falling back to polling if the stream is refused.
   useEffect(() => {
-    let interval: NodeJS.Timeout;
-    if (selectedSwap) {
-      fetchMessages(selectedSwap.id);
+    if (!selectedSwap) {
+      setPolling(false);
+      return;
+    }
+    const swapId = selectedSwap.id;
+    let cancelled = false;
+    let source: EventSource | null = null;
+    let interval: NodeJS.Timeout | undefined;
+
+    const startPolling = () => {
+      if (cancelled || interval) return;
       setPolling(true);
       interval = setInterval(() => {
-        fetchMessages(selectedSwap.id);
+        fetchMessages(swapId);
       }, 3000);
-    } else {
-      setPolling(false);
-    }
+    };
+
+    fetchMessages(swapId).then((messages) => {
+      if (cancelled) return;
+      const lastId = messages.length > 0 ? messages[messages.length - 1].id : 0;
+      const token = localStorage.getItem('access') || '';
+      source = new EventSource(
+        `/api/swaps/${swapId}/events/?token=${encodeURIComponent(token)}&after_id=${lastId}`
+      );
+      source.addEventListener('message', (e) => {
+        const message = JSON.parse((e as MessageEvent).data);
+        setSwapMessages(prev => prev.some(m => m.id === message.id) ? prev : [...prev, message]);
+      });
+      source.addEventListener('status', (e) => {
+        const { status } = JSON.parse((e as MessageEvent).data);
+        setSelectedSwap((prev: any) => prev && prev.id === swapId ? { ...prev, status } : prev);
+        setSwaps(prev => prev.map(s => s.id === swapId ? { ...s, status } : s));
+      });
+      source.addEventListener('deleted', () => {
+        source?.close();
+      });
+      source.onerror = () => {
+        if (source?.readyState === EventSource.CLOSED) startPolling();
+      };
+    });
+
     return () => {
+      cancelled = true;
+      source?.close();
       if (interval) clearInterval(interval);
+      setPolling(false);
     };
     // eslint-disable-next-line
-  }, [selectedSwap]);
+  }, [selectedSwap?.id]);
 
   // Auto-scroll to latest message
   useEffect(() => {
@@ -95,7 +129,7 @@ const Swaps = () => {
         body: JSON.stringify({ content: newMessage })
       });
       setNewMessage('');
-      // Message will be picked up by polling
+      // Message will arrive over the event stream (or polling)
     } finally {
       setMessageLoading(false);
     }